@@ -41,5 +41,8 @@ setup(
     scripts=[],
     description='Automated system for python-based experiments.',
     long_description=open('README.md').read(),
-    install_requires=install_requires
+    install_requires=install_requires,
+    extras_require={
+        'compression': ["lz4", "zstandard"] # Compressed plot data
+    }
 )
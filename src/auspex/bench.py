@@ -0,0 +1,331 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+"""End-to-end benchmarks of the filter pipeline.
+
+Each benchmark drives one of the canonical filter graphs from a
+:class:`SyntheticSource` that pushes records at a controlled rate, and reports
+the sustained throughput, the latency from a record being pushed to its result
+arriving at the end of the graph, and the CPU time and peak memory of each
+filter. Run them with::
+
+    python -m auspex.bench all --rate 1e5 --output bench.jsonl
+
+Results are appended to the output file as JSON lines, and compared with the
+previous result of the same benchmark with the same settings so that
+regressions are visible."""
+
+__all__ = ['SyntheticSource', 'LatencyProbe', 'bench_raw', 'bench_integrated', 'bench_correlator',
+           'benchmarks', 'save_results', 'previous_results']
+
+import os
+import json
+import inspect
+import time
+import argparse
+import platform
+import tempfile
+import threading
+
+import numpy as np
+
+from auspex.experiment import Experiment
+from auspex.parameter import FloatParameter
+from auspex.stream import DataAxis, InputConnector, OutputConnector
+from auspex.filters import Channelizer, KernelIntegrator, Averager, Correlator, WriteToFile, DataBuffer, Filter
+
+class SyntheticSource(Experiment):
+    """Pushes `points` frames of `averages` x `segments` records on each of its `channels`, at a
+    target rate of `rate` records per second per channel (as fast as possible if None).
+
+    Raw records have `record_length` samples at `sampling_rate`, carrying a 10 MHz tone in noise.
+    Integrated records (`integrated=True`) are single complex values. The time and cumulative
+    number of points of every push are kept in `push_log` for latency measurements."""
+
+    point = FloatParameter()
+
+    def __init__(self, channels=1, points=10, averages=16, segments=16, record_length=1024,
+                 sampling_rate=500e6, integrated=False, rate=None):
+        self.num_channels  = channels
+        self.points        = points
+        self.averages      = averages
+        self.segments      = segments
+        self.record_length = record_length
+        self.sampling_rate = sampling_rate
+        self.integrated    = integrated
+        self.rate          = rate
+        super(SyntheticSource, self).__init__()
+
+        # The number of channels is only known now, so add their connectors by hand
+        for i in range(channels):
+            name = "chan{}".format(i+1)
+            oc = OutputConnector(name=name, data_name=name, parent=self)
+            oc.parent = self
+            self.output_connectors[name] = oc
+            setattr(self, name, oc)
+            # Axes are added from the innermost out
+            if integrated:
+                oc.descriptor.dtype = np.complex128
+            else:
+                oc.add_axis(DataAxis("time", np.arange(record_length)/sampling_rate, unit="s"))
+                oc.descriptor.dtype = np.float32
+            oc.add_axis(DataAxis("segments", list(range(segments))))
+            oc.add_axis(DataAxis("averages", list(range(averages))))
+        self.add_sweep(self.point, np.arange(points, dtype=np.float64))
+
+        # One round robin of records, pushed over and over
+        rng = np.random.RandomState(0)
+        if integrated:
+            self.block = (np.linspace(0, 1, segments) + 0.1*(rng.randn(segments) + 1j*rng.randn(segments))).astype(np.complex128)
+        else:
+            t = np.arange(record_length)/sampling_rate
+            records = np.sin(2*np.pi*10e6*t)[None, :] + 0.1*rng.randn(segments, record_length)
+            self.block = records.astype(np.float32).ravel()
+
+        self.push_log   = []
+        self.pushed     = 0
+        self.start_time = None
+
+    def __repr__(self):
+        return "<SyntheticSource>"
+
+    def records_per_channel(self):
+        return self.points*self.averages*self.segments
+
+    def bytes_per_channel(self):
+        return self.points*self.averages*self.block.nbytes
+
+    def run(self):
+        if self.start_time is None:
+            self.start_time = time.time()
+        for _ in range(self.averages):
+            if self.rate:
+                # Hold back until the schedule allows these records
+                delay = self.start_time + self.pushed/self.rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            for oc in self.output_connectors.values():
+                oc.push(self.block)
+            self.pushed += self.segments
+            self.push_log.append((time.time(), self.pushed))
+
+class LatencyProbe(DataBuffer):
+    """Records when each message arrives, and how many points had arrived by then, instead of the data
+    itself. The log is returned through the DataBuffer machinery as its output data."""
+
+    sink = InputConnector()
+
+    def final_init(self):
+        self.descriptor = self.sink.input_streams[0].descriptor
+        self.arrivals   = []
+        self.received   = 0
+
+    def process_data(self, data):
+        self.received += data.size
+        self.arrivals.append((time.time(), self.received))
+
+    def main(self):
+        Filter.main(self)
+        self._final_buffer.put(np.array(self.arrivals, dtype=np.float64).reshape(-1, 2))
+
+    def get_data(self):
+        if self.final_buffer is None:
+            self.final_buffer = self._final_buffer.get()
+        return self.final_buffer, self.descriptor
+
+class ResourceMonitor(object):
+    """Samples the CPU time and resident memory of filter processes while they run."""
+
+    def __init__(self, filters, interval=0.05):
+        super(ResourceMonitor, self).__init__()
+        self.filters  = filters
+        self.interval = interval
+        self.stats    = {f.filter_name: {'cpu_seconds': 0.0, 'peak_rss_bytes': 0} for f in filters}
+        self.exit     = threading.Event()
+        self.thread   = threading.Thread(target=self.monitor, daemon=True)
+        self.procs    = {}
+        self.finished = set()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.exit.set()
+        self.thread.join()
+
+    def monitor(self):
+        while not self.exit.wait(self.interval):
+            self.sample()
+        # The last reading may be up to an interval old, so take a final one on the way out
+        self.sample()
+
+    def sample(self):
+        import psutil
+        for f in self.filters:
+            if f.filter_name in self.finished:
+                continue
+            pid = getattr(f, 'pid', None) # Threads, when not forking, have no process of their own
+            # A filter is joined soon after it is done, so read it one last time while it is still there
+            if f.done.is_set():
+                self.finished.add(f.filter_name)
+            try:
+                if pid is not None and f.filter_name not in self.procs:
+                    self.procs[f.filter_name] = psutil.Process(pid)
+                proc = self.procs.get(f.filter_name)
+                if proc is not None:
+                    times = proc.cpu_times()
+                    stats = self.stats[f.filter_name]
+                    stats['cpu_seconds']    = times.user + times.system
+                    stats['peak_rss_bytes'] = max(stats['peak_rss_bytes'], proc.memory_info().rss)
+            except psutil.Error:
+                pass
+
+def _percentiles(values):
+    if len(values) == 0:
+        return {}
+    stats = {"p{}".format(p): float(np.percentile(values, p)) for p in (50, 90, 99)}
+    stats["max"] = float(np.max(values))
+    return stats
+
+def _latencies(push_log, total_pushed, arrivals, total_arrived):
+    """Latency of each arrival, from when the source had pushed the same fraction of its data."""
+    push_log = np.array(push_log, dtype=np.float64).reshape(-1, 2)
+    sent     = push_log[:,1]/total_pushed
+    received = arrivals[:,1]/total_arrived
+    idx      = np.minimum(np.searchsorted(sent, received - 1e-12), len(sent) - 1)
+    return arrivals[:,0] - push_log[idx,0]
+
+def run_benchmark(name, source, filters, edges, probe, parameters):
+    """Run the graph and collect the results of a benchmark."""
+    source.set_graph(edges)
+    monitor = ResourceMonitor([f for f in filters if f is not probe])
+    monitor.start()
+    try:
+        source.run_sweeps()
+    finally:
+        monitor.stop()
+
+    arrivals, _ = probe.get_data()
+    push_log    = np.array(source.push_log)
+    start, end  = source.start_time, arrivals[-1,0]
+    records     = source.records_per_channel()*source.num_channels
+    nbytes      = source.bytes_per_channel()*source.num_channels
+    push_time   = push_log[-1,0] - start
+    latency     = _latencies(source.push_log, source.records_per_channel(), arrivals, probe.descriptor.num_points())
+
+    return {
+        'benchmark':  name,
+        'parameters': parameters,
+        'timestamp':  time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'host':       platform.node(),
+        'python':     platform.python_version(),
+        'numpy':      np.__version__,
+        'throughput': {
+            'records_per_second': records/(end - start),
+            'bytes_per_second':   nbytes/(end - start),
+            'source_records_per_second': records/push_time if push_time > 0 else float('inf'),
+            'elapsed_seconds':    end - start,
+            'drain_seconds':      end - push_log[-1,0],
+        },
+        'latency_seconds': _percentiles(latency),
+        'filters':    monitor.stats,
+    }
+
+def bench_raw(rate=None, points=10, averages=16, segments=16, record_length=1024, directory=None):
+    """Raw records through Channelizer, KernelIntegrator, Averager and WriteToFile."""
+    parameters = dict(rate=rate, points=points, averages=averages, segments=segments, record_length=record_length)
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        source = SyntheticSource(points=points, averages=averages, segments=segments, record_length=record_length, rate=rate)
+        demod  = Channelizer(frequency=10e6, bandwidth=5e6, decimation_factor=16, name="demod")
+        ki     = KernelIntegrator(simple_kernel=True, box_car_start=0, box_car_stop=1e-6, name="ki")
+        avg    = Averager("averages", name="avg")
+        wr     = WriteToFile(os.path.join(tmpdir, "bench.auspex"), name="write")
+        probe  = LatencyProbe(name="probe")
+        edges  = [(source.chan1, demod.sink), (demod.source, ki.sink), (ki.source, avg.sink),
+                  (avg.source, wr.sink), (avg.source, probe.sink)]
+        return run_benchmark("raw", source, [demod, ki, avg, wr, probe], edges, probe, parameters)
+
+def bench_integrated(rate=None, points=10, averages=64, segments=64):
+    """Integrated records through an Averager into a DataBuffer."""
+    parameters = dict(rate=rate, points=points, averages=averages, segments=segments)
+    source = SyntheticSource(points=points, averages=averages, segments=segments, integrated=True, rate=rate)
+    avg    = Averager("averages", name="avg")
+    buff   = DataBuffer(name="buffer")
+    probe  = LatencyProbe(name="probe")
+    edges  = [(source.chan1, avg.sink), (avg.source, buff.sink), (avg.source, probe.sink)]
+    return run_benchmark("integrated", source, [avg, buff, probe], edges, probe, parameters)
+
+def bench_correlator(rate=None, qubits=3, points=10, averages=64, segments=64):
+    """Integrated records of several qubits through a Correlator into a DataBuffer."""
+    parameters = dict(rate=rate, qubits=qubits, points=points, averages=averages, segments=segments)
+    source = SyntheticSource(channels=qubits, points=points, averages=averages, segments=segments, integrated=True, rate=rate)
+    corr   = Correlator(name="corr")
+    buff   = DataBuffer(name="buffer")
+    probe  = LatencyProbe(name="probe")
+    edges  = [(oc, corr.sink) for oc in source.output_connectors.values()]
+    edges += [(corr.source, buff.sink), (corr.source, probe.sink)]
+    return run_benchmark("correlator", source, [corr, buff, probe], edges, probe, parameters)
+
+benchmarks = {'raw': bench_raw, 'integrated': bench_integrated, 'correlator': bench_correlator}
+
+def save_results(results, filename):
+    """Append benchmark results to a JSON lines file."""
+    with open(filename, "a") as f:
+        f.write(json.dumps(results) + "\n")
+
+def previous_results(results, filename):
+    """The last stored result of the same benchmark with the same parameters, if any."""
+    if not filename or not os.path.exists(filename):
+        return None
+    previous = None
+    with open(filename) as f:
+        for line in f:
+            old = json.loads(line)
+            if old['benchmark'] == results['benchmark'] and old['parameters'] == results['parameters']:
+                previous = old
+    return previous
+
+def report(results, previous=None):
+    def change(new, old):
+        return " ({:+.1f}%)".format(100.0*(new - old)/old) if old else ""
+    old_thru = previous['throughput']['records_per_second'] if previous else None
+    thru     = results['throughput']['records_per_second']
+    print("{benchmark}: {parameters}".format(**results))
+    print("  throughput {:.4g} records/s, {:.4g} MB/s{}".format(thru, results['throughput']['bytes_per_second']/1e6, change(thru, old_thru)))
+    for k, v in results['latency_seconds'].items():
+        old = previous['latency_seconds'].get(k) if previous else None
+        print("  latency {:>4} {:.3g} ms{}".format(k, 1e3*v, change(v, old)))
+    for name, stats in results['filters'].items():
+        print("  {:>12} cpu {:.3g} s, peak rss {:.1f} MB".format(name, stats['cpu_seconds'], stats['peak_rss_bytes']/2**20))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the auspex filter pipeline.")
+    parser.add_argument("benchmark", nargs="?", default="all", choices=list(benchmarks) + ["all"])
+    parser.add_argument("--rate", type=float, default=None, help="Records per second per channel, as fast as possible if not given")
+    parser.add_argument("--points", type=int, default=10, help="Number of sweep points, each an averaged frame")
+    parser.add_argument("--averages", type=int, default=None)
+    parser.add_argument("--segments", type=int, default=None)
+    parser.add_argument("--record-length", type=int, default=None, help="Samples per raw record")
+    parser.add_argument("--qubits", type=int, default=None, help="Number of correlated channels")
+    parser.add_argument("--output", default=None, help="JSON lines file to append results to")
+    args = parser.parse_args(argv)
+
+    names = list(benchmarks) if args.benchmark == "all" else [args.benchmark]
+    for name in names:
+        kwargs = {'rate': args.rate, 'points': args.points}
+        for arg in ["averages", "segments", "record_length", "qubits"]:
+            value = getattr(args, arg)
+            if value is not None and arg in inspect.signature(benchmarks[name]).parameters:
+                kwargs[arg] = value
+        results = benchmarks[name](**kwargs)
+        report(results, previous_results(results, args.output))
+        if args.output:
+            save_results(results, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -13,8 +13,33 @@ import sys
 from shutil import move
 from io import StringIO
 
-# Profiling
+# Profiling. Set to True (or "cprofile") to run each filter under cProfile,
+# writing prof-*.prof files, or to "sampling" for the low overhead sampling
+# profiler, writing prof-*.collapsed and prof-*.speedscope.json files. The
+# sampling profiler can also be switched on and off for individual filters
+# during a run with Filter.start_profiling() and Filter.stop_profiling().
 profile = False
+profile_filters  = None  # Names of the filters to profile, or None for all
+profile_interval = 0.005 # Seconds between samples
+
+# Performance telemetry (see auspex.telemetry). Serve the metrics of each
+# run on http://127.0.0.1:telemetry_port/metrics and/or write them to
+# telemetry_file, updated every telemetry_interval seconds.
+telemetry_port     = None
+telemetry_file     = None
+telemetry_interval = 1.0
+
+# Push the parameters of a sweep step to different instruments at the same
+# time, on up to concurrent_pushes threads, so that their settling delays
+# overlap. Pushes to any one instrument still happen in order. 0 pushes
+# everything serially.
+concurrent_pushes = 0
+
+# Connect and configure up to concurrent_instrument_setup instruments at the
+# same time (see Experiment.for_each_instrument). Instruments behind the same
+# Prologix controller share its connection and take turns on it. 0 sets up
+# one instrument after another.
+concurrent_instrument_setup = 0
 
 # Use when wanting to generate fake data
 # or to avoid loading libraries that may
@@ -34,6 +34,7 @@ import queue
 import re
 import cProfile
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 import zmq
 import numpy as np
@@ -42,10 +43,11 @@ import networkx as nx
 
 from auspex.instruments.instrument import Instrument
 from auspex.parameter import ParameterGroup, FloatParameter, IntParameter, Parameter
-from auspex.sweep import Sweeper
+from auspex.sweep import Sweeper, plan_sweep
 from auspex.stream import DataStream, DataAxis, SweepAxis, DataStreamDescriptor, InputConnector, OutputConnector
 from auspex.filters import Plotter, MeshPlotter, ManualPlotter, WriteToFile, DataBuffer, Filter
 from auspex.log import logger
+from auspex.telemetry import Telemetry, TelemetryCollector
 import auspex.config
 
 def auspex_plot_server():
@@ -157,6 +159,18 @@ class Experiment(metaclass=MetaExperiment):
         # Should we show the dashboard?
         self.dashboard = False
 
+        # Set up the next sweep point while finish_run() wraps up the current one? Only used
+        # when every swept parameter is pipeline_safe and the sweep is not adaptive.
+        self.pipelined = False
+        # Set while sweep() calls finish_run() after each run(). Otherwise, e.g. when run()
+        # is called directly, run() should wrap up by calling finish_run() itself.
+        self.finish_run_deferred = False
+
+        # Performance telemetry, enabled through auspex.config.telemetry_port/telemetry_file.
+        # The collector is kept after the run so its metrics can still be rendered.
+        self.telemetry = None
+        self.telemetry_collector = None
+
         # Create and use plots?
         self.do_plotting = False
 
@@ -255,6 +269,19 @@ class Experiment(metaclass=MetaExperiment):
         operation should be defined here"""
         pass
 
+    def finish_run(self):
+        """Gets run after each run(), for work that does not depend on the swept
+        parameters, such as stopping triggers and acquisitions. In pipelined sweeps
+        the next sweep point is set up at the same time. Experiments that implement
+        it should call it at the end of run() unless finish_run_deferred is set."""
+        pass
+
+    def can_pipeline(self):
+        """Whether the next sweep point can be set up during finish_run()."""
+        if self.sweeper.is_adaptive():
+            return False
+        return all(getattr(p, 'pipeline_safe', True) for p in self.sweeper.swept_parameters())
+
     def set_stream_compression(self, compression="zlib"):
         for oc in self.output_connectors.values():
             for os in oc.output_streams:
@@ -291,6 +318,10 @@ class Experiment(metaclass=MetaExperiment):
             stream.push_event("done")
 
     def sweep(self):
+        # Instruments may have been reset since parameters were last pushed
+        for p in list(self._parameters.values()) + self.sweeper.swept_parameters():
+            p.invalidate()
+
         # Set any static parameters
         static_params = [p for p in self._parameters.values() if p not in self.sweeper.swept_parameters()]
         for p in static_params:
@@ -301,55 +332,113 @@ class Experiment(metaclass=MetaExperiment):
         last_param_values = None
         logger.debug("Starting experiment sweep.")
 
-        while True:
-            # Increment the sweeper, which returns a list of the current
-            # values of the SweepAxes (no DataAxes).
-            sweep_values, axis_names = self.sweeper.update()
+        pipelined = self.pipelined and self.can_pipeline()
+        if self.pipelined and not pipelined:
+            logger.warning("Sweep is adaptive or has parameters that are not pipeline_safe, running it serially.")
+        executor   = ThreadPoolExecutor(max_workers=1) if pipelined else None
+        next_point = None
 
-            if hasattr(self, 'progressbars') and self.progressbars:
-                for axis in self.sweeper.axes:
-                    if axis.done:
-                        self.progressbars[axis].value = axis.num_points()
-                    else:
-                        self.progressbars[axis].value = axis.step
-
-            if self.sweeper.is_adaptive():
-                # Add the new tuples to the stream descriptors
-                for oc in self.output_connectors.values():
-                    # Obtain the lists of values for any fixed
-                    # DataAxes and append them to them to the sweep_values
-                    # in preperation for finding all combinations.
-                    vals = [a for a in oc.descriptor.data_axis_values()]
-                    if sweep_values:
-                        vals  = [[v] for v in sweep_values] + vals
-                    # Find all coordinate tuples and update the list of
-                    # tuples that the experiment has probed.
-                    nested_list    = list(itertools.product(*vals))
-                    flattened_list = [tuple((val for sublist in line for val in sublist)) for line in nested_list]
-                    oc.descriptor.visited_tuples = oc.descriptor.visited_tuples + flattened_list
-
-                    # Since the filters are in separate processes, pass them the same
-                    # information so that they may perform the same operations.
-                    oc.push_event("new_tuples", (axis_names, sweep_values,))
-
-            # Run the procedure
-            self.run()
-
-            # See if the axes want to extend themselves. They will push updates
-            # directly to the output_connecters as messages that will be passed
-            # through the filter pipeline.
-            self.sweeper.check_for_refinement(self.output_connectors)
-
-            # Finish up, checking to see whether we've received all of our data
-            if self.sweeper.done():
-                self.declare_done()
-                break
+        def finish():
+            finish_start = time.perf_counter()
+            self.finish_run()
+            if self.telemetry is not None:
+                self.telemetry.observe("sweep_point_seconds", time.perf_counter() - finish_start, labels={'phase': 'finish'})
+
+        self.finish_run_deferred = True
+        try:
+            while True:
+                point_start = time.perf_counter()
+
+                # Increment the sweeper, which returns a list of the current
+                # values of the SweepAxes (no DataAxes). When pipelined, this
+                # was started while the previous point was finishing.
+                if next_point is not None:
+                    sweep_values, axis_names = next_point.result()
+                else:
+                    sweep_values, axis_names = self.sweeper.update()
+                update_done = time.perf_counter()
+
+                if hasattr(self, 'progressbars') and self.progressbars:
+                    for axis in self.sweeper.axes:
+                        if axis.done:
+                            self.progressbars[axis].value = axis.num_points()
+                        else:
+                            self.progressbars[axis].value = axis.step
+
+                if self.sweeper.is_adaptive():
+                    # Add the new tuples to the stream descriptors
+                    for oc in self.output_connectors.values():
+                        # Obtain the lists of values for any fixed
+                        # DataAxes and append them to them to the sweep_values
+                        # in preperation for finding all combinations.
+                        vals = [a for a in oc.descriptor.data_axis_values()]
+                        if sweep_values:
+                            vals  = [[v] for v in sweep_values] + vals
+                        # Find all coordinate tuples and update the list of
+                        # tuples that the experiment has probed.
+                        nested_list    = list(itertools.product(*vals))
+                        flattened_list = [tuple((val for sublist in line for val in sublist)) for line in nested_list]
+                        oc.descriptor.visited_tuples = oc.descriptor.visited_tuples + flattened_list
+
+                        # Since the filters are in separate processes, pass them the same
+                        # information so that they may perform the same operations.
+                        oc.push_event("new_tuples", (axis_names, sweep_values,))
+
+                # Run the procedure
+                self.run()
+                run_done = time.perf_counter()
+                if executor is None:
+                    finish()
+
+                if self.telemetry is not None:
+                    self.telemetry.inc("sweep_points")
+                    self.telemetry.observe("sweep_point_seconds", update_done - point_start, labels={'phase': 'update'})
+                    self.telemetry.observe("sweep_point_seconds", run_done - update_done, labels={'phase': 'run'})
+                    self.telemetry.publish()
+
+                # See if the axes want to extend themselves. They will push updates
+                # directly to the output_connecters as messages that will be passed
+                # through the filter pipeline.
+                self.sweeper.check_for_refinement(self.output_connectors)
+
+                # Finish up, checking to see whether we've received all of our data
+                if self.sweeper.done():
+                    if executor is not None:
+                        finish()
+                    self.declare_done()
+                    if self.telemetry is not None:
+                        self.telemetry.publish(force=True)
+                    break
+
+                if executor is not None:
+                    next_point = executor.submit(self.sweeper.update)
+                    finish()
+        finally:
+            self.finish_run_deferred = False
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def for_each_instrument(self, action, instruments=None):
+        """Call action(instrument) for each of `instruments` (all of the experiment's by
+        default), on up to auspex.config.concurrent_instrument_setup threads at once so
+        that slow connections and configurations overlap. Raises the first error."""
+        if instruments is None:
+            instruments = self._instruments.values()
+        instruments = list(instruments)
+        threads = auspex.config.concurrent_instrument_setup
+        if not threads or len(instruments) < 2:
+            for instrument in instruments:
+                action(instrument)
+            return
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [pool.submit(action, instrument) for instrument in instruments]
+        for future in futures:
+            future.result()
 
     def connect_instruments(self):
         # Connect the instruments to their resources
         if not self.instrs_connected:
-            for instrument in self._instruments.values():
-                instrument.connect()
+            self.for_each_instrument(lambda instrument: instrument.connect())
             self.instrs_connected = True
 
     def disconnect_instruments(self):
@@ -426,6 +515,18 @@ class Experiment(metaclass=MetaExperiment):
         self.perf_thread.start()
 
 
+    def init_telemetry(self):
+        """Have the filters report their telemetry to a collector that exports it, see auspex.telemetry."""
+        telemetry_queue = Queue()
+        self.telemetry_collector = TelemetryCollector(telemetry_queue, port=auspex.config.telemetry_port,
+                                                      filename=auspex.config.telemetry_file,
+                                                      interval=auspex.config.telemetry_interval)
+        self.telemetry_collector.start()
+        self.telemetry = Telemetry(id(self), telemetry_queue, interval=auspex.config.telemetry_interval,
+                                   node=self.name or "experiment", type=self.__class__.__name__)
+        for n in self.other_nodes:
+            n.telemetry_queue = telemetry_queue
+
     def final_init(self):
         # Call any final initialization on the filter pipeline
         for n in self.nodes + self.extra_plotters:
@@ -528,6 +629,9 @@ class Experiment(metaclass=MetaExperiment):
             if self.dashboard:
                 self.init_dashboard()
 
+            if auspex.config.telemetry_port is not None or auspex.config.telemetry_file:
+                self.init_telemetry()
+
             # Start the filter processes
             for n in self.other_nodes:
                 n.start()
@@ -608,6 +712,10 @@ class Experiment(metaclass=MetaExperiment):
         for n in self.other_nodes:
             n.done.set()
 
+        if self.telemetry_collector is not None:
+            self.telemetry_collector.stop()
+            self.telemetry = None
+
         import gc
         gc.collect()
 
@@ -628,6 +736,19 @@ class Experiment(metaclass=MetaExperiment):
             parameters.value = sweep_list[0]
         return ax
 
+    def add_planned_sweep(self, parameters, values, order="serpentine", move_costs=None, metadata=None):
+        """Sweep the grid spanned by `values`, one list of points per parameter in `parameters`
+        (outermost first), in an order chosen by :func:`auspex.sweep.plan_sweep` to avoid large
+        jumps of slow instruments, e.g. a magnet snapping back at every outer step.
+
+        The grid becomes a single unstructured sweep, so that the data lands in the buffers and
+        files with the coordinates it was actually taken at. Pushes of unchanged values are
+        skipped for these parameters."""
+        coords = plan_sweep(values, order=order, move_costs=move_costs)
+        for p in parameters:
+            p.cache_pushes = True
+        return self.add_sweep(list(parameters), coords, metadata=metadata)
+
     def clear_sweeps(self):
         """Delete all sweeps present in this experiment."""
         logger.debug("Removing all axes from experiment.")
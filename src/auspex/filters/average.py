@@ -13,6 +13,8 @@ import itertools
 import numpy as np
 
 from .filter import Filter
+from .buffers import RecordBuffer
+from .rate import AdaptiveInterval
 from auspex.log import logger
 from auspex.parameter import Parameter, FloatParameter
 from auspex.stream import InputConnector, OutputConnector, DataStreamDescriptor, DataAxis
@@ -70,9 +72,11 @@ class Averager(Filter):
         self.num_averages = None
         self.passthrough = False
 
-        # Rate limiting for partial averages
+        # Rate limiting for partial averages, adapted to what emitting them costs
+        # and to how often their consumers (e.g. plotters) ask for updates
         self.last_update     = time.time()
         self.update_interval = 0.5
+        self.rate            = AdaptiveInterval(interval=self.update_interval, budget=0.05)
 
     def update_descriptors(self):
         logger.debug('Updating averager "%s" descriptors based on input descriptor: %s.', self.filter_name, self.sink.descriptor)
@@ -188,7 +192,7 @@ class Averager(Filter):
         self.idx_global         = 0
         # We only need to accumulate up to the averaging axis
         # BUT we may get something longer at any given time!
-        self.carry = np.zeros(0, dtype=self.source.descriptor.dtype)
+        self.buffer = RecordBuffer(self.points_before_partial_average, dtype=self.sink.descriptor.dtype)
 
     def process_data(self, data):
 
@@ -208,14 +212,21 @@ class Averager(Filter):
         elif not isinstance(data, np.ndarray) and (data.size == 1):
             data = np.array([data])
 
-        if self.carry.size > 0:
-            data = np.concatenate((self.carry, data))
-            self.carry = np.zeros(0, dtype=self.source.descriptor.dtype)
+        # Only whole partial frames come out of the buffer, leftover points are carried
+        for block in self.buffer.assemble(data):
+            self.process_frames(block)
 
+    def adapt_update_interval(self, cost):
+        """Space partial averages so that emitting them stays within budget, but never send them faster
+        than the slowest consumer wants them."""
+        requested = [os.update_interval.value for os in self.partial_average.output_streams]
+        self.update_interval = max([self.rate.record("push", cost)] + requested)
+
+    def process_frames(self, data):
         idx       = 0
         while idx < data.size:
             #check whether we have enough data to fill an averaging frame
-            if data.size - idx >= self.points_before_final_average:
+            if self.idx_frame == 0 and data.size - idx >= self.points_before_final_average:
                 #logger.debug("Have {} points, enough for final avg.".format(data.size))
                 # How many chunks can we process at once?
                 num_chunks = int((data.size - idx)/self.points_before_final_average)
@@ -253,11 +264,12 @@ class Averager(Filter):
                     os.push(ground_states)
                     os.push(excited_states)
 
-            # Maybe we can fill a partial frame
-            elif data.size - idx >= self.points_before_partial_average:
+            # Otherwise fill a partial frame, the buffer only hands us whole ones
+            else:
                 # logger.info("Have {} points, enough for partial avg.".format(data.size))
                 # How many chunks can we process at once?
                 num_chunks       = int((data.size - idx)/self.points_before_partial_average)
+                num_chunks       = min(num_chunks, self.num_averages - self.completed_averages)
                 new_points       = num_chunks*self.points_before_partial_average
 
                 # Find the appropriate dimensions for the partial
@@ -297,11 +309,8 @@ class Averager(Filter):
                 else:
                     # Emit a partial average since we've accumulated enough data
                     if (time.time() - self.last_update >= self.update_interval):
+                        start = time.perf_counter()
                         for os in self.partial_average.output_streams:
                             os.push(self.sum_so_far/self.completed_averages)
+                        self.adapt_update_interval(time.perf_counter() - start)
                         self.last_update = time.time()
-
-            # otherwise just add it to the carry
-            else:
-                self.carry = data[idx:]
-                break
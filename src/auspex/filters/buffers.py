@@ -0,0 +1,138 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+__all__ = ['RecordBuffer', 'RingBuffer']
+
+import numpy as np
+
+class RecordBuffer(object):
+    """Assemble a stream of arbitrarily sized chunks into whole records of `record_length` points.
+
+    Incoming chunks are never concatenated. Whole records that lie inside a chunk are
+    yielded as views of that chunk, and only the trailing partial record is copied into
+    a preallocated staging area. Once the staging area holds a full record it is yielded
+    as a view as well, so steady-state ingestion does not allocate.
+
+    Views of the staging area are only valid until the next call to `assemble`. Pass
+    `copy=True` when the records may outlive that call (e.g. when pushed onto a queue)."""
+
+    def __init__(self, record_length, dtype=np.float32):
+        super(RecordBuffer, self).__init__()
+        if record_length < 1:
+            raise ValueError("RecordBuffer record_length must be positive, got {}.".format(record_length))
+        self.record_length = int(record_length)
+        self.staging = np.empty(self.record_length, dtype=dtype)
+        self.pending = 0
+
+    def reset(self):
+        """Discard any partially assembled record."""
+        self.pending = 0
+
+    def _check_dtype(self, data):
+        if data.dtype != self.staging.dtype:
+            dtype = np.result_type(self.staging.dtype, data.dtype)
+            if dtype != self.staging.dtype:
+                staging = np.empty(self.record_length, dtype=dtype)
+                staging[:self.pending] = self.staging[:self.pending]
+                self.staging = staging
+
+    def assemble(self, data, copy=False):
+        """Generator yielding 1D blocks whose size is a multiple of `record_length`, in stream order.
+        Any trailing points that do not complete a record are retained for the next call."""
+        data = np.ravel(data)
+        idx  = 0
+
+        if self.pending > 0:
+            self._check_dtype(data)
+            needed = min(self.record_length - self.pending, data.size)
+            self.staging[self.pending:self.pending+needed] = data[:needed]
+            self.pending += needed
+            idx = needed
+            if self.pending < self.record_length:
+                return
+            self.pending = 0
+            yield self.staging.copy() if copy else self.staging
+
+        num_records = (data.size - idx) // self.record_length
+        if num_records > 0:
+            stop = idx + num_records*self.record_length
+            yield data[idx:stop]
+            idx = stop
+
+        remaining = data.size - idx
+        if remaining > 0:
+            self._check_dtype(data)
+            self.staging[:remaining] = data[idx:]
+            self.pending = remaining
+
+class RingBuffer(object):
+    """First-in first-out circular buffer of points for aligning streams that arrive unevenly.
+
+    Points are copied in once on `push` and copied out once on `pop`; nothing is ever
+    shifted or concatenated. The capacity doubles whenever a push would overflow, so after
+    the first few messages the buffer settles at its working size and stops allocating."""
+
+    def __init__(self, capacity=1024, dtype=np.float32):
+        super(RingBuffer, self).__init__()
+        self.data  = np.empty(max(int(capacity), 1), dtype=dtype)
+        self.start = 0
+        self.size  = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return self.data.size
+
+    def clear(self):
+        self.start = 0
+        self.size  = 0
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        data = np.empty(capacity, dtype=self.data.dtype)
+        self.pop(self.size, out=data[:self.size], consume=False)
+        self.data  = data
+        self.start = 0
+
+    def push(self, data):
+        """Append `data` to the end of the buffer."""
+        data = np.ravel(data)
+        if data.dtype != self.data.dtype:
+            dtype = np.result_type(self.data.dtype, data.dtype)
+            if dtype != self.data.dtype:
+                self.data = self.data.astype(dtype)
+        if self.size + data.size > self.capacity:
+            self._grow(self.size + data.size)
+
+        stop  = (self.start + self.size) % self.capacity
+        first = min(data.size, self.capacity - stop)
+        self.data[stop:stop+first] = data[:first]
+        self.data[:data.size-first] = data[first:]
+        self.size += data.size
+
+    def pop(self, num_points, out=None, consume=True):
+        """Copy the oldest `num_points` into `out` (allocated if not given) and drop them from the
+        buffer unless `consume` is False."""
+        if num_points > self.size:
+            raise ValueError("Cannot pop {} points from a RingBuffer holding {}.".format(num_points, self.size))
+        if out is None:
+            out = np.empty(num_points, dtype=self.data.dtype)
+
+        first = min(num_points, self.capacity - self.start)
+        out[:first] = self.data[self.start:self.start+first]
+        out[first:num_points] = self.data[:num_points-first]
+        if consume:
+            self.start = (self.start + num_points) % self.capacity
+            self.size -= num_points
+            if self.size == 0:
+                self.start = 0
+        return out
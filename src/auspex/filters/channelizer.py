@@ -16,6 +16,7 @@ import numpy as np
 import scipy.signal
 
 from .filter import Filter
+from .buffers import RecordBuffer
 from auspex.parameter import Parameter, IntParameter, FloatParameter
 from auspex.stream import  DataStreamDescriptor, InputConnector, OutputConnector
 from auspex.log import logger
@@ -85,7 +86,7 @@ class Channelizer(Filter):
         self.idx = 0
 
         # For storing carryover if getting uneven buffers
-        self.carry = np.zeros(0, dtype=self.output_descriptor.dtype)
+        self.buffer = RecordBuffer(self.record_length, dtype=self.sink.descriptor.dtype)
 
 
     def update_references(self, frequency):
@@ -192,101 +193,85 @@ class Channelizer(Filter):
                 os.end_connector.update_descriptors()
 
     def process_data(self, data):
+        # Whole records are handed over as views, only leftover points are carried
+        for block in self.buffer.assemble(data):
+            self.process_records(np.reshape(block, (-1, self.record_length), order="C"))
 
-        # Append any data carried from the last run
-        if self.carry.size > 0:
-            data = np.concatenate((self.carry, data))
+    def process_records(self, reshaped_data):
+        # The records are processed in parallel
+        num_records = reshaped_data.shape[0]
 
-        # This is the largest number of records we can handle
-        num_records = data.size // self.record_length
-
-        # This is the carryover that we'll store until next round.
-        # If nothing is left then reset the carryover.
-        remaining_points = data.size % self.record_length
-        if remaining_points > 0:
-            if num_records > 0:
-                self.carry = data[-remaining_points:]
-                data = data[:-remaining_points]
-            else:
-                self.carry = data
-        else:
-            self.carry = np.zeros(0, dtype=self.output_descriptor.dtype)
-
-        if num_records > 0:
-            # The records are processed in parallel after being reshaped here
-            reshaped_data = np.reshape(data, (num_records, self.record_length), order="C")
-
-            # Update demodulation frequency if necessary
-            if self.follow_axis.value is not "":
-                freq = self.demod_freqs[(self.idx % self.pts_before_freq_reset) // self.pts_before_freq_update]
-                if freq != self.current_freq:
-                    self.update_references(freq)
-                    self.current_freq = freq
+        # Update demodulation frequency if necessary
+        if self.follow_axis.value is not "":
+            freq = self.demod_freqs[(self.idx % self.pts_before_freq_reset) // self.pts_before_freq_update]
+            if freq != self.current_freq:
+                self.update_references(freq)
+                self.current_freq = freq
 
-            self.idx += data.size
+        self.idx += reshaped_data.size
 
-            # first stage decimating filter
-            if self.filters[0] is None:
-                filtered = reshaped_data
-            else:
-                stacked_coeffs = np.concatenate(self.filters[0])
-                # filter
-                if np.iscomplexobj(reshaped_data):
-                    # TODO: compile complex versions of the IPP functions
-                    filtered_r = np.empty_like(reshaped_data, dtype=np.float32)
-                    filtered_i = np.empty_like(reshaped_data, dtype=np.float32)
-                    libipp.filter_records_iir(stacked_coeffs, self.filters[0][0].size-1, np.ascontiguousarray(reshaped_data.real.astype(np.float32)), self.record_length, num_records, filtered_r)
-                    libipp.filter_records_iir(stacked_coeffs, self.filters[0][0].size-1, np.ascontiguousarray(reshaped_data.imag.astype(np.float32)), self.record_length, num_records, filtered_i)
-                    filtered = filtered_r + 1j*filtered_i
-                    # decimate
-                    if self.decim_factors[0] > 1:
-                        filtered = filtered[:, ::self.decim_factors[0]]
-                else:
-                    filtered = np.empty_like(reshaped_data, dtype=np.float32)
-                    libipp.filter_records_iir(stacked_coeffs, self.filters[0][0].size-1, np.ascontiguousarray(reshaped_data.real.astype(np.float32)), self.record_length, num_records, filtered)
-
-                    # decimate
-                    if self.decim_factors[0] > 1:
-                        filtered = filtered[:, ::self.decim_factors[0]]
-
-            # mix with reference
-            # keep real and imaginary separate for filtering below
+        # first stage decimating filter
+        if self.filters[0] is None:
+            filtered = reshaped_data
+        else:
+            stacked_coeffs = np.concatenate(self.filters[0])
+            # filter
             if np.iscomplexobj(reshaped_data):
-                filtered *= self.reference
-                filtered_r = filtered.real
-                filtered_i = filtered.imag
+                # TODO: compile complex versions of the IPP functions
+                filtered_r = np.empty_like(reshaped_data, dtype=np.float32)
+                filtered_i = np.empty_like(reshaped_data, dtype=np.float32)
+                libipp.filter_records_iir(stacked_coeffs, self.filters[0][0].size-1, np.ascontiguousarray(reshaped_data.real.astype(np.float32)), self.record_length, num_records, filtered_r)
+                libipp.filter_records_iir(stacked_coeffs, self.filters[0][0].size-1, np.ascontiguousarray(reshaped_data.imag.astype(np.float32)), self.record_length, num_records, filtered_i)
+                filtered = filtered_r + 1j*filtered_i
+                # decimate
+                if self.decim_factors[0] > 1:
+                    filtered = filtered[:, ::self.decim_factors[0]]
             else:
-                filtered_r = self.reference_r * filtered
-                filtered_i = self.reference_i * filtered
-
-            # channel selection filters
-            for ct in [1,2]:
-                if self.filters[ct] == None:
-                    continue
-
-                coeffs = self.filters[ct]
-                stacked_coeffs = np.concatenate(self.filters[ct])
-                out_r = np.empty_like(filtered_r).astype(np.float32)
-                out_i = np.empty_like(filtered_i).astype(np.float32)
-                libipp.filter_records_iir(stacked_coeffs, self.filters[ct][0].size-1, np.ascontiguousarray(filtered_r.astype(np.float32)), filtered_r.shape[-1], num_records, out_r)
-                libipp.filter_records_iir(stacked_coeffs, self.filters[ct][0].size-1, np.ascontiguousarray(filtered_i.astype(np.float32)), filtered_i.shape[-1], num_records, out_i)
+                filtered = np.empty_like(reshaped_data, dtype=np.float32)
+                libipp.filter_records_iir(stacked_coeffs, self.filters[0][0].size-1, np.ascontiguousarray(reshaped_data.real.astype(np.float32)), self.record_length, num_records, filtered)
 
                 # decimate
-                if self.decim_factors[ct] > 1:
-                    filtered_r = np.copy(out_r[:, ::self.decim_factors[ct]], order="C")
-                    filtered_i = np.copy(out_i[:, ::self.decim_factors[ct]], order="C")
-                else:
-                    filtered_r = out_r
-                    filtered_i = out_i
+                if self.decim_factors[0] > 1:
+                    filtered = filtered[:, ::self.decim_factors[0]]
+
+        # mix with reference
+        # keep real and imaginary separate for filtering below
+        if np.iscomplexobj(reshaped_data):
+            filtered *= self.reference
+            filtered_r = filtered.real
+            filtered_i = filtered.imag
+        else:
+            filtered_r = self.reference_r * filtered
+            filtered_i = self.reference_i * filtered
+
+        # channel selection filters
+        for ct in [1,2]:
+            if self.filters[ct] == None:
+                continue
+
+            coeffs = self.filters[ct]
+            stacked_coeffs = np.concatenate(self.filters[ct])
+            out_r = np.empty_like(filtered_r).astype(np.float32)
+            out_i = np.empty_like(filtered_i).astype(np.float32)
+            libipp.filter_records_iir(stacked_coeffs, self.filters[ct][0].size-1, np.ascontiguousarray(filtered_r.astype(np.float32)), filtered_r.shape[-1], num_records, out_r)
+            libipp.filter_records_iir(stacked_coeffs, self.filters[ct][0].size-1, np.ascontiguousarray(filtered_i.astype(np.float32)), filtered_i.shape[-1], num_records, out_i)
+
+            # decimate
+            if self.decim_factors[ct] > 1:
+                filtered_r = np.copy(out_r[:, ::self.decim_factors[ct]], order="C")
+                filtered_i = np.copy(out_i[:, ::self.decim_factors[ct]], order="C")
+            else:
+                filtered_r = out_r
+                filtered_i = out_i
 
-            filtered = filtered_r + 1j*filtered_i
+        filtered = filtered_r + 1j*filtered_i
 
-            # recover gain from selecting single sideband
-            filtered *= 2
+        # recover gain from selecting single sideband
+        filtered *= 2
 
-            # push to ouptut connectors
-            for os in self.source.output_streams:
-                os.push(filtered)
+        # push to ouptut connectors
+        for os in self.source.output_streams:
+            os.push(filtered)
 
 class LibChannelizerFallback(object):
     @staticmethod
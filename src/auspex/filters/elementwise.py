@@ -18,6 +18,7 @@ from auspex.stream import InputConnector, OutputConnector
 from auspex.log import logger
 import auspex.config as config
 from .filter import Filter
+from .buffers import RingBuffer
 
 
 class ElementwiseFilter(Filter):
@@ -59,6 +60,17 @@ class ElementwiseFilter(Filter):
         self.source.descriptor = self.descriptor
         self.source.update_descriptors()
 
+    def reduce(self, stacked, out):
+        """Combine the aligned rows of `stacked` into `out` using `self.operation()`. Ufuncs
+        are reduced over all streams at once, anything else is applied pairwise."""
+        op = self.operation()
+        if isinstance(op, np.ufunc):
+            return op.reduce(stacked, axis=0, out=out)
+        out[:] = stacked[0]
+        for row in stacked[1:]:
+            out[:] = op(out, row)
+        return out
+
     def main(self):
         self.done.clear()
         streams = self.sink.input_streams
@@ -67,12 +79,29 @@ class ElementwiseFilter(Filter):
             if not np.all(s.descriptor.expected_tuples() == streams[0].descriptor.expected_tuples()):
                 raise ValueError("Multiple streams connected to correlator must have matching descriptors.")
 
-        # Buffers for stream data
-        stream_data = {s: np.zeros(0, dtype=self.sink.descriptor.dtype) for s in streams}
+        # Ring buffers for stream data, and a scratch array to stack aligned points into
+        dtype        = self.sink.descriptor.dtype
+        stream_data  = {s: RingBuffer(dtype=dtype) for s in streams}
+        stacked      = np.empty((len(streams), 0), dtype=dtype)
 
-        # Store whether streams are done
+        # Store whether streams are done, and how many refinements each has delivered
         streams_done      = {s: False for s in streams}
         points_per_stream = {s: 0 for s in streams}
+        refines_received  = {s: [] for s in streams}
+
+        def push_aligned():
+            nonlocal stacked
+            smallest_length = min([len(d) for d in stream_data.values()])
+            if smallest_length == 0:
+                return
+            dtype = np.result_type(*[d.data.dtype for d in stream_data.values()])
+            if stacked.shape[1] < smallest_length or stacked.dtype != dtype:
+                stacked = np.empty((len(streams), max(smallest_length, 2*stacked.shape[1])), dtype=dtype)
+            for i, d in enumerate(stream_data.values()):
+                d.pop(smallest_length, out=stacked[i, :smallest_length])
+            # The result is handed to the output queues, so it gets its own memory
+            result = np.empty(smallest_length, dtype=stacked.dtype)
+            self.source.push(self.reduce(stacked[:, :smallest_length], result))
 
         while not self.exit.is_set():
 
@@ -85,9 +114,19 @@ class ElementwiseFilter(Filter):
                     try:
                         msgs_by_stream[stream].append(stream.queue.get(False))
                     except queue.Empty as e:
-                        time.sleep(0.002)
+                        self.wait_for_data()
                         break
 
+            self.check_profiling()
+            telemetry = self.telemetry
+            if telemetry is not None:
+                depth = sum(len(m) for m in msgs_by_stream.values())
+                telemetry.set("filter_queue_depth", depth)
+                telemetry.inc("filter_messages_in", depth)
+                telemetry.inc("filter_bytes_in", sum(m['data'].nbytes for ms in msgs_by_stream.values()
+                                                     for m in ms if m['type'] == 'data' and hasattr(m['data'], 'nbytes')))
+                self.push_telemetry()
+
             # Process many messages for each stream
             for stream, messages in msgs_by_stream.items():
                 for message in messages:
@@ -97,31 +136,30 @@ class ElementwiseFilter(Filter):
                     if message_type == 'event':
                         if message['event_type'] == 'done':
                             streams_done[stream] = True
-                        elif message['event_type'] == 'refine':
-                            logger.warning("ElementwiseFilter doesn't handle refinement yet!")
-                        self.push_to_all(message)
+                        elif message['event_type'] == 'refined':
+                            # Refinements are applied once every stream has caught up to them
+                            refines_received[stream].append(message['data'])
+                            if all(len(r) > 0 for r in refines_received.values()):
+                                push_aligned()
+                                self.refine(refines_received[stream][0])
+                                for r in refines_received.values():
+                                    r.pop(0)
+                        else:
+                            self.push_to_all(message)
                     elif message_type == 'data':
-                        # Add any old data...
-                        points_per_stream[stream] += len(message_data.flatten())
-                        stream_data[stream] = np.concatenate((stream_data[stream], message_data.flatten()))
+                        points_per_stream[stream] += message_data.size
+                        stream_data[stream].push(message_data)
 
             # Now process the data with the elementwise operation
-            smallest_length = min([d.size for d in stream_data.values()])
-            new_data = [d[:smallest_length] for d in stream_data.values()]
-            result = new_data[0]
-            for nd in new_data[1:]:
-                result = self.operation()(result, nd)
-            if result.size > 0:
-                self.source.push(result)
-
-            # Add data to carry_data if necessary
-            for stream in stream_data.keys():
-                if stream_data[stream].size > smallest_length:
-                    stream_data[stream] = stream_data[stream][smallest_length:]
-                else:
-                    stream_data[stream] = np.zeros(0, dtype=self.sink.descriptor.dtype)
+            if telemetry is None:
+                push_aligned()
+            else:
+                start = time.perf_counter()
+                push_aligned()
+                telemetry.observe("filter_process_data_seconds", time.perf_counter() - start)
 
             # If the amount of data processed is equal to the num points in the stream, we are done
             if np.all([streams_done[stream] for stream in streams]):
+                self.source.push_event("done")
                 self.done.set()
                 break
@@ -32,6 +32,8 @@ import numpy as np
 from auspex.parameter import Parameter
 from auspex.stream import DataStream, InputConnector, OutputConnector
 from auspex.log import logger
+from auspex.telemetry import Telemetry
+from auspex.profiler import SamplingProfiler
 import auspex.config
 
 class MetaFilter(type):
@@ -72,6 +74,10 @@ class Filter(Process, metaclass=MetaFilter):
         self.exit = Event()
         self.done = Event()
 
+        # Event for switching the sampling profiler on and off from the parent process
+        self.profiling = Event()
+        self.sampler = None
+
         # Keep track of data throughput
         self.processed = 0
 
@@ -99,6 +105,8 @@ class Filter(Process, metaclass=MetaFilter):
         self.last_performance_update = datetime.datetime.now()
         self.beginning = datetime.datetime.now()
         self.perf_queue = None
+        self.telemetry_queue = None
+        self.telemetry = None
 
     def __repr__(self):
         return "<{} Process (name={})>".format(self.__class__.__name__, self.filter_name)
@@ -158,20 +166,50 @@ class Filter(Process, metaclass=MetaFilter):
     def run(self):
         self.p = psutil.Process(os.getpid())
         logger.debug(f"{self} launched with pid {os.getpid()}. ppid {os.getppid()}")
-        if auspex.config.profile:
-            if not self.filter_name:
-                name = "Unlabeled"
-            else:
-                name = self.filter_name
-            cProfile.runctx('self.main()', globals(), locals(), 'prof-%s-%s.prof' % (self.__class__.__name__, name))
+        if self.telemetry_queue is not None:
+            self.telemetry = Telemetry(id(self), self.telemetry_queue, interval=auspex.config.telemetry_interval,
+                                       node=self.filter_name or "Unlabeled", type=self.__class__.__name__)
+        profile = auspex.config.profile
+        if auspex.config.profile_filters is not None and self.filter_name not in auspex.config.profile_filters:
+            profile = False
+        if profile == "sampling":
+            self.profiling.set()
+        if profile and profile != "sampling":
+            cProfile.runctx('self.main()', globals(), locals(), self.profile_filename() + '.prof')
         else:
             self.execute_on_run()
             self.main()
+        self.profiling.clear()
+        self.check_profiling()
+        self.push_telemetry(force=True)
         self.done.set()
 
     def execute_on_run(self):
         pass
 
+    def profile_filename(self):
+        return 'prof-%s-%s' % (self.__class__.__name__, self.filter_name or "Unlabeled")
+
+    def start_profiling(self):
+        """Start sampling this filter's call stacks, which can be done while it is running."""
+        self.profiling.set()
+
+    def stop_profiling(self):
+        """Stop sampling, after which the filter writes all of its samples so far."""
+        self.profiling.clear()
+
+    def check_profiling(self):
+        """Start or stop the sampling profiler as requested, called from the filter's run loop."""
+        if self.profiling.is_set():
+            if self.sampler is None:
+                self.sampler = SamplingProfiler(interval=auspex.config.profile_interval)
+            self.sampler.start()
+        elif self.sampler is not None and self.sampler.running:
+            self.sampler.stop()
+            name = self.profile_filename()
+            self.sampler.write_collapsed(name + '.collapsed')
+            self.sampler.write_speedscope(name + '.speedscope.json', name=str(self))
+
     def push_to_all(self, message):
         for oc in self.output_connectors.values():
             for ost in oc.output_streams:
@@ -183,6 +221,21 @@ class Filter(Process, metaclass=MetaFilter):
             self.perf_queue.put(perf_info)
             self.last_performance_update = datetime.datetime.now()
 
+    def push_telemetry(self, force=False):
+        if self.telemetry is not None and (force or self.telemetry.due()):
+            self.telemetry.set("filter_cpu_percent", self.p.cpu_percent())
+            self.telemetry.set("filter_memory_rss_bytes", self.p.memory_info().rss)
+            self.telemetry.publish(force=True)
+
+    def wait_for_data(self, seconds=0.002):
+        """Sleep while the input queues are empty, accounting the time as idle."""
+        if self.telemetry is None:
+            time.sleep(seconds)
+        else:
+            start = time.perf_counter()
+            time.sleep(seconds)
+            self.telemetry.inc("filter_idle_seconds", time.perf_counter() - start)
+
     def main(self):
         """
         Generic run method which waits on a single stream and calls `process_data` on any new_data
@@ -211,10 +264,17 @@ class Filter(Process, metaclass=MetaFilter):
                     try:
                         messages.append(input_stream.queue.get(False))
                     except queue.Empty as e:
-                        time.sleep(0.002)
+                        self.wait_for_data()
                         break
 
                 self.push_resource_usage()
+                self.check_profiling()
+                telemetry = self.telemetry
+                if telemetry is not None:
+                    # The backlog that had built up while we were busy
+                    telemetry.set("filter_queue_depth", len(messages))
+                    telemetry.inc("filter_messages_in", len(messages))
+                    self.push_telemetry()
 
                 for message in messages:
                     message_type = message['type']
@@ -243,7 +303,13 @@ class Filter(Process, metaclass=MetaFilter):
                         logger.debug('%s "%s" received %d points.', self.__class__.__name__, self.filter_name, message_data.size)
                         logger.debug("Now has %d of %d points.", input_stream.points_taken.value, input_stream.num_points())
                         stream_points += len(message_data.flatten())
-                        self.process_data(message_data.flatten())
+                        if telemetry is None:
+                            self.process_data(message_data.flatten())
+                        else:
+                            start = time.perf_counter()
+                            self.process_data(message_data.flatten())
+                            telemetry.observe("filter_process_data_seconds", time.perf_counter() - start)
+                            telemetry.inc("filter_bytes_in", message_data.nbytes)
                         self.processed += message_data.nbytes
 
                     elif message['type'] == 'data_direct':
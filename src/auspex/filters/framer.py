@@ -13,6 +13,7 @@ import itertools
 import numpy as np
 
 from .filter import Filter
+from .buffers import RecordBuffer
 from auspex.log import logger
 from auspex.parameter import Parameter
 from auspex.stream import InputConnector, OutputConnector
@@ -60,29 +61,12 @@ class Framer(Filter):
 
         # For storing carryover if getting uneven buffers
         self.idx = 0
-        self.carry = np.zeros(0, dtype=self.sink.descriptor.dtype)
+        self.buffer = RecordBuffer(self.frame_points, dtype=self.sink.descriptor.dtype)
 
     def process_data(self, data):
-        # Append any data carried from the last run
-        if self.carry.size > 0:
-            data = np.concatenate((self.carry, data))
-
-        # This is the largest number of frames we can emit for the time being
-        num_frames = data.size // self.frame_points
-
-        # This is the carryover that we'll store until next round.
-        # If nothing is left then reset the carryover.
-        remaining_points = data.size % self.frame_points
-        if remaining_points > 0:
-            if num_frames > 0:
-                self.carry = data[-remaining_points:]
-                data = data[:-remaining_points]
-            else:
-                self.carry = data
-        else:
-            self.carry = np.zeros(0, dtype=self.sink.descriptor.dtype)
-
-        if num_frames > 0:
-            for i in range(num_frames):
+        # Frames completed from carried-over points live in the buffer's staging area,
+        # so ask for copies since they are handed off to the output queues.
+        for block in self.buffer.assemble(data, copy=True):
+            for i in range(block.size // self.frame_points):
                 for os in self.source.output_streams:
-                    os.push(data[i*self.frame_points:(i+1)*self.frame_points])
\ No newline at end of file
+                    os.push(block[i*self.frame_points:(i+1)*self.frame_points])
@@ -12,14 +12,26 @@ import time
 import zmq
 import json
 import uuid
+import threading
 import sys, os
 import numpy as np
 
 from .filter import Filter
+from .rate import AdaptiveInterval
 from auspex.parameter import Parameter, IntParameter
 from auspex.log import logger
 from auspex.stream import InputConnector, OutputConnector
 
+# Optional compression of plot payloads
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 if sys.platform == 'win32' or 'NOFORKING' in os.environ:
     import threading as mp
     from queue import Queue
@@ -27,23 +39,187 @@ else:
     import multiprocessing as mp
     from multiprocessing import Queue
 
+def _bin_size(num_points, num_bins, mode="mean"):
+    """Number of points per bin when decimating `num_points` to fit `num_bins` output points.
+    Data that already fits, or with decimation disabled, is left at one point per bin."""
+    if not mode or num_points <= num_bins:
+        return 1
+    if mode == "minmax":
+        num_bins = max(num_bins//2, 1) # Two points come out of every bin
+    return int(np.ceil(num_points/max(int(num_bins), 1)))
+
+def _padded(values, bin_size, axis=-1):
+    """Pad `values` with NaN along `axis` up to a whole number of bins."""
+    length = bin_size*int(np.ceil(values.shape[axis]/bin_size))
+    pad = [(0, 0)]*values.ndim
+    pad[axis] = (0, length - values.shape[axis])
+    if not (np.iscomplexobj(values) or np.issubdtype(values.dtype, np.floating)):
+        values = values.astype(np.float64)
+    return np.pad(values, pad, mode='constant', constant_values=np.nan)
+
+def _nanmean(values, axis):
+    """Mean ignoring NaN that quietly returns NaN for empty bins."""
+    finite = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(finite, values, 0).sum(axis=axis)/finite.sum(axis=axis)
+
+def _bin_1d(x_values, data, bin_size, mode="minmax"):
+    """Decimate a trace into bins of `bin_size` points, see `_decimate_1d`."""
+    if bin_size <= 1:
+        return x_values, data
+
+    if mode == "mean":
+        x = _nanmean(_padded(np.asarray(x_values), bin_size).reshape(-1, bin_size), 1)
+        y = _nanmean(_padded(data, bin_size).reshape(-1, bin_size), 1)
+        return x, y.astype(data.dtype)
+
+    key  = _padded(np.abs(data) if np.iscomplexobj(data) else data, bin_size).reshape(-1, bin_size)
+    offs = np.arange(key.shape[0])*bin_size
+    lo   = np.argmin(np.where(np.isnan(key), np.inf, key), axis=1) + offs
+    hi   = np.argmax(np.where(np.isnan(key), -np.inf, key), axis=1) + offs
+    idx  = np.minimum(np.sort(np.stack([lo, hi], axis=1), axis=1).ravel(), data.size-1)
+    return np.asarray(x_values)[idx], data[idx]
+
+def _block_mean(image, y_size, x_size):
+    """Average an image over blocks of `y_size` rows by `x_size` columns."""
+    if x_size <= 1 and y_size <= 1:
+        return image
+    image = _padded(_padded(image, x_size, axis=1), y_size, axis=0)
+    rows, cols = image.shape
+    return _nanmean(image.reshape(rows//y_size, y_size, cols//x_size, x_size), (1, 3))
+
+def _decimate_1d(x_values, data, num_bins, mode="minmax"):
+    """Reduce a trace to roughly `num_bins` points. In "minmax" mode the samples with the smallest
+    and largest value (magnitude for complex data) in each bin are kept, in their original order,
+    so that peaks survive decimation. In "mean" mode each bin is replaced by its average."""
+    return _bin_1d(x_values, data, _bin_size(data.size, num_bins, mode), mode)
+
+def _decimate_2d(x_values, y_values, data, x_bins, y_bins):
+    """Block-average an image of shape (len(y_values), len(x_values)) down to at most
+    `y_bins` by `x_bins` pixels, returning the decimated axes and flattened image."""
+    x_size = _bin_size(len(x_values), x_bins)
+    y_size = _bin_size(len(y_values), y_bins)
+    if x_size <= 1 and y_size <= 1:
+        return x_values, y_values, data
+
+    image = _block_mean(data.reshape(len(y_values), len(x_values)), y_size, x_size)
+    x = _nanmean(_padded(np.asarray(x_values), x_size).reshape(-1, x_size), 1)
+    y = _nanmean(_padded(np.asarray(y_values), y_size).reshape(-1, y_size), 1)
+    return x, y, image.astype(data.dtype).ravel()
+
+def _compress(payload, compression):
+    if compression == "lz4":
+        return lz4.frame.compress(payload)
+    elif compression == "zstd":
+        return zstandard.ZstdCompressor().compress(payload)
+    return payload
+
+def _encode(dat, compression=None, downcast=False, sparse=True):
+    """Serialize an array for the plot server as (metadata, payload). Unfilled (NaN) regions are dropped
+    and described by `runs` of valid points, complex128/float64 values are optionally reduced to
+    complex64/float32, and payloads of more than a kilobyte are optionally compressed."""
+    dat = np.ascontiguousarray(dat)
+    md  = dict(dtype=str(dat.dtype), shape=dat.shape)
+    if dat.ndim != 1 or dat.size == 0:
+        return md, dat
+
+    if downcast and dat.dtype in (np.complex128, np.float64):
+        dat = dat.astype(np.complex64 if np.iscomplexobj(dat) else np.float32)
+        md['dtype'] = str(dat.dtype)
+
+    if sparse and (np.iscomplexobj(dat) or np.issubdtype(dat.dtype, np.floating)):
+        valid = ~(np.isnan(dat.real) & np.isnan(dat.imag)) if np.iscomplexobj(dat) else ~np.isnan(dat)
+        num_valid = np.count_nonzero(valid)
+        if num_valid < 0.9*dat.size:
+            edges  = np.diff(np.concatenate(([0], valid.view(np.int8), [0])))
+            starts = np.flatnonzero(edges == 1)
+            stops  = np.flatnonzero(edges == -1)
+            # Many short runs are not worth describing
+            if len(starts) <= max(dat.size//64, 1):
+                md['runs'] = np.stack([starts, stops], axis=1).tolist()
+                dat = dat[valid]
+
+    payload = dat
+    if compression and dat.nbytes > 1024:
+        payload = _compress(dat.tobytes(), compression)
+        md['compression'] = compression
+    return md, payload
+
+def _decode(md, payload):
+    """Inverse of `_encode`, as done by the plot client."""
+    if md.get('compression') == "lz4":
+        payload = lz4.frame.decompress(payload)
+    elif md.get('compression') == "zstd":
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    dat = np.frombuffer(payload, dtype=md['dtype'])
+    if 'runs' in md:
+        full = np.full(int(np.prod(md['shape'])), np.nan, dtype=dat.dtype)
+        idx  = 0
+        for start, stop in md['runs']:
+            full[start:stop] = dat[idx:idx+stop-start]
+            idx += stop - start
+        dat = full
+    return dat
+
+def _in_range(values, limits):
+    """Index slice of the (monotonic) `values` lying within `limits`, padded by one point on each side."""
+    if not limits or np.ndim(values) != 1:
+        return slice(None)
+    lo, hi = min(limits), max(limits)
+    inside = np.flatnonzero((values >= lo) & (values <= hi))
+    if inside.size == 0:
+        return slice(None)
+    return slice(max(inside[0]-1, 0), inside[-1]+2)
+
 class Plotter(Filter):
     sink      = InputConnector()
     plot_dims = IntParameter(value_range=(0,1,2), snap=1, default=0) # 0 means auto
     plot_mode = Parameter(allowed_values=["real", "imag", "real/imag", "amp/phase", "quad"], default="quad")
 
-    def __init__(self, *args, name="", plot_dims=None, plot_mode=None, **plot_args):
+    def __init__(self, *args, name="", plot_dims=None, plot_mode=None, decimation="minmax", pixels=(1024, 1024),
+                 compression=None, downcast=False, plot_budget=0.1, plot_bandwidth=None, **plot_args):
         super(Plotter, self).__init__(*args, name=name)
         if plot_dims:
             self.plot_dims.value = plot_dims
         if plot_mode:
             self.plot_mode.value = plot_mode
+        if decimation not in ("minmax", "mean", None):
+            raise ValueError("Plotter decimation must be 'minmax', 'mean', or None, got {}.".format(decimation))
+        if compression not in ("lz4", "zstd", None):
+            raise ValueError("Plotter compression must be 'lz4', 'zstd', or None, got {}.".format(compression))
+        if (compression == "lz4" and lz4 is None) or (compression == "zstd" and zstandard is None):
+            logger.warning("Plotter %s could not import the %s package; sending uncompressed plot data.", name, compression)
+            compression = None
         self.plot_args = plot_args
         self.full_update_interval = 0.5
         self.update_interval = 2.0 # slower for partial updates
         self.last_update = time.time()
         self.last_full_update = time.time()
 
+        # Adapt the update intervals so that sending updates, and the client rendering them (as reported
+        # in its acks), takes at most plot_budget of the time and at most plot_bandwidth bytes per second.
+        self.rate = None
+        if plot_budget is not None or plot_bandwidth is not None:
+            self.rate = AdaptiveInterval(interval=self.full_update_interval, budget=plot_budget, bandwidth=plot_bandwidth)
+
+        # Level of detail for intermediate updates. The client reports its pixel budget
+        # and any zoomed view through the plot server, which overrides these defaults.
+        self.decimation = decimation
+        self.lod = {'x_pixels': int(pixels[0]), 'y_pixels': int(pixels[1]), 'x_range': None, 'y_range': None}
+
+        # Encoding of plot payloads. Downcasting only ever applies to the plotted values, never to the axes.
+        self.compression = compression
+        self.downcast    = downcast
+
+        # Between keyframes only the changed part of the frame is sent as a patch. Keyframes
+        # are resent periodically so that late-joining clients catch up.
+        self.keyframe_interval = 10.0
+        self.last_keyframe = 0.0
+        self.keyframe_lod = None
+
+        # Serialization and sending happen on a background thread, see execute_on_run
+        self._plot_thread = None
+
         self._final_buffer = Queue()
         self.final_buffer = None
 
@@ -65,13 +241,13 @@ class Plotter(Filter):
 
             # We might be sending multiple axes, series, etc.
             # Just add them succesively to a multipart message.
-            for dat in data:
-                md = dict(
-                    dtype = str(dat.dtype),
-                    shape = dat.shape,
-                )
-                msg_contents.extend([json.dumps(md).encode(), np.ascontiguousarray(dat)])
+            # The plotted values always come last.
+            for i, dat in enumerate(data):
+                md, payload = _encode(dat, compression=self.compression, downcast=self.downcast and i == len(data)-1)
+                msg_contents.extend([json.dumps(md).encode(), payload])
             self.socket.send_multipart(msg_contents)
+            return sum(len(m) if isinstance(m, bytes) else m.nbytes for m in msg_contents)
+        return 0
 
     def get_final_plot(self, quad_funcs=[np.abs, np.angle]):
         if not self.done.is_set():
@@ -163,6 +339,7 @@ class Plotter(Filter):
         else:
             self.plot_buffer = np.nan*np.ones(self.points_before_clear)
         self.idx = 0
+        self.dirty = [0, self.points_before_clear]
 
     def execute_on_run(self):
         # Connect to the plot server
@@ -174,12 +351,136 @@ class Plotter(Filter):
                 self.socket.connect("tcp://localhost:7762")
             except:
                 logger.warning("Exception occured while contacting the plot server. Is it running?")
+            else:
+                self._snapshot     = None
+                self._plot_lock    = threading.Lock()
+                self._plot_ready   = threading.Event()
+                self._plot_stop    = threading.Event()
+                self._plot_thread  = threading.Thread(target=self.plot_loop, name=f"{self.filter_name} plotting", daemon=True)
+                self._plot_thread.start()
+
+    def plot_loop(self):
+        """Ship snapshots handed over by `update` until `stop_plotting` is called. Only the latest
+        snapshot is kept, so a slow plot server drops intermediate frames instead of stalling ingestion.
+        This thread owns the socket until it exits."""
+        while True:
+            self._plot_ready.wait(0.5)
+            with self._plot_lock:
+                snapshot, self._snapshot = self._snapshot, None
+                self._plot_ready.clear()
+            if snapshot is not None:
+                try:
+                    self.ship(*snapshot)
+                except Exception as e:
+                    logger.warning("Plotter %s could not send an update: %s", self.filter_name, e)
+            elif self._plot_stop.is_set():
+                break
+
+    def stop_plotting(self):
+        """Flush the last snapshot and join the plotting thread."""
+        if self._plot_thread is not None:
+            self._plot_stop.set()
+            self._plot_ready.set()
+            self._plot_thread.join()
+            self._plot_thread = None
+
+    def receive_client_messages(self):
+        """Apply any level of detail requests and render acks forwarded by the plot server from the client."""
+        while self.socket.poll(0):
+            msg = self.socket.recv_multipart()
+            if msg[0] == b"lod":
+                lod = json.loads(msg[1].decode())
+                self.lod.update({k: v for k, v in lod.items() if k in self.lod})
+                logger.debug("Plotter %s level of detail set to %s", self.filter_name, self.lod)
+            elif msg[0] == b"ack":
+                ack = json.loads(msg[1].decode())
+                self.adapt_update_interval("render", ack.get('render_time', 0.0))
+
+    def adapt_update_interval(self, name, seconds, nbytes=None):
+        if self.rate is not None:
+            interval = self.rate.record(name, seconds, nbytes)
+            self.full_update_interval = interval
+            self.update_interval      = 4*interval # Keep partial updates slower
+            # Let whatever feeds us know how often we can use intermediate updates
+            self.stream.update_interval.value = interval
+
+    def decimated(self, buffer):
+        """Data for an intermediate update: the client's zoomed view, if any, decimated to its pixel budget."""
+        if self.plot_dims.value == 1:
+            xs = _in_range(self.x_values, self.lod['x_range'])
+            x, data = self.x_values[xs], buffer[xs]
+            if self.decimation and data.size > self.lod['x_pixels']:
+                x, data = _decimate_1d(x, data, self.lod['x_pixels'], mode=self.decimation)
+            return [np.asarray(x), data]
+        else:
+            xs = _in_range(self.x_values, self.lod['x_range'])
+            ys = _in_range(self.y_values, self.lod['y_range'])
+            x, y = self.x_values[xs], self.y_values[ys]
+            data = buffer.reshape(len(self.y_values), len(self.x_values))[ys, xs].ravel()
+            if self.decimation and (len(x) > self.lod['x_pixels'] or len(y) > self.lod['y_pixels']):
+                x, y, data = _decimate_2d(x, y, data, self.lod['x_pixels'], self.lod['y_pixels'])
+            return [np.asarray(x), np.asarray(y), data]
+
+    def mark_dirty(self, start, stop):
+        """Record that plot_buffer[start:stop] changed since the last update."""
+        self.dirty = [min(self.dirty[0], start), max(self.dirty[1], stop)]
+
+    def patch(self, buffer, dirty):
+        """The part of the decimated frame that changed within `dirty`, as [offset, x, data] for
+        1D plots (offset in decimated points) or [offset, data] for 2D plots (offset in decimated rows).
+        Returns None when a keyframe is due or would not be much larger than the patch."""
+        if (self.lod != self.keyframe_lod or self.lod['x_range'] or self.lod['y_range'] or
+            time.time() - self.last_keyframe >= self.keyframe_interval):
+            return None
+        start, stop = dirty
 
-    def update(self):
         if self.plot_dims.value == 1:
-            self.send({'name': self.filter_name, 'msg':'data', 'data': [self.x_values, self.plot_buffer.copy()]})
-        elif self.plot_dims.value == 2:
-            self.send({'name': self.filter_name, 'msg':'data', 'data': [self.x_values, self.y_values, self.plot_buffer.copy()]})
+            num_points = self.points_before_clear
+            bin_size   = _bin_size(num_points, self.lod['x_pixels'], self.decimation)
+            per_bin    = 2 if (self.decimation == "minmax" and bin_size > 1) else 1
+            first, last = start//bin_size, -(-stop//bin_size)
+            if 2*(last - first) > -(-num_points//bin_size):
+                return None
+            x, data = _bin_1d(self.x_values[first*bin_size:last*bin_size],
+                              buffer[first*bin_size:last*bin_size], bin_size, self.decimation)
+            return [np.array([first*per_bin]), np.asarray(x), data]
+        else:
+            num_x, num_y = len(self.x_values), len(self.y_values)
+            x_size = _bin_size(num_x, self.lod['x_pixels'], self.decimation and "mean")
+            y_size = _bin_size(num_y, self.lod['y_pixels'], self.decimation and "mean")
+            first_row, last_row = start//num_x, -(-stop//num_x)
+            first, last = first_row//y_size, -(-last_row//y_size)
+            if 2*(last - first) > -(-num_y//y_size):
+                return None
+            image = buffer.reshape(num_y, num_x)[first*y_size:last*y_size]
+            return [np.array([first]), _block_mean(image, y_size, x_size).astype(buffer.dtype).ravel()]
+
+    def ship(self, buffer, dirty):
+        """Serialize and send a snapshot of the plot buffer as a patch or keyframe."""
+        self.receive_client_messages()
+        if dirty[1] > dirty[0] or time.time() - self.last_keyframe >= self.keyframe_interval:
+            start = time.perf_counter()
+            patch = self.patch(buffer, dirty)
+            if patch is None:
+                nbytes = self.send({'name': self.filter_name, 'msg':'data', 'data': self.decimated(buffer)})
+                self.last_keyframe = time.time()
+                self.keyframe_lod  = dict(self.lod)
+            else:
+                nbytes = self.send({'name': self.filter_name, 'msg':'patch', 'data': patch})
+            self.adapt_update_interval("send", time.perf_counter() - start, nbytes)
+
+    def update(self):
+        """Hand a snapshot of the plot buffer to the plotting thread, replacing any it has not sent yet."""
+        if self.do_plotting and self._plot_thread is not None:
+            buffer = self.plot_buffer.copy()
+            with self._plot_lock:
+                if self._snapshot is not None:
+                    # The dropped snapshot's changes are contained in this one
+                    dirty = self._snapshot[1]
+                    self.mark_dirty(*dirty)
+                self._snapshot = (buffer, self.dirty)
+                self._plot_ready.set()
+        self.dirty = [self.points_before_clear, 0]
 
     def process_data(self, data):
         # If we get more than enough data, pause to update the plot if necessary
@@ -191,19 +492,23 @@ class Plotter(Filter):
                 # If we are getting data quickly, then we can afford to wait
                 # for a full frame before pushing to plot.
                 self.plot_buffer[self.idx:] = data[:(self.points_before_clear-self.idx)]
+                self.mark_dirty(self.idx, self.points_before_clear)
                 self.update()
                 self.last_full_update = time.time()
             self.plot_buffer[:] = np.nan
             self.plot_buffer[:spill_over] = data[-spill_over:]
+            self.mark_dirty(0, self.points_before_clear)
             self.idx = spill_over
         else: # just keep trucking
             self.plot_buffer[self.idx:self.idx+data.size] = data.flatten()
+            self.mark_dirty(self.idx, self.idx+data.size)
             self.idx += data.size
             if (time.time() - max(self.last_full_update, self.last_update) >= self.update_interval):
                 self.update()
                 self.last_update = time.time()
 
     def on_done(self):
+        self.stop_plotting()
         if self.plot_dims.value == 1:
             self.send({'name': self.filter_name, "msg": "data", 'data': [self.x_values, self.plot_buffer.copy()], })
         elif self.plot_dims.value == 2:
@@ -0,0 +1,50 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+__all__ = ['AdaptiveInterval']
+
+class AdaptiveInterval(object):
+    """Choose how often to emit intermediate updates so that their cost stays within a budget.
+
+    The cost of each update is reported in named parts (e.g. "send" for serialization on our side
+    and "render" for the time a plot client spent drawing it), each tracked as an exponentially
+    weighted moving average. The interval is then the smallest one for which the summed cost is
+    at most `budget` of the wall time, and the bytes per update stay under `bandwidth` bytes per
+    second if given, clipped to [`min_interval`, `max_interval`]. Until costs are reported the
+    interval stays at `interval`."""
+
+    def __init__(self, interval=0.5, budget=0.1, bandwidth=None, min_interval=0.05, max_interval=10.0, smoothing=0.3):
+        super(AdaptiveInterval, self).__init__()
+        if budget is not None and not 0.0 < budget <= 1.0:
+            raise ValueError("AdaptiveInterval budget must be a fraction of time in (0, 1], got {}.".format(budget))
+        self.budget       = budget
+        self.bandwidth    = bandwidth
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing    = smoothing
+        self.costs        = {}
+        self.nbytes       = None
+        self.interval     = interval
+
+    def _average(self, old, new):
+        return new if old is None else (1.0 - self.smoothing)*old + self.smoothing*new
+
+    def record(self, name, seconds=0.0, nbytes=None):
+        """Report that the part `name` of the last update took `seconds` and/or sent `nbytes`,
+        and return the new interval."""
+        self.costs[name] = self._average(self.costs.get(name), seconds)
+        if nbytes is not None:
+            self.nbytes = self._average(self.nbytes, nbytes)
+
+        needed = 0.0
+        if self.budget is not None:
+            needed = sum(self.costs.values())/self.budget
+        if self.bandwidth and self.nbytes is not None:
+            needed = max(needed, self.nbytes/self.bandwidth)
+        self.interval = min(max(needed, self.min_interval), self.max_interval)
+        return self.interval
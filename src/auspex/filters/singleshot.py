@@ -9,10 +9,11 @@
 __all__ = ['SingleShotMeasurement']
 
 import numpy as np
-from scipy.signal import hilbert
+from scipy.signal import hilbert, fftconvolve
 from scipy.stats import gaussian_kde, norm
 from scipy.special import betaincinv
-from sklearn.linear_model import LogisticRegressionCV
+from sklearn.linear_model import LogisticRegression, LogisticRegressionCV
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 import os
 import sys
@@ -23,12 +24,132 @@ else:
     from multiprocessing import Queue
 
 from .filter import Filter
+from .buffers import RecordBuffer
 from auspex.parameter import Parameter, FloatParameter, IntParameter, BoolParameter
 from auspex.stream import DataStreamDescriptor, InputConnector, OutputConnector, SweepAxis, DataAxis
 from auspex.log import logger
 import auspex.config as config
 import time
 
+def _histogram_fidelities(ground, excited, num_bins=100):
+    """Histogram separation of the integrated ground and excited shots at every time point.
+
+    `ground` and `excited` are (T, N)-shaped. At each time point both are histogrammed on
+    `num_bins` edges spanning their joint range, as `np.histogram` would, and the normalized
+    L1 distance between the two histograms is returned. All time points are binned at once
+    with a single `np.bincount`."""
+    num_times = ground.shape[0]
+    nb        = num_bins - 1
+    lo        = np.minimum(np.amin(ground, axis=1), np.amin(excited, axis=1))[:, np.newaxis]
+    span      = np.maximum(np.amax(ground, axis=1), np.amax(excited, axis=1))[:, np.newaxis] - lo
+    scale     = np.divide(nb, span, out=np.zeros_like(span), where=span > 0)
+    offsets   = (np.arange(num_times) * nb)[:, np.newaxis]
+
+    def counts(x):
+        idx = ((x - lo) * scale).astype(np.int64)
+        # The right-most edge belongs to the last bin
+        np.clip(idx, 0, nb-1, out=idx)
+        idx += offsets
+        return np.bincount(idx.ravel(), minlength=num_times*nb).reshape(num_times, nb)
+
+    g_counts = counts(ground)
+    e_counts = counts(excited)
+    return np.sum(np.abs(g_counts - e_counts), axis=1) / np.sum(g_counts + e_counts, axis=1)
+
+def _binned_kde(samples, points, grid_size=2048):
+    """Gaussian kernel density estimate of `samples` evaluated at `points`, using the same
+    Scott's rule bandwidth as `scipy.stats.gaussian_kde`. The samples are linearly binned onto
+    a regular grid and convolved with the kernel by FFT, so the cost is O(N + G log G) rather
+    than O(N * len(points))."""
+    samples   = np.asarray(samples, dtype=np.float64)
+    bandwidth = np.std(samples, ddof=1) * samples.size**(-0.2)
+    if not bandwidth > 0:
+        return gaussian_kde(samples)(points)
+
+    lo    = min(np.amin(samples), np.amin(points)) - 4*bandwidth
+    hi    = max(np.amax(samples), np.amax(points)) + 4*bandwidth
+    delta = (hi - lo) / (grid_size - 1)
+
+    # Linear binning: split each sample between its two neighbouring grid points
+    pos     = (samples - lo) / delta
+    left    = np.minimum(pos.astype(np.int64), grid_size - 2)
+    frac    = pos - left
+    weights = np.bincount(left, weights=1.0-frac, minlength=grid_size) + \
+              np.bincount(left+1, weights=frac, minlength=grid_size)
+
+    half   = min(int(np.ceil(4*bandwidth/delta)), grid_size - 1)
+    offset = np.arange(-half, half+1) * delta
+    kernel = np.exp(-0.5*(offset/bandwidth)**2) / (np.sqrt(2*np.pi) * bandwidth)
+    pdf    = fftconvolve(weights, kernel, mode='same') / samples.size
+
+    grid = lo + delta*np.arange(grid_size)
+    return np.interp(points, grid, np.maximum(pdf, 0.0))
+
+class _RunningMoments(object):
+    """Running mean and variance of the real and imaginary parts of every time point of a
+    record, merged a batch of shots at a time (Chan et al.'s parallel update). Memory scales
+    with the record length but not with the number of shots.
+
+    The full covariance between time points, whose memory scales with the square of the
+    record length, is only kept with `covariance` set. Without it, integrated variances
+    treat different time points as independent."""
+
+    def __init__(self, length, covariance=False):
+        super(_RunningMoments, self).__init__()
+        self.length = length
+        self.stacked_mean = np.zeros(2*length)
+        self.m2_diag      = np.zeros(2*length) # Squared deviations of the real, then imaginary parts
+        self.m2_cross     = np.zeros(length)   # Products of the real and imaginary deviations
+        self.m2           = np.zeros((2*length, 2*length)) if covariance else None
+        self.count        = 0
+
+    def reset(self):
+        self.stacked_mean[:] = 0.0
+        self.m2_diag[:]      = 0.0
+        self.m2_cross[:]     = 0.0
+        if self.m2 is not None:
+            self.m2[:] = 0.0
+        self.count           = 0
+
+    def update(self, shots):
+        """Add the (N, T)-shaped complex `shots` to the statistics."""
+        num = shots.shape[0]
+        if num == 0:
+            return
+        T          = self.length
+        stacked    = np.hstack([np.real(shots), np.imag(shots)])
+        batch_mean = np.mean(stacked, axis=0)
+        deviation  = stacked - batch_mean
+        delta      = batch_mean - self.stacked_mean
+        total      = self.count + num
+        weight     = self.count*num/total
+        self.m2_diag  += np.sum(deviation**2, axis=0) + delta**2 * weight
+        self.m2_cross += np.sum(deviation[:, :T]*deviation[:, T:], axis=0) + delta[:T]*delta[T:] * weight
+        if self.m2 is not None:
+            self.m2 += np.dot(deviation.T, deviation) + np.outer(delta, delta) * weight
+        self.stacked_mean += delta * (num/total)
+        self.count = total
+
+    @property
+    def mean(self):
+        return self.stacked_mean[:self.length] + 1j*self.stacked_mean[self.length:]
+
+    def var(self, ddof=1):
+        """Variance of the complex values at each time point, as np.var would compute it."""
+        return (self.m2_diag[:self.length] + self.m2_diag[self.length:]) / (self.count - ddof)
+
+    def integrated_var(self, weights, ddof=1):
+        """Variance of the sum of `weights` times the stacked real and imaginary parts,
+        for the sum truncated after each time point."""
+        T = self.length
+        if self.m2 is None:
+            wr, wi = weights[:T], weights[T:]
+            per_point = wr**2 * self.m2_diag[:T] + wi**2 * self.m2_diag[T:] + 2*wr*wi*self.m2_cross
+            return np.cumsum(per_point) / (self.count - ddof)
+        P = np.outer(weights, weights) * self.m2 / (self.count - ddof)
+        P = P[:T, :T] + P[:T, T:] + P[T:, :T] + P[T:, T:]
+        return np.diagonal(np.cumsum(np.cumsum(P, axis=0), axis=1)).copy()
+
 class SingleShotMeasurement(Filter):
 
     save_kernel = BoolParameter(default=False)
@@ -44,8 +165,43 @@ class SingleShotMeasurement(Filter):
 
     def __init__(self, save_kernel=False, optimal_integration_time=False,
                     zero_mean=False, set_threshold=False,
-                    logistic_regression=False, **kwargs):
+                    logistic_regression=False, time_chunk_size=64,
+                    integration_time_workers=1, density_estimator="kde",
+                    incremental=False, logistic_mode="full", logistic_components=4,
+                    logistic_max_cv_shots=2000, logistic_cv_interval=0, **kwargs):
         super(SingleShotMeasurement, self).__init__(**kwargs)
+        # "full" fits the logistic regression on every time point of every shot in the
+        # filter loop. "fast" reduces each shot to its kernel-integrated value plus
+        # `logistic_components` principal components, and fits on a background thread,
+        # warm starting from the previous sweep point. The reduction and the regularization
+        # (cross-validated on at most `logistic_max_cv_shots` stratified shots) are only
+        # chosen at the first sweep point, or every `logistic_cv_interval` points if set,
+        # so that the warm starts happen in the same feature basis.
+        if logistic_mode not in ("full", "fast"):
+            raise ValueError("Unknown logistic mode '{}', expected 'full' or 'fast'.".format(logistic_mode))
+        self.logistic_mode            = logistic_mode
+        self.logistic_components      = logistic_components
+        self.logistic_max_cv_shots    = logistic_max_cv_shots
+        self.logistic_cv_interval     = logistic_cv_interval
+        self._logistic_model          = None
+        self._logistic_pool           = None
+        self._logistic_future         = None # The fit whose results the current pdf_data waits for
+        self._logistic_points         = 0
+        self._reduction               = None # Frozen kernel, projection and scaling of the fast mode features
+        # In incremental mode only the means and variances of the ground and excited
+        # records are kept, and the fidelity follows from a Gaussian model of the shots.
+        # Time points are then treated as independent, unless optimal_integration_time
+        # is set, in which case the full covariance between them is kept.
+        self.incremental              = incremental
+        # How the shot histograms are smoothed: "kde" uses scipy's gaussian_kde,
+        # "binned" a much faster FFT-convolved linear binning with the same bandwidth.
+        if density_estimator not in ("kde", "binned"):
+            raise ValueError("Unknown density estimator '{}', expected 'kde' or 'binned'.".format(density_estimator))
+        self.density_estimator        = density_estimator
+        # Time points binned together in the optimal integration time search, and
+        # the number of threads those chunks are spread over.
+        self.time_chunk_size          = time_chunk_size
+        self.integration_time_workers = integration_time_workers
         if len(kwargs) > 0:
             self.save_kernel.value = save_kernel
             self.optimal_integration_time.value = optimal_integration_time
@@ -71,8 +227,9 @@ class SingleShotMeasurement(Filter):
             raise ValueError("Single shot filter sink does not appear to have a time axis!")
         self.num_averages = len(self.sink.descriptor.axes[self.descriptor.axis_num("averages")].points)
         self.num_segments = len(self.sink.descriptor.axes[self.descriptor.axis_num("segment")].points)
-        self.ground_data = np.zeros((self.record_length, self.num_averages), dtype=np.complex)
-        self.excited_data = np.zeros((self.record_length, self.num_averages), dtype=np.complex)
+        if not self.incremental:
+            self.ground_data = np.zeros((self.record_length, self.num_averages), dtype=np.complex128)
+            self.excited_data = np.zeros((self.record_length, self.num_averages), dtype=np.complex128)
         self.total_points = self.num_segments*self.record_length*self.num_averages # Total points BEFORE sweep axes
 
         output_descriptor = DataStreamDescriptor()
@@ -89,12 +246,24 @@ class SingleShotMeasurement(Filter):
 
 
     def final_init(self):
-        self.fid_buffer = np.empty(self.record_length*self.num_averages*self.num_segments, dtype=np.complex)
+        if self.incremental:
+            self.buffer          = RecordBuffer(self.record_length, dtype=np.complex128)
+            # Only the integration time search needs the correlations between time points
+            covariance = self.optimal_integration_time.value
+            self.ground_moments  = _RunningMoments(self.record_length, covariance=covariance)
+            self.excited_moments = _RunningMoments(self.record_length, covariance=covariance)
+            self.record_idx      = 0
+        else:
+            self.fid_buffer = np.empty(self.record_length*self.num_averages*self.num_segments, dtype=np.complex128)
         self.idx = 0
 
     def process_data(self, data):
         """Fill the ground and excited data bins"""
 
+        if self.incremental:
+            self.process_records(data)
+            return
+
         self.fid_buffer[self.idx:self.idx+len(data)] = data
         self.idx += len(data)
 
@@ -106,10 +275,41 @@ class SingleShotMeasurement(Filter):
             self.compute_filter()
             if self.logistic_regression.value:
                 self.logistic_fidelity()
-            if self.save_kernel.value:
-                self._save_kernel()
-            for os in self.fidelity.output_streams:
-                os.push(self.fidelity_result)
+            self.publish_results()
+
+    def process_records(self, data):
+        """Fold whole records into the running ground and excited statistics. Records
+        alternate between ground and excited shots."""
+        records_per_block = self.num_averages*self.num_segments
+        for block in self.buffer.assemble(data):
+            records = np.reshape(block, (-1, self.record_length))
+            while records.shape[0] > 0:
+                num = min(records.shape[0], records_per_block - self.record_idx)
+                first = self.record_idx % 2
+                self.ground_moments.update(records[first:num:2])
+                self.excited_moments.update(records[1-first:num:2])
+                self.record_idx += num
+                records = records[num:]
+
+                if self.record_idx == records_per_block:
+                    self.record_idx = 0
+                    self.compute_filter_from_moments()
+                    if self.logistic_regression.value:
+                        logger.warning("Logistic regression needs every shot and is skipped in incremental mode.")
+                    self.publish_results()
+                    self.ground_moments.reset()
+                    self.excited_moments.reset()
+
+    def publish_results(self):
+        if self.save_kernel.value:
+            self._save_kernel()
+        for os in self.fidelity.output_streams:
+            os.push(self.fidelity_result)
+        if self._logistic_future is not None:
+            # Send the PDF data along once the background fit has added its results
+            self._logistic_future.add_done_callback(lambda f, pdf_data=self.pdf_data: self.pdf_data_queue.put(pdf_data))
+            self._logistic_future = None
+        else:
             self.pdf_data_queue.put(self.pdf_data)
 
     def compute_filter(self):
@@ -125,27 +325,7 @@ class SingleShotMeasurement(Filter):
             excited_mean = np.mean(self.excited_data, axis=1)
         except AttributeError:
             raise Exception("Single shot filter does not appear to have any data!")
-        distance = np.abs(np.mean(ground_mean - excited_mean))
-        bias = np.mean(ground_mean + excited_mean) / distance
-        logger.debug("Found single-shot measurement distance: {} and bias {}.".format(distance, bias))
-        #construct matched filter kernel
-        old_settings = np.seterr(divide='ignore', invalid='ignore')
-        kernel = np.nan_to_num(np.divide(np.conj(ground_mean - excited_mean), np.var(self.ground_data, ddof=1, axis=1)))
-        np.seterr(**old_settings)
-        #sets kernel to zero when difference is too small, and prevents
-        #kernel from diverging when var->0 at beginning of record_length
-        kernel = np.multiply(kernel, np.greater(np.abs(ground_mean - excited_mean), self.TOLERANCE * distance))
-        #subtract offset to cancel low-frequency fluctuations when integrating
-        #raw data (not demod)
-        if self.zero_mean.value:
-            kernel = kernel - np.mean(kernel)
-        logger.debug("Found single shot filter norm: {}.".format(np.sum(np.abs(kernel))))
-        #annoyingly numpy's isreal has the opposite behavior to MATLAB's
-        if not np.any(np.imag(kernel) > np.finfo(np.complex128).eps):
-            #construct analytic signal from Hilbert transform
-            kernel = hilbert(np.real(kernel))
-        #normalize between -1 and 1
-        kernel = kernel / np.amax(np.hstack([np.abs(np.real(kernel)), np.abs(np.imag(kernel))]))
+        kernel = self.matched_kernel(ground_mean, excited_mean, np.var(self.ground_data, ddof=1, axis=1))
         #apply matched filter
         weighted_ground = self.ground_data * kernel[:, np.newaxis]
         weighted_excited = self.excited_data * kernel[:, np.newaxis]
@@ -163,23 +343,16 @@ class SingleShotMeasurement(Filter):
             I_mins = np.amin(np.minimum(int_ground_I, int_excited_I), axis=1)
             I_maxes = np.amax(np.maximum(int_ground_I, int_excited_I), axis=1)
             num_times = int_ground_I.shape[0]
-            fidelities = np.zeros((num_times, ))
-            #Loop through each integration point; estimate the CDF and
+            #Estimate the PDF at each integration point and
             #then calculate best measurement fidelity
-            for pt in range(num_times):
-                bins = np.linspace(I_mins[pt], I_maxes[pt], 100)
-                g_PDF = np.histogram(int_ground_I[pt, :], bins)[0]
-                e_PDF = np.histogram(int_excited_I[pt,:], bins)[0]
-                fidelities[pt] = np.sum(np.abs(g_PDF - e_PDF)) / np.sum(g_PDF + e_PDF)
+            fidelities = self.integration_time_fidelities(int_ground_I, int_excited_I)
             best_idx = fidelities.argmax(axis=0)
             self.best_integration_time = best_idx
             logger.info("Found best integration time at {} out of {} decimated points.".format(best_idx, num_times))
             #redo calculation with KDEs to get a more accurate estimate
             bins = np.linspace(I_mins[best_idx], I_maxes[best_idx], 100)
-            g_KDE = gaussian_kde(int_ground_I[best_idx, :])
-            e_KDE = gaussian_kde(int_excited_I[best_idx, :])
-            g_PDF = g_KDE(bins)
-            e_PDF = e_KDE(bins)
+            g_PDF = self.density(int_ground_I[best_idx, :], bins)
+            e_PDF = self.density(int_excited_I[best_idx, :], bins)
         else:
             ground_I = np.sum(np.real(weighted_ground), axis=0)
             ground_Q = np.sum(np.imag(weighted_excited), axis=0)
@@ -188,10 +361,8 @@ class SingleShotMeasurement(Filter):
             I_min = np.amin(np.minimum(ground_I, excited_I))
             I_max = np.amax(np.maximum(ground_I, excited_I))
             bins = np.linspace(I_min, I_max, 100)
-            g_KDE = gaussian_kde(ground_I)
-            e_KDE = gaussian_kde(excited_I)
-            g_PDF = g_KDE(bins)
-            e_PDF = e_KDE(bins)
+            g_PDF = self.density(ground_I, bins)
+            e_PDF = self.density(excited_I, bins)
 
         self.kernel = kernel
         max_F_I = 1 - 0.5 * (1 - 0.5 * (bins[2] - bins[1]) * np.sum(np.abs(g_PDF - e_PDF)))
@@ -201,10 +372,7 @@ class SingleShotMeasurement(Filter):
                          "Excited I PDF": e_PDF}
 
         if self.set_threshold.value:
-            indmax = (np.abs(np.cumsum(g_PDF / np.sum(g_PDF))
-                        - np.cumsum(e_PDF / np.sum(e_PDF)))).argmax(axis=0)
-            self.pdf_data["I Threshold"] = bins[indmax]
-            logger.info("Single shot kernel found I threshold at {}.".format(bins[indmax]))
+            self.compute_threshold()
 
         if self.optimal_integration_time.value:
             mu_g, sigma_g = norm.fit(int_ground_I[best_idx, :])
@@ -220,15 +388,13 @@ class SingleShotMeasurement(Filter):
             Q_min = np.amin([int_ground_Q[best_idx,:], int_excited_Q[best_idx,:]])
             Q_max = np.argmax([int_ground_Q[best_idx,:], int_excited_Q[best_idx,:]])
             qbins = np.linspace(Q_min, Q_max, 100)
-            g_KDE = gaussian_kde(int_ground_Q[best_idx, :])
-            e_KDE = gaussian_kde(int_excited_Q[best_idx, :])
+            g_PDF_Q = self.density(int_ground_Q[best_idx, :], qbins)
+            e_PDF_Q = self.density(int_excited_Q[best_idx, :], qbins)
         else:
             qbins = np.linspace(np.amin([ground_Q, excited_Q]), np.amax([ground_Q, excited_Q]), 100)
-            g_KDE = gaussian_kde(ground_Q)
-            e_KDE = gaussian_kde(excited_Q)
+            g_PDF_Q = self.density(ground_Q, qbins)
+            e_PDF_Q = self.density(excited_Q, qbins)
         self.pdf_data["Q Bins"] = qbins
-        g_PDF_Q = g_KDE(qbins)
-        e_PDF_Q = e_KDE(qbins)
         self.pdf_data["Ground Q PDF"] =  g_PDF_Q
         self.pdf_data["Excited Q PDF"] =  e_PDF_Q
         self.pdf_data["Max Q Fidelity"] = 1 - 0.5 * (1 - 0.5 * (qbins[2] - qbins[1]) * np.sum(np.abs(g_PDF_Q - e_PDF_Q)))
@@ -245,7 +411,128 @@ class SingleShotMeasurement(Filter):
         self.fidelity_result = self.pdf_data["Max I Fidelity"] + 1j * self.pdf_data["Max Q Fidelity"]
         logger.info("Single shot fidelity filter found: {}".format(self.fidelity_result))
 
+    def matched_kernel(self, ground_mean, excited_mean, ground_var):
+        """Matched filter kernel from the per time point ground and excited means and the
+        ground state variance."""
+        distance = np.abs(np.mean(ground_mean - excited_mean))
+        bias = np.mean(ground_mean + excited_mean) / distance
+        logger.debug("Found single-shot measurement distance: {} and bias {}.".format(distance, bias))
+        #construct matched filter kernel
+        old_settings = np.seterr(divide='ignore', invalid='ignore')
+        kernel = np.nan_to_num(np.divide(np.conj(ground_mean - excited_mean), ground_var))
+        np.seterr(**old_settings)
+        #sets kernel to zero when difference is too small, and prevents
+        #kernel from diverging when var->0 at beginning of record_length
+        kernel = np.multiply(kernel, np.greater(np.abs(ground_mean - excited_mean), self.TOLERANCE * distance))
+        #subtract offset to cancel low-frequency fluctuations when integrating
+        #raw data (not demod)
+        if self.zero_mean.value:
+            kernel = kernel - np.mean(kernel)
+        logger.debug("Found single shot filter norm: {}.".format(np.sum(np.abs(kernel))))
+        #annoyingly numpy's isreal has the opposite behavior to MATLAB's
+        if not np.any(np.imag(kernel) > np.finfo(np.complex128).eps):
+            #construct analytic signal from Hilbert transform
+            kernel = hilbert(np.real(kernel))
+        #normalize between -1 and 1
+        kernel = kernel / np.amax(np.hstack([np.abs(np.real(kernel)), np.abs(np.imag(kernel))]))
+        return kernel
+
+    def compute_filter_from_moments(self):
+        """Compute the single shot kernel and fidelity from the running ground and excited
+        statistics alone. The integrated shots are modelled as Gaussian, with means and
+        variances following from the accumulated statistics (exactly when the covariance
+        between time points is kept), so the PDFs stored in `pdf_data` are the Gaussian ones."""
+        g, e   = self.ground_moments, self.excited_moments
+        kernel = self.matched_kernel(g.mean, e.mean, g.var())
+        kr, ki = np.real(kernel), np.imag(kernel)
+
+        # Integrated mean and variance of each quadrature, up to every time point
+        int_stats = {}
+        for name, m in [("Ground", g), ("Excited", e)]:
+            weighted = kernel * m.mean
+            int_stats[name] = {
+                "I": (np.cumsum(np.real(weighted)), m.integrated_var(np.hstack([kr, -ki]))),
+                "Q": (np.cumsum(np.imag(weighted)), m.integrated_var(np.hstack([ki, kr])))}
+
+        if self.optimal_integration_time.value:
+            (mu_g, var_g), (mu_e, var_e) = int_stats["Ground"]["I"], int_stats["Excited"]["I"]
+            old_settings = np.seterr(divide='ignore', invalid='ignore')
+            separation   = np.nan_to_num(np.abs(mu_g - mu_e) / (np.sqrt(np.abs(var_g)) + np.sqrt(np.abs(var_e))))
+            np.seterr(**old_settings)
+            idx = separation.argmax()
+            self.best_integration_time = idx
+            logger.info("Found best integration time at {} out of {} decimated points.".format(idx, self.record_length))
+        else:
+            idx = -1
+
+        self.kernel   = kernel
+        self.pdf_data = {}
+        for quad in ["I", "Q"]:
+            mu_g, sigma_g = int_stats["Ground"][quad][0][idx], np.sqrt(int_stats["Ground"][quad][1][idx])
+            mu_e, sigma_e = int_stats["Excited"][quad][0][idx], np.sqrt(int_stats["Excited"][quad][1][idx])
+            bins  = np.linspace(min(mu_g - 4*sigma_g, mu_e - 4*sigma_e), max(mu_g + 4*sigma_g, mu_e + 4*sigma_e), 100)
+            g_PDF = norm.pdf(bins, mu_g, sigma_g)
+            e_PDF = norm.pdf(bins, mu_e, sigma_e)
+            self.pdf_data[quad + " Bins"] = bins
+            self.pdf_data["Ground {} PDF".format(quad)] = g_PDF
+            self.pdf_data["Excited {} PDF".format(quad)] = e_PDF
+            self.pdf_data["Ground {} Gaussian PDF".format(quad)] = g_PDF
+            self.pdf_data["Excited {} Gaussian PDF".format(quad)] = e_PDF
+            self.pdf_data["Max {} Fidelity".format(quad)] = 1 - 0.5 * (1 - 0.5 * (bins[2] - bins[1]) * np.sum(np.abs(g_PDF - e_PDF)))
+
+        if self.set_threshold.value:
+            self.compute_threshold()
+
+        self.fidelity_result = self.pdf_data["Max I Fidelity"] + 1j * self.pdf_data["Max Q Fidelity"]
+        logger.info("Single shot fidelity filter found: {}".format(self.fidelity_result))
+
+    def density(self, samples, bins):
+        """Estimate the PDF of `samples` at `bins` with the selected density estimator."""
+        if self.density_estimator == "binned":
+            return _binned_kde(samples, bins)
+        return gaussian_kde(samples)(bins)
+
+    def compute_threshold(self):
+        """Find the I threshold that best separates the ground and excited PDFs. Only the
+        PDFs already stored in `pdf_data` by `compute_filter` are used, so the threshold can
+        be updated without re-estimating them."""
+        try:
+            bins  = self.pdf_data["I Bins"]
+            g_PDF = self.pdf_data["Ground I PDF"]
+            e_PDF = self.pdf_data["Excited I PDF"]
+        except AttributeError:
+            raise Exception("Single shot filter has not computed any PDFs yet!")
+        indmax = (np.abs(np.cumsum(g_PDF / np.sum(g_PDF))
+                    - np.cumsum(e_PDF / np.sum(e_PDF)))).argmax(axis=0)
+        self.pdf_data["I Threshold"] = bins[indmax]
+        logger.info("Single shot kernel found I threshold at {}.".format(bins[indmax]))
+        return bins[indmax]
+
+    def integration_time_fidelities(self, int_ground_I, int_excited_I):
+        """Histogram fidelity at every integration time, computed in chunks of
+        `time_chunk_size` time points, optionally on `integration_time_workers` threads."""
+        num_times = int_ground_I.shape[0]
+        chunks    = [slice(i, i+self.time_chunk_size) for i in range(0, num_times, self.time_chunk_size)]
+        fidelities = lambda s: _histogram_fidelities(int_ground_I[s], int_excited_I[s])
+        if self.integration_time_workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=self.integration_time_workers) as pool:
+                return np.concatenate(list(pool.map(fidelities, chunks)))
+        return np.concatenate([fidelities(s) for s in chunks])
+
     def logistic_fidelity(self):
+        if self.logistic_mode == "fast":
+            # Only the (small) reduced features are handed over, since the shot
+            # buffers are overwritten by the next block while the fit runs.
+            refit = self._reduction is None or (self.logistic_cv_interval > 0 and
+                                                self._logistic_points % self.logistic_cv_interval == 0)
+            features, state = self.reduced_features(refit=refit)
+            self._logistic_points += 1
+            if self._logistic_pool is None:
+                self._logistic_pool = ThreadPoolExecutor(max_workers=1)
+            self._logistic_future = self._logistic_pool.submit(self._fit_reduced_logistic, features, state,
+                                                               self.pdf_data, refit)
+            return
+
         #group data and assign state labels
         gnd_features = np.hstack([np.real(self.ground_data.T),
                                 np.imag(self.ground_data.T)])
@@ -262,8 +549,76 @@ class SingleShotMeasurement(Filter):
         #This is set up to be as consistent with the MATLAB implementation
         #as I can make it. --GJR
         Cs = np.logspace(-1,2,5)
-        logreg = LogisticRegressionCV(Cs, cv=3, solver='liblinear')
+        logreg = LogisticRegressionCV(Cs=Cs, cv=3, solver='liblinear')
         logreg.fit(features, state) #fit the model
+        self._report_logistic(logreg, features, state, self.pdf_data)
+
+    def reduced_features(self, refit=False):
+        """Reduce every ground and excited shot to a few features: the real and imaginary
+        parts of its integral against the matched filter kernel, followed by its projection
+        onto the leading `logistic_components` principal components of the shots. Features
+        are standardized, and returned with the state labels.
+
+        The kernel, components and standardization are fitted on the first call, or when
+        `refit` is set, and reused otherwise so that features of different sweep points
+        live in the same basis."""
+        shots = np.hstack([self.ground_data, self.excited_data]).T
+        state = np.hstack([np.zeros(self.ground_data.shape[1]), np.ones(self.excited_data.shape[1])])
+
+        if refit or self._reduction is None:
+            reduction = {'kernel': self.kernel.copy(), 'center': None, 'components': None}
+            if self.logistic_components > 0:
+                stacked = np.hstack([np.real(shots), np.imag(shots)])
+                sample  = stacked[self._stratified_subsample(state)]
+                center  = np.mean(sample, axis=0)
+                _, _, vt = np.linalg.svd(sample - center, full_matrices=False)
+                components = vt[:self.logistic_components]
+                # Fix the arbitrary sign of each component so refits see consistent features
+                signs = np.sign(components[np.arange(components.shape[0]), np.argmax(np.abs(components), axis=1)])
+                reduction['center']     = center
+                reduction['components'] = components * signs[:, np.newaxis]
+            features = self._project(shots, reduction)
+            scale    = np.std(features, axis=0)
+            scale[scale == 0] = 1.0
+            reduction['mean']  = np.mean(features, axis=0)
+            reduction['scale'] = scale
+            self._reduction = reduction
+        else:
+            features = self._project(shots, self._reduction)
+        return (features - self._reduction['mean']) / self._reduction['scale'], state
+
+    @staticmethod
+    def _project(shots, reduction):
+        integral = np.dot(shots, reduction['kernel'])
+        features = [np.real(integral)[:, np.newaxis], np.imag(integral)[:, np.newaxis]]
+        if reduction['components'] is not None:
+            stacked = np.hstack([np.real(shots), np.imag(shots)])
+            features.append(np.dot(stacked - reduction['center'], reduction['components'].T))
+        return np.hstack(features)
+
+    def _stratified_subsample(self, state):
+        """Indices of at most `logistic_max_cv_shots` shots, drawn evenly from both states."""
+        if len(state) <= self.logistic_max_cv_shots:
+            return np.arange(len(state))
+        per_state = self.logistic_max_cv_shots // 2
+        return np.sort(np.concatenate([np.random.choice(np.flatnonzero(state == s), min(per_state, np.sum(state == s)), replace=False)
+                                       for s in (0, 1)]))
+
+    def _fit_reduced_logistic(self, features, state, pdf_data, refit):
+        try:
+            if refit or self._logistic_model is None:
+                # New feature basis: pick the regularization on a stratified subsample
+                subsample = self._stratified_subsample(state)
+                Cs = np.logspace(-1,2,5)
+                cv = LogisticRegressionCV(Cs=Cs, cv=3, solver='lbfgs')
+                cv.fit(features[subsample], state[subsample])
+                self._logistic_model = LogisticRegression(solver='lbfgs', warm_start=True, C=cv.C_[0])
+            self._logistic_model.fit(features, state)
+            self._report_logistic(self._logistic_model, features, state, pdf_data)
+        except Exception as e:
+            logger.warning("Logistic regression fidelity for {} failed: {}".format(self, e))
+
+    def _report_logistic(self, logreg, features, state, pdf_data):
         predictions = logreg.predict(features) #in-place classification
         score = logreg.score(features,state) #mean accuracy of classification
         N = len(predictions)
@@ -274,6 +629,14 @@ class SingleShotMeasurement(Filter):
         fhi = betaincinv(S+1, N-S+1, (1+c)/2., )
         logger.info(("In-place logistic regression fidelity: " +
                 "{:.2f}% ({:.2f}, {:.2f})".format(100*score, 100*flo, 100*fhi)))
+        pdf_data["Logistic Fidelity"] = score
+        pdf_data["Logistic Fidelity Interval"] = (flo, fhi)
+
+    def on_done(self):
+        # Let any background logistic fit finish before the process exits
+        if self._logistic_pool is not None:
+            self._logistic_pool.shutdown(wait=True)
+            self._logistic_pool = None
 
     def _save_kernel(self):
         import QGL.config as qconfig
@@ -19,26 +19,11 @@ import sys
 
 from auspex.log import logger
 import auspex.config as config
-from .instrument import Instrument, ReceiverChannel
+from .instrument import Instrument, ReceiverChannel, ReceiveBufferPool
+from .emulator import DigitizerEmulator
 from unittest.mock import MagicMock
 
-from multiprocessing import Value
-
-# win32 doesn't support MSG_WAITALL, so on windows we
-# need to do things a slower, less efficient way.
-# (we could optimize this, if performance becomes a problem)
-#
-if sys.platform == 'win32':
-    def sock_recvall(s, data_len):
-        buf = bytearray()
-        while data_len > 0:
-            new = s.recv(data_len)
-            data_len -= len(new)
-            buf.extend(new)
-        return bytes(buf)
-else:
-    def sock_recvall(s, data_len):
-        return s.recv(data_len, socket.MSG_WAITALL)
+from multiprocessing import Value, Condition
 
 class X6Channel(ReceiverChannel):
     """Channel for an X6"""
@@ -105,11 +90,15 @@ class X6(Instrument):
         self.name          = name
 
         self.last_timestamp = Value('d', datetime.datetime.now().timestamp())
+        self.total_received = Value('d', 0)
+        self.points_expected = Value('d', float('inf')) # Set for each acquisition
 
         self.gen_fake_data        = gen_fake_data
         self.increment_ideal_data = False
         self.ideal_counter        = 0
         self.ideal_data           = None
+        self.emulator_settings    = None
+        self.data_received        = Condition() # Notified by the receivers once all of the data has arrived
 
         self.timeout = 10.0
 
@@ -136,7 +125,6 @@ class X6(Instrument):
             self.resource_name = resource_name
 
         # pass thru functions
-        self.acquire    = self._lib.acquire
         self.stop       = self._lib.stop
         # self.disconnect = self._lib.disconnect
 
@@ -203,6 +191,25 @@ class X6(Instrument):
     def data_available(self):
         return self._lib.get_data_available()
 
+    def acquire(self):
+        self.total_received.value  = 0
+        self.points_expected.value = self.points_per_acquisition()
+        self._lib.acquire()
+
+    def record_points(self, channel):
+        """How many points the channel's stream carries per record."""
+        if channel.stream_type == "integrated":
+            return 1
+        elif channel.stream_type == "demodulated":
+            return int(self._lib.record_length/32)
+        return int(self._lib.record_length/4)
+
+    def points_per_acquisition(self):
+        return sum(self.record_points(chan) for chan in self._chan_to_rsocket) * self._lib.nbr_segments * self._lib.nbr_round_robins
+
+    def all_received(self):
+        return self.total_received.value >= self.points_expected.value
+
     def done(self):
         if self.data_available():
             return False
@@ -266,36 +273,67 @@ class X6(Instrument):
 
         return total
 
+    def emulate(self, rate=None, noise=0.1, noise_type="uniform", state_values=None, state_probabilities=None,
+                round_robins_per_message=1):
+        """Generate fake data with a vectorized DigitizerEmulator process instead of record by record, to
+        load test the pipeline at up to `rate` records per second per channel. See `emulate_records` for
+        the noise and qubit state mixture settings. Call with `rate=False` to go back to the original
+        fake data."""
+        if rate is False:
+            self.emulator_settings = None
+            return
+        self.gen_fake_data = True
+        self.emulator_settings = dict(rate=rate, round_robins_per_message=round_robins_per_message,
+                                      noise=noise, noise_type=noise_type, state_values=state_values,
+                                      state_probabilities=state_probabilities)
+
+    def fake_ideal_data(self):
+        """The ideal value of each segment for the current fake acquisition, if any."""
+        if self.ideal_data is None:
+            return None
+        if hasattr(self, 'exp_step') and self.increment_ideal_data:
+            raise Exception("Cannot use both exp_step and increment_ideal_data")
+        elif hasattr(self, 'exp_step'):
+            return self.ideal_data[self.exp_step]
+        elif self.increment_ideal_data:
+            return self.ideal_data[self.ideal_counter]
+        return self.ideal_data
+
+    def start_emulator(self, round_robins, segments, channels):
+        settings = dict(self.emulator_settings, ideal=self.fake_ideal_data())
+        rate, per_message = settings.pop('rate'), settings.pop('round_robins_per_message')
+        emulator = DigitizerEmulator([(wsock, dict(chan_settings, **settings)) for wsock, chan_settings in channels],
+                                     round_robins, segments, rate=rate, round_robins_per_message=per_message)
+        emulator.start()
+        return emulator, sum(emulator.points_per_channel())
+
     def receive_data(self, channel, oc, exit, ready, run):
         try:
             sock = self._chan_to_rsocket[channel]
             sock.settimeout(2)
             self.last_timestamp.value = datetime.datetime.now().timestamp()
             total = 0
+            pool = ReceiveBufferPool()
             ready.value += 1
 
             logger.debug(f"{self} receiver launched with pid {os.getpid()}. ppid {os.getppid()}")
             while not exit.is_set():
                 # push data from a socket into an OutputConnector (oc)
                 # wire format is just: [size, buffer...]
-                # TODO receive 4 or 8 bytes depending on sizeof(size_t)
                 run.wait() # Block until we are running again
-                try:
-                    msg = sock.recv(8)
-                    self.last_timestamp.value = datetime.datetime.now().timestamp()
-                except:
+                data = pool.receive(sock, channel.dtype)
+                if data is None:
                     continue
-
-                # reinterpret as int (size_t)
-                msg_size = struct.unpack('n', msg)[0]
-                buf = sock_recvall(sock, msg_size)
-                if len(buf) != msg_size:
-                    logger.error("Channel %s socket msg shorter than expected" % channel.channel)
-                    logger.error("Expected %s bytes, received %s bytes" % (msg_size, len(buf)))
-                    return
-                data = np.frombuffer(buf, dtype=channel.dtype)
+                self.last_timestamp.value = datetime.datetime.now().timestamp()
                 total += len(data)
                 oc.push(data)
+                # Only wake up wait_for_acquisition once everything has arrived
+                with self.total_received.get_lock():
+                    self.total_received.value += len(data)
+                    finished = self.all_received()
+                if finished:
+                    with self.data_received:
+                        self.data_received.notify_all()
 
             # logger.info('RECEIVED %d %d', total, oc.points_taken.value)
             # TODO: this is suspeicious
@@ -322,45 +360,51 @@ class X6(Instrument):
             total_spewed = 0
 
             counter = {chan: 0 for chan in self._chan_to_wsocket.keys()}
-            initial_points = {oc: oc.points_taken.value for oc in ocs}
-            for j in range(self._lib.nbr_round_robins):
-                for i in range(self._lib.nbr_segments):
-                    if self.ideal_data is not None:
-                        #add ideal data for testing
-                        if hasattr(self, 'exp_step') and self.increment_ideal_data:
-                            raise Exception("Cannot use both exp_step and increment_ideal_data")
-                        elif hasattr(self, 'exp_step'):
-                            total_spewed += self.spew_fake_data(
-                                    counter, self.ideal_data[self.exp_step][i])
-                        elif self.increment_ideal_data:
-                            total_spewed += self.spew_fake_data(
-                                   counter, self.ideal_data[self.ideal_counter][i])
-                        else:
-                            total_spewed += self.spew_fake_data(
-                                    counter, self.ideal_data[i])
+            # The total is only known once the data is on its way
+            self.points_expected.value = float('inf')
+            self.total_received.value  = 0
+            if self.emulator_settings is not None:
+                channels = []
+                for chan, wsock in self._chan_to_wsocket.items():
+                    if chan.stream_type == "integrated":
+                        channels.append((wsock, dict(kind="integrated", dtype=chan.dtype)))
+                    elif chan.stream_type == "demodulated":
+                        channels.append((wsock, dict(kind="demodulated", length=int(self._lib.record_length/32), dtype=chan.dtype)))
                     else:
-                        total_spewed += self.spew_fake_data(counter)
+                        channels.append((wsock, dict(kind="raw", length=int(self._lib.record_length/4), dtype=chan.dtype)))
+                emulator, total_spewed = self.start_emulator(self._lib.nbr_round_robins, self._lib.nbr_segments, channels)
+            else:
+                ideal = self.fake_ideal_data()
+                for j in range(self._lib.nbr_round_robins):
+                    for i in range(self._lib.nbr_segments):
+                        if ideal is not None:
+                            #add ideal data for testing
+                            total_spewed += self.spew_fake_data(counter, ideal[i])
+                        else:
+                            total_spewed += self.spew_fake_data(counter)
 
-                    time.sleep(0.0001)
+                        time.sleep(0.0001)
 
             self.ideal_counter += 1
             # logger.info("Counter: %s", str(counter))
             # logger.info('TOTAL fake data generated %d', total_spewed)
+            self.points_expected.value = total_spewed
             if ocs:
-                while True:
-                    total_taken = 0
+                with self.data_received:
+                    self.data_received.wait_for(self.all_received)
+                if progressbars:
                     for oc in ocs:
-                        total_taken += oc.points_taken.value - initial_points[oc]
-                        if progressbars:
-                            progressbars[oc].value = ocs[0].points_taken.value
-                        # logger.info('TOTAL fake data received %d', oc.points_taken.value - initial_points[oc])
-                    if total_taken == total_spewed:
-                        break
-                    # logger.info('WAITING for acquisition to finish %d < %d', total_taken, total_spewed)
-                    time.sleep(0.025)
+                        progressbars[oc].value = oc.points_taken.value
+            if self.emulator_settings is not None:
+                emulator.join()
 
         else:
-            while not self.done():
+            while True:
+                # Wake up as soon as the receivers get the last of the data, or every so often to check
+                # the timeout
+                with self.data_received:
+                    if self.data_received.wait_for(self.all_received, timeout=0.1):
+                        break
                 if not dig_run.is_set():
                     self.last_timestamp.value = datetime.datetime.now().timestamp()
                 if (datetime.datetime.now().timestamp() - self.last_timestamp.value) > timeout:
@@ -369,7 +413,6 @@ class X6(Instrument):
                 if progressbars:
                     for oc in ocs:
                         progressbars[oc].value = oc.points_taken.value
-                time.sleep(0.1)
 
     # pass thru properties
     @property
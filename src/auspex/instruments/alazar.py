@@ -15,32 +15,15 @@ import datetime, time
 import sys
 import numpy as np
 
-from multiprocessing import Value
+from multiprocessing import Value, Condition
 
-from .instrument import Instrument, ReceiverChannel
+from .instrument import Instrument, ReceiverChannel, ReceiveBufferPool
+from .emulator import DigitizerEmulator
 from auspex.log import logger
 import auspex.config as config
 
 from unittest.mock import MagicMock
 
-# win32 doesn't support MSG_WAITALL, so on windows we
-# need to do things a slower, less efficient way.
-# (we could optimize this, if performance becomes a problem)
-#
-# TODO: this code is repeated in the X6 driver.
-#
-if sys.platform == 'win32':
-    def sock_recvall(s, data_len):
-        buf = bytearray()
-        while data_len > 0:
-            new = s.recv(data_len)
-            data_len -= len(new)
-            buf.extend(new)
-        return bytes(buf)
-else:
-    def sock_recvall(s, data_len):
-        return s.recv(data_len, socket.MSG_WAITALL)
-
 class AlazarChannel(ReceiverChannel):
     phys_channel = None
 
@@ -76,11 +59,14 @@ class AlazarATS9870(Instrument):
         self.last_timestamp = Value('d', datetime.datetime.now().timestamp())
         self.fetch_count    = Value('d', 0)
         self.total_received = Value('d', 0)
+        self.points_expected = Value('d', float('inf')) # Set for each acquisition
 
         self.gen_fake_data        = gen_fake_data
         self.increment_ideal_data = False
         self.ideal_counter        = 0
         self.ideal_data           = None
+        self.emulator_settings    = None
+        self.data_received        = Condition() # Notified by the receivers once all of the data has arrived
         np.random.seed(12345)
 
     def connect(self, resource_name=None):
@@ -105,6 +91,8 @@ class AlazarATS9870(Instrument):
     def acquire(self):
         self.fetch_count.value = 0
         self.total_received.value = 0
+        # Every channel's receiver adds to total_received
+        self.points_expected.value = len(self._chan_to_rsocket) * self.number_segments * self.number_averages * self.record_length
         self._lib.acquire()
 
     def stop(self):
@@ -114,8 +102,10 @@ class AlazarATS9870(Instrument):
         return self._lib.data_available()
 
     def done(self):
-        #logger.debug(f"Checking alazar doneness: {self.total_received.value} {self.number_segments * self.number_averages * self.record_length}")
-        return self.total_received.value >=  (self.number_segments * self.number_averages * self.record_length)
+        return self.all_received()
+
+    def all_received(self):
+        return self.total_received.value >= self.points_expected.value
 
     def get_socket(self, channel):
         if channel in self._chan_to_rsocket:
@@ -164,33 +154,65 @@ class AlazarATS9870(Instrument):
 
         return total
 
+    def emulate(self, rate=None, noise=0.1, noise_type="uniform", state_values=None, state_probabilities=None,
+                round_robins_per_message=1):
+        """Generate fake data with a vectorized DigitizerEmulator process instead of record by record, to
+        load test the pipeline at up to `rate` records per second per channel. See `emulate_records` for
+        the noise and qubit state mixture settings. Call with `rate=False` to go back to the original
+        fake data."""
+        if rate is False:
+            self.emulator_settings = None
+            return
+        self.gen_fake_data = True
+        self.emulator_settings = dict(rate=rate, round_robins_per_message=round_robins_per_message,
+                                      noise=noise, noise_type=noise_type, state_values=state_values,
+                                      state_probabilities=state_probabilities)
+
+    def fake_ideal_data(self):
+        """The ideal value of each segment for the current fake acquisition, if any."""
+        if self.ideal_data is None:
+            return None
+        if hasattr(self, 'exp_step') and self.increment_ideal_data:
+            raise Exception("Cannot use both exp_step and increment_ideal_data")
+        elif hasattr(self, 'exp_step'):
+            return self.ideal_data[self.exp_step]
+        elif self.increment_ideal_data:
+            return self.ideal_data[self.ideal_counter]
+        return self.ideal_data
+
+    def start_emulator(self, round_robins, segments, channels):
+        settings = dict(self.emulator_settings, ideal=self.fake_ideal_data())
+        rate, per_message = settings.pop('rate'), settings.pop('round_robins_per_message')
+        emulator = DigitizerEmulator([(wsock, dict(chan_settings, **settings)) for wsock, chan_settings in channels],
+                                     round_robins, segments, rate=rate, round_robins_per_message=per_message)
+        emulator.start()
+        return emulator, sum(emulator.points_per_channel())
+
     def receive_data(self, channel, oc, exit, ready, run):
         sock = self._chan_to_rsocket[channel]
         sock.settimeout(2)
         self.last_timestamp.value = datetime.datetime.now().timestamp()
+        pool = ReceiveBufferPool()
         ready.value += 1
 
         while not exit.is_set():
             # push data from a socket into an OutputConnector (oc)
             # wire format is just: [size, buffer...]
-            # TODO receive 4 or 8 bytes depending on sizeof(size_t)
             run.wait() # Block until we are running again
-            try:
-                msg = sock.recv(8)
-                self.last_timestamp.value = datetime.datetime.now().timestamp()
-            except:
+            data = pool.receive(sock, np.float32)
+            if data is None:
                 logger.debug("Didn't find any data on socket within 2 seconds (this is normal during experiment shutdown).")
                 continue
-            msg_size = struct.unpack('n', msg)[0]
-            buf = sock_recvall(sock, msg_size)
-            while len(buf) < msg_size:
-                time.sleep(0.01)
-                buf2 = sock_recvall(sock, msg_size-len(buf))
-                buf = buf+buf2
-            data = np.frombuffer(buf, dtype=np.float32)
-            self.total_received.value += len(data)
+            self.last_timestamp.value = datetime.datetime.now().timestamp()
             oc.push(data)
             self.fetch_count.value += 1
+            # Only wake up wait_for_acquisition once everything has arrived
+            with self.total_received.get_lock():
+                self.total_received.value += len(data)
+                finished = self.all_received()
+            if finished:
+                with self.data_received:
+                    self.data_received.notify_all()
 
     def get_buffer_for_channel(self, channel):
         self.fetch_count.value += 1
@@ -201,47 +223,43 @@ class AlazarATS9870(Instrument):
             total_spewed = 0
 
             counter = {chan: 0 for chan in self._chan_to_wsocket.keys()}
-            initial_points = {oc: oc.points_taken.value for oc in ocs}
-            # print(self.number_averages, self.number_segments)
-            for j in range(self.number_averages):
-                for i in range(self.number_segments):
-                    if self.ideal_data is not None:
-                        #add ideal data for testing
-                        if hasattr(self, 'exp_step') and self.increment_ideal_data:
-                            raise Exception("Cannot use both exp_step and increment_ideal_data")
-                        elif hasattr(self, 'exp_step'):
-                            total_spewed += self.spew_fake_data(
-                                    counter, self.ideal_data[self.exp_step][i])
-                        elif self.increment_ideal_data:
-                            total_spewed += self.spew_fake_data(
-                                   counter, self.ideal_data[self.ideal_counter][i])
+            # The total is only known once the data is on its way
+            self.points_expected.value = float('inf')
+            self.total_received.value  = 0
+            if self.emulator_settings is not None:
+                channels = [(wsock, dict(kind="raw", length=int(self.record_length), dtype=np.float32))
+                            for wsock in self._chan_to_wsocket.values()]
+                emulator, total_spewed = self.start_emulator(self.number_averages, self.number_segments, channels)
+            else:
+                ideal = self.fake_ideal_data()
+                for j in range(self.number_averages):
+                    for i in range(self.number_segments):
+                        if ideal is not None:
+                            #add ideal data for testing
+                            total_spewed += self.spew_fake_data(counter, ideal[i])
                         else:
-                            total_spewed += self.spew_fake_data(
-                                    counter, self.ideal_data[i])
-                    else:
-                        total_spewed += self.spew_fake_data(counter)
+                            total_spewed += self.spew_fake_data(counter)
 
-                    time.sleep(0.0001)
+                        time.sleep(0.0001)
 
             self.ideal_counter += 1
             # logger.info("Counter: %s", str(counter))
             # logger.info('TOTAL fake data generated %d', total_spewed)
+            self.points_expected.value = total_spewed
             if ocs:
-                while True:
-                    total_taken = 0
+                with self.data_received:
+                    self.data_received.wait_for(self.all_received)
+                if progressbars:
                     for oc in ocs:
-                        total_taken += oc.points_taken.value - initial_points[oc]
-                        if progressbars:
-                            progressbars[oc].value = oc.points_taken.value
-                        # logger.info('TOTAL fake data received %d', oc.points_taken.value - initial_points[oc])
-                    if total_taken == total_spewed:
-                        break
-                    
-                    # logger.info('WAITING for acquisition to finish %d < %d', total_taken, total_spewed)
-                    time.sleep(0.025)
+                        progressbars[oc].value = oc.points_taken.value
+            if self.emulator_settings is not None:
+                emulator.join()
 
         else:
-            while not self.done():
+            while True:
+                with self.data_received:
+                    if self.data_received.wait_for(self.all_received, timeout=0.2):
+                        break
                 if not dig_run.is_set():
                     self.last_timestamp.value = datetime.datetime.now().timestamp()
                 if (datetime.datetime.now().timestamp() - self.last_timestamp.value) > timeout:
@@ -250,7 +268,6 @@ class AlazarATS9870(Instrument):
                 for oc in ocs:
                     if progressbars:
                         progressbars[oc].value = oc.points_taken.value
-                time.sleep(0.2)
 
         logger.debug("Digitizer %s finished getting data.", self.name)
 
@@ -0,0 +1,137 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+__all__ = ['DigitizerEmulator', 'emulate_records']
+
+import os
+import sys
+import time
+import struct
+import numpy as np
+
+if sys.platform == 'win32' or 'NOFORKING' in os.environ:
+    from threading import Thread as Process
+else:
+    from multiprocessing import Process
+
+from auspex.log import logger
+
+def emulate_records(kind, num_records, segments, length=1, ideal=None, noise=0.1, noise_type="uniform",
+                    state_values=None, state_probabilities=None, dtype=None, rng=np.random):
+    """Generate `num_records` consecutive records, cycling through `segments`, all at once.
+
+    The records are shaped like the fake data of the digitizer drivers: "integrated" records are
+    single complex values at the segment's ideal value, "demodulated" records carry the ideal value
+    over their middle half, and "raw" records a burst of oscillations scaled by it (an ideal value
+    of 0 stands for 1 in the latter two). `ideal` holds one value per segment.
+
+    Alternatively, each record can be a random mixture of qubit states: `state_values` gives the
+    ideal value of each state (one per state, or one per state and segment) and
+    `state_probabilities` how likely each state is, with the same shape.
+
+    Noise of amplitude `noise` is either "uniform" in [0, noise), matching the drivers' original
+    fake data, or "gaussian" with standard deviation `noise`, and is complex for complex records."""
+
+    if kind not in ("integrated", "demodulated", "raw"):
+        raise ValueError("Emulated digitizer streams must be integrated, demodulated or raw, got {}.".format(kind))
+    if noise_type not in ("uniform", "gaussian"):
+        raise ValueError("Emulated digitizer noise must be uniform or gaussian, got {}.".format(noise_type))
+    if dtype is None:
+        dtype = np.float32 if kind == "raw" else np.complex128
+    seg_idx = np.arange(num_records) % segments
+
+    # The ideal value of every record
+    if state_values is not None:
+        values = np.asarray(state_values)
+        probs  = np.asarray(state_probabilities if state_probabilities is not None else np.full(values.shape, 1.0/values.shape[0]))
+        values = values.reshape(values.shape[0], -1)*np.ones((1, segments))
+        probs  = probs.reshape(probs.shape[0], -1)*np.ones((1, segments))
+        cumulative = np.cumsum(probs/probs.sum(axis=0), axis=0)
+        states  = (rng.random_sample(num_records)[None, :] > cumulative[:, seg_idx]).sum(axis=0)
+        states  = np.minimum(states, values.shape[0] - 1)
+        per_rec = values[states, seg_idx]
+    elif ideal is not None:
+        per_rec = np.asarray(ideal)[seg_idx]
+    else:
+        per_rec = np.zeros(num_records)
+    if kind != "integrated":
+        per_rec = np.where(per_rec == 0, 1.0, per_rec)
+    if not np.issubdtype(dtype, np.complexfloating):
+        per_rec = np.real(per_rec)
+
+    # The shape of each record
+    if kind == "integrated":
+        length  = 1
+        records = per_rec.astype(dtype)[:, None]
+    else:
+        shape = np.zeros(length)
+        if kind == "demodulated":
+            shape[int(length/4):int(3*length/4)] = 1.0
+        else:
+            signal = np.sin(np.linspace(0, 10.0*np.pi, int(length/2)))
+            shape[int(length/4):int(length/4)+len(signal)] = signal
+        records = (per_rec[:, None]*shape[None, :]).astype(dtype)
+
+    def draw(size):
+        if noise_type == "uniform":
+            return rng.random_sample(size)
+        return rng.standard_normal(size)
+
+    records += noise*draw(records.shape)
+    if np.issubdtype(dtype, np.complexfloating):
+        records += 1j*noise*draw(records.shape)
+    return records.ravel()
+
+class DigitizerEmulator(Process):
+    """Streams emulated records into digitizer sockets at up to `rate` records per second (as fast
+    as the receivers take them if None), using the drivers' wire format of a size_t byte count
+    followed by the data.
+
+    `channels` is a list of `(socket, settings)` pairs, where `settings` are keyword arguments of
+    :func:`emulate_records`. A few distinct blocks of `round_robins_per_message` round robins of
+    `segments` records are generated ahead of time and cycled through, so that streaming costs
+    little more than the socket writes themselves."""
+
+    def __init__(self, channels, round_robins, segments, rate=None, round_robins_per_message=1, blocks=4, seed=12345):
+        super(DigitizerEmulator, self).__init__()
+        self.channels     = channels
+        self.round_robins = round_robins
+        self.segments     = segments
+        self.rate         = rate
+        self.per_message  = max(1, min(round_robins_per_message, round_robins))
+        self.num_blocks   = blocks
+        self.seed         = seed
+        self.daemon       = True
+
+    def points_per_channel(self):
+        """How many points each channel will receive, in the same order as `channels`."""
+        return [self.round_robins*self.segments*(1 if s.get('kind') == "integrated" else s.get('length', 1))
+                for _, s in self.channels]
+
+    def run(self):
+        rng    = np.random.RandomState(self.seed)
+        blocks = [[emulate_records(num_records=self.per_message*self.segments, segments=self.segments, rng=rng, **settings)
+                   for _ in range(self.num_blocks)] for _, settings in self.channels]
+
+        start = time.time()
+        sent  = 0
+        try:
+            while sent < self.round_robins:
+                count = min(self.per_message, self.round_robins - sent)
+                if self.rate:
+                    delay = start + sent*self.segments/self.rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                idx = (sent//self.per_message) % self.num_blocks
+                for (sock, _), chan_blocks in zip(self.channels, blocks):
+                    data = chan_blocks[idx][:chan_blocks[idx].size*count//self.per_message]
+                    sock.sendall(struct.pack('n', data.nbytes))
+                    sock.sendall(data.view(np.uint8))
+                sent += count
+        except OSError as e:
+            logger.warning("Digitizer emulator stopped early: %s", e)
@@ -2,8 +2,11 @@ __all__ = ['Instrument']
 
 import numpy as np
 import os
+import sys
 import time
 import socket
+import struct
+from contextlib import contextmanager
 from unittest.mock import MagicMock
 
 from auspex.log import logger
@@ -36,7 +39,7 @@ class Command(object):
     def parse(self):
         for a in ['aliases', 'set_delay', 'get_delay',
                   'value_map', 'value_range',
-                  'allowed_values']:
+                  'allowed_values', 'cacheable', 'cache_ttl']:
             if a in self.kwargs:
                 setattr(self, a, self.kwargs.pop(a))
             else:
@@ -148,6 +151,63 @@ class SCPIRampCommand(SCPICommand, RampCommand): pass
 
 class ReceiverChannel(object): pass
 
+def sock_recv_into(sock, view):
+    """Fill the writable buffer `view` from `sock`, however many reads that takes."""
+    view = memoryview(view).cast('B')
+    while len(view) > 0:
+        got = sock.recv_into(view)
+        if got == 0:
+            raise ConnectionError("Socket closed with {} bytes left to receive.".format(len(view)))
+        view = view[got:]
+
+class ReceiveBufferPool(object):
+    """Receive digitizer messages, in the wire format [size_t byte count, data...], straight into
+    reusable numpy buffers instead of allocating and copying bytes objects for every message.
+
+    A buffer is only handed out again once nothing outside the pool references it, i.e. once the
+    stream transport has serialized it and the consumers have let go of it. At most `max_buffers`
+    buffers are kept around, each as large as the largest message seen so far."""
+
+    def __init__(self, max_buffers=8):
+        super(ReceiveBufferPool, self).__init__()
+        self.max_buffers = max_buffers
+        self.buffers     = []
+        self.header      = bytearray(struct.calcsize('n'))
+        self.largest     = 0
+
+    def acquire(self, nbytes):
+        """A uint8 buffer of at least `nbytes` that nobody else is using."""
+        self.largest = max(self.largest, nbytes)
+        for i in range(len(self.buffers)):
+            # References: the pool's list and getrefcount's own argument
+            if self.buffers[i].size >= nbytes and sys.getrefcount(self.buffers[i]) == 2:
+                return self.buffers[i]
+        buf = np.empty(self.largest, dtype=np.uint8)
+        if len(self.buffers) < self.max_buffers:
+            self.buffers.append(buf)
+        else:
+            # Replace a buffer that is too small, if any, otherwise this one is used once
+            for i in range(len(self.buffers)):
+                if self.buffers[i].size < nbytes and sys.getrefcount(self.buffers[i]) == 2:
+                    self.buffers[i] = buf
+                    break
+        return buf
+
+    def receive(self, sock, dtype):
+        """Receive one message from `sock` as an array of `dtype` backed by a pooled buffer. Returns
+        None if no message started arriving before the socket timed out."""
+        try:
+            got = sock.recv_into(self.header)
+        except socket.timeout:
+            return None
+        if got == 0:
+            raise ConnectionError("Digitizer socket closed.")
+        sock_recv_into(sock, memoryview(self.header)[got:])
+        nbytes = struct.unpack('n', self.header)[0]
+        buf = self.acquire(nbytes)[:nbytes]
+        sock_recv_into(sock, buf)
+        return buf.view(dtype)
+
 class MetaInstrument(type):
     def __init__(self, name, bases, dct):
         type.__init__(self, name, bases, dct)
@@ -208,6 +268,14 @@ class SCPIInstrument(Instrument):
 
     __isfrozen = False
 
+    # Longest message the instrument accepts when batching commands, None if unlimited
+    max_message_length  = 256
+    # Whether configure_with_dict sends its settings as batches, for instruments known
+    # to handle compound commands
+    batch_configuration = False
+    # Seconds that values of cacheable commands are reused for, None until invalidated
+    cache_ttl = None
+
     def __init__(self, resource_name=None, name="Yet-to-be-named SCPI Instrument"):
         self.name            = name
         self.resource_name   = resource_name
@@ -215,6 +283,9 @@ class SCPIInstrument(Instrument):
         if not hasattr(self, "instrument_type"):
             self.instrument_type = None # This can be AWG, Digitizer, etc.
         self.interface       = None
+        self._batch          = None # Commands waiting to be sent while batching
+        self._batch_delay    = 0.0
+        self._cache          = {} # Last values of cacheable commands
         self._freeze()
 
     def connect(self, resource_name=None, interface_type=None):
@@ -254,16 +325,120 @@ class SCPIInstrument(Instrument):
         except:
             logger.error("Could not initialize interface for %s.", self.full_resource_name)
             self.interface = MagicMock()
+        self._cache = {}
         self._freeze()
 
     def disconnect(self):
         self.interface.close()
 
+    def configure_with_dict(self, settings_dict):
+        if self.batch_configuration:
+            with self.batch(opc=True):
+                super(SCPIInstrument, self).configure_with_dict(settings_dict)
+        else:
+            super(SCPIInstrument, self).configure_with_dict(settings_dict)
+
+    @contextmanager
+    def batch(self, opc=False, max_length=None):
+        """Collect the commands set within this block and send them as a few compound
+        messages, joined by semicolons, instead of one message per command. Messages are
+        kept under `max_length` (or the instrument's `max_message_length`) characters. With
+        `opc`, wait for the instrument to finish the commands with a final *OPC? query.
+
+        Queries made within the block first send the commands collected so far, and set
+        delays are waited out once the commands are sent. Batches within batches are part
+        of the outermost one::
+
+            with instr.batch(opc=True):
+                instr.frequency = 5e9
+                instr.power = -10
+        """
+        if getattr(self, '_batch', None) is not None:
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+        finally:
+            # Send whatever was set, as if we had not been batching
+            try:
+                self.send_batch(max_length=max_length)
+                if opc:
+                    self.interface.query("*OPC?")
+            finally:
+                self._batch = None
+
+    def send_batch(self, max_length=None):
+        """Send the commands collected by the current batch, if any."""
+        if not getattr(self, '_batch', None):
+            return
+        max_length = max_length or self.max_message_length
+        commands, self._batch = self._batch, []
+        # A leading colon makes each command start from the root of the SCPI tree
+        commands = [c if c.startswith((":", "*")) else ":"+c for c in commands]
+        message  = ""
+        for command in commands:
+            if message and max_length is not None and len(message) + 1 + len(command) > max_length:
+                self.interface.write(message)
+                message = ""
+            message = message + ";" + command if message else command
+        if message:
+            self.interface.write(message)
+        if self._batch_delay > 0:
+            time.sleep(self._batch_delay)
+            self._batch_delay = 0.0
+
+    def write_command(self, command, delay=None):
+        """Write a set command, or hold on to it while batching."""
+        if getattr(self, '_batch', None) is not None:
+            self._batch.append(command)
+            self._batch_delay += delay or 0.0
+        else:
+            self.interface.write(command)
+            if delay is not None:
+                time.sleep(delay)
+
+    def invalidate_cache(self):
+        """Forget the values of cacheable commands, so that they are read from the instrument
+        again. Writes through the interface, including resets, already do this."""
+        if getattr(self, '_cache', None):
+            self._cache.clear()
+
+    def _cache_key(self, name, kwargs):
+        try:
+            key = (name, tuple(sorted(kwargs.items())))
+            hash(key)
+            return key
+        except TypeError:
+            return None
+
+    def cached_value(self, name, kwargs, ttl=None):
+        """Returns whether the value of command `name` (with `kwargs`) is cached and still
+        valid, and the value."""
+        key = self._cache_key(name, kwargs)
+        if key is None or key not in getattr(self, '_cache', {}):
+            return False, None
+        value, write_count, timestamp = self._cache[key]
+        ttl = ttl if ttl is not None else self.cache_ttl
+        if write_count != getattr(self.interface, 'write_count', 0) or (ttl is not None and time.time() - timestamp > ttl):
+            del self._cache[key]
+            return False, None
+        return True, value
+
+    def cache_value(self, name, kwargs, value):
+        key = self._cache_key(name, kwargs)
+        if key is not None and getattr(self, '_cache', None) is not None:
+            # Only interfaces that count their writes can tell us when a value goes stale
+            write_count = getattr(self.interface, 'write_count', None)
+            if isinstance(write_count, int):
+                self._cache[key] = (value, write_count, time.time())
+
     # We want to lock the class dictionary
     # This solution from http://stackoverflow.com/questions/3603502/prevent-creating-new-attributes-outside-init
 
     def __setattr__(self, key, value):
-        if self.__isfrozen and not hasattr(self, key):
+        # Look for the attribute without hasattr(self, key), which would query properties
+        if self.__isfrozen and key not in self.__dict__ and not hasattr(type(self), key):
             raise TypeError( "{} has a frozen class. Cannot access attribute {}".format(self, key) )
         object.__setattr__(self, key, value)
 
@@ -291,10 +466,18 @@ def add_command_SCPI(instr, name, cmd):
     new_cmd.parse()
 
     def fget(self, **kwargs):
+        self.send_batch() # Read back anything set so far
+        if new_cmd.cacheable:
+            cached, val = self.cached_value(name, kwargs, new_cmd.cache_ttl)
+            if cached:
+                return val
         val = self.interface.query( new_cmd.get_string.format( **kwargs ) )
         if new_cmd.get_delay is not None:
             time.sleep(new_cmd.get_delay)
-        return new_cmd.convert_get(val)
+        val = new_cmd.convert_get(val)
+        if new_cmd.cacheable:
+            self.cache_value(name, kwargs, val)
+        return val
 
     def fset(self, val, **kwargs):
         if new_cmd.value_range is not None:
@@ -313,7 +496,10 @@ def add_command_SCPI(instr, name, cmd):
             if 'pause' in kwargs:
                 new_cmd.pause = kwargs['pause']
             # Ramp from one value to another, making sure we actually take some steps
-            start_value = float(self.interface.query(new_cmd.get_string))
+            self.send_batch()
+            cached, start_value = self.cached_value(name, {}, new_cmd.cache_ttl) if new_cmd.cacheable else (False, None)
+            if not cached:
+                start_value = float(self.interface.query(new_cmd.get_string))
             approx_steps = int(abs(val-start_value)/new_cmd.increment)
             if approx_steps == 0:
                 values = [val]
@@ -325,9 +511,13 @@ def add_command_SCPI(instr, name, cmd):
         else:
             # Go straight to the desired value
             set_value = new_cmd.convert_set(val)
-            self.interface.write(new_cmd.set_string.format(set_value, **kwargs))
-            if new_cmd.set_delay is not None:
-                time.sleep(new_cmd.set_delay)
+            self.write_command(new_cmd.set_string.format(set_value, **kwargs), delay=new_cmd.set_delay)
+
+        # The write has made everything cached stale, but we know what this one is now
+        if new_cmd.cacheable and getattr(self, '_batch', None) is None:
+            # As the getter would return it
+            self.cache_value(name, {k: v for k, v in kwargs.items() if k not in ('increment', 'pause')},
+                             new_cmd.convert_get(new_cmd.convert_set(val)))
 
     # Add getter and setter methods for passing around
     if new_cmd.additional_args is None:
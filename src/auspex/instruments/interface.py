@@ -1,5 +1,7 @@
 import os
 import visa
+import asyncio
+import threading
 import numpy as np
 from auspex.log import logger
 from .prologix import PrologixSocketResource
@@ -8,8 +10,26 @@ class Interface(object):
     """Currently just a dummy interface for testing."""
     def __init__(self):
         super(Interface, self).__init__()
+        self.write_count = 0 # Anything written may change the instrument's settings
+        self.io_lock     = threading.RLock() # Held for every transaction with the instrument
+
+    # Asynchronous versions of the I/O methods. The underlying resources block, so these
+    # run them on the event loop's default executor, where they take the interface's
+    # io_lock like any other transaction. This lets a coroutine talk to several
+    # instruments at once.
+    def _run_async(self, method, *args, **kwargs):
+        return asyncio.get_event_loop().run_in_executor(None, lambda: method(*args, **kwargs))
+    async def awrite(self, value):
+        return await self._run_async(self.write, value)
+    async def aquery(self, value):
+        return await self._run_async(self.query, value)
+    async def aread_raw(self, *args, **kwargs):
+        return await self._run_async(self.read_raw, *args, **kwargs)
+
     def write(self, value):
         logger.debug("Writing '%s'" % value)
+        with self.io_lock:
+            self.write_count += 1
     def query(self, value):
         logger.debug("Querying '%s'" % value)
         if value == ":output?;":
@@ -35,51 +55,65 @@ class VisaInterface(Interface):
         except:
             raise Exception("Unable to create the resource '%s'" % resource_name)
     def values(self, query_string):
-        return self._resource.query_ascii_values(query_string, container=np.array)
+        with self.io_lock:
+            return self._resource.query_ascii_values(query_string, container=np.array)
     def value(self, query_string):
-        return self._resource.query_ascii_values(query_string)
+        with self.io_lock:
+            return self._resource.query_ascii_values(query_string)
     def write(self, write_string):
-        self._resource.write(write_string)
+        with self.io_lock:
+            self._resource.write(write_string)
+            self.write_count += 1
     def write_raw(self, raw_string):
-        self._resource.write_raw(raw_string)
+        with self.io_lock:
+            self._resource.write_raw(raw_string)
+            self.write_count += 1
     def read(self):
-        return self._resource.read()
+        with self.io_lock:
+            return self._resource.read()
     def read_raw(self):
-        return self._resource.read_raw()
+        with self.io_lock:
+            return self._resource.read_raw()
     def query(self, query_string):
-        return self._resource.query(query_string)
+        with self.io_lock:
+            return self._resource.query(query_string)
     def write_binary_values(self, query_string, values, **kwargs):
-        return self._resource.write_binary_values(query_string, values, **kwargs)
+        with self.io_lock:
+            self.write_count += 1
+            return self._resource.write_binary_values(query_string, values, **kwargs)
     def query_ascii_values(self, query_string, **kwargs):
-        return self._resource.query_ascii_values(query_string, **kwargs)
+        with self.io_lock:
+            return self._resource.query_ascii_values(query_string, **kwargs)
     def query_binary_values(self, query_string, container=np.array, datatype=u'h',
                 is_big_endian=False):
-        return self._resource.query_binary_values(query_string, container=container, datatype=datatype,
-                is_big_endian=is_big_endian)
+        with self.io_lock:
+            return self._resource.query_binary_values(query_string, container=container, datatype=datatype,
+                    is_big_endian=is_big_endian)
     def close(self):
-        self._resource.close()
+        with self.io_lock:
+            self._resource.close()
 
     # IEEE Mandated SCPI commands
     def CLS(self):
-        self._resource.write("*CLS") # Clear Status Command
+        self.write("*CLS") # Clear Status Command
     def ESE(self):
-        return self._resource.query("*ESE?") # Standard Event Status Enable Query
+        return self.query("*ESE?") # Standard Event Status Enable Query
     def ESR(self):
-        return self._resource.write("*ESR?") # Standard Event Status Register Query
+        return self.write("*ESR?") # Standard Event Status Register Query
     def IDN(self):
-        return self._resource.query("*IDN?") # Identification Query
+        return self.query("*IDN?") # Identification Query
     def OPC(self):
-        return self._resource.query("*OPC?") # Operation Complete Command
+        return self.query("*OPC?") # Operation Complete Command
     def RST(self):
-        self._resource.write("*RST") # Reset Command
+        self.write("*RST") # Reset Command
     def SRE(self):
-        return self._resource.query("*SRE?") # Service Request Enable Query
+        return self.query("*SRE?") # Service Request Enable Query
     def STB(self):
-        return self._resource.query("*STB?") # Read Status Byte Query
+        return self.query("*STB?") # Read Status Byte Query
     def TST(self):
-        return self._resource.query("*TST?") # Self-Test Query
+        return self.query("*TST?") # Self-Test Query
     def WAI(self):
-        self._resource.write("*WAI") # Wait-to-Continue Command
+        self.write("*WAI") # Wait-to-Continue Command
 
 class PrologixInterface(VisaInterface):
     """Prologix-Ethernet interface for communicating with remote GPIB instruments."""
@@ -6,18 +6,83 @@
 #
 #    http://www.apache.org/licenses/LICENSE-2.0
 
-__all__ = ['PrologixSocketResource']
+__all__ = ['PrologixSocketResource', 'PrologixConnectionPool']
 
 import os
 import numpy as np
 import socket
-import functools
+import threading
+from contextlib import contextmanager
 from auspex.log import logger
 from pyvisa.util import _converters, from_ascii_block, to_ascii_block, to_ieee_block, from_binary_block
 
 class PrologixError(Exception):
     """Error interacting with the Prologix GPIB-ETHERNET controller."""
 
+class PrologixConnection(object):
+    """A socket to one Prologix GPIB-ETHERNET controller, shared by all of the GPIB
+    instruments behind it. Hold `lock` for the duration of each transaction."""
+    def __init__(self, ipaddr, port=1234, timeout=5):
+        super(PrologixConnection, self).__init__()
+        self.ipaddr = ipaddr
+        self.port   = port
+        self.lock   = threading.RLock()
+        self.users  = 0
+        self.gpib   = None # The currently addressed instrument
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM,
+                socket.IPPROTO_TCP)
+            self.sock.settimeout(timeout)
+            self.sock.connect((self.ipaddr, port)) #Prologix communicates on port 1234
+        except socket.error as err:
+            logger.error("Cannot open socket to Prologix at {0}: {1}".format(self.ipaddr, err))
+            raise PrologixError(self.ipaddr) from err
+        self.sock.send(b"++ver\r\n")
+        whoami = self.sock.recv(128).decode()
+        if "Prologix" not in whoami:
+            logger.error("The device at {0} does not appear to be a Prologix; got {1}.".format(self.ipaddr, whoami))
+            self.sock.close()
+            raise PrologixError(whoami)
+        self.sock.send(b"++mode 1\r\n") #set to controller mode
+        self.sock.send(b"++auto 1\r\n") #enable read-after-write
+
+    def address(self, gpib):
+        """Point the controller at GPIB address `gpib`, unless it already is."""
+        if gpib != self.gpib:
+            self.sock.send(('++addr %d\n' % gpib).encode())
+            self.gpib = gpib
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+class PrologixConnectionPool(object):
+    """Hands out one shared :class:`PrologixConnection` per controller address and port,
+    since the controllers only serve a single TCP connection at a time. Connections
+    are closed once the last instrument using them lets go."""
+    def __init__(self):
+        super(PrologixConnectionPool, self).__init__()
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, ipaddr, port=1234, timeout=5):
+        with self.lock:
+            if (ipaddr, port) not in self.connections:
+                self.connections[(ipaddr, port)] = PrologixConnection(ipaddr, port=port, timeout=timeout)
+            connection = self.connections[(ipaddr, port)]
+            connection.users += 1
+            return connection
+
+    def release(self, connection):
+        with self.lock:
+            connection.users -= 1
+            key = (connection.ipaddr, connection.port)
+            if connection.users <= 0 and self.connections.get(key) is connection:
+                del self.connections[key]
+                connection.close()
+
+prologix_pool = PrologixConnectionPool()
+
 class PrologixSocketResource(object):
     """A resource representing a GPIB instrument controlled through a PrologixError
     GPIB-ETHERNET controller. Mimics the functionality of a pyVISA resource object.
@@ -39,6 +104,8 @@ class PrologixSocketResource(object):
         if gpib is not None:
             self.gpib = gpib
         self.sock = None
+        self.connection = None # Shared with the other instruments on the controller
+        self.port = 1234
         self._timeout = 5
         self.read_termination = "\r\n"
         self.write_termination = "\r\n"
@@ -51,9 +118,8 @@ class PrologixSocketResource(object):
 
     @timeout.setter
     def timeout(self, value):
-        self._timeout = timeout
-        if self.sock is not None:
-            self.sock.settimeout(self._timeout)
+        # Applied per transaction, since the socket is shared with the other instruments
+        self._timeout = value
 
     def connect(self, ipaddr=None, gpib=None):
         """Connect to a GPIB device through a Prologix GPIB-ETHERNET controller.
@@ -69,43 +135,43 @@ class PrologixSocketResource(object):
             self.ipaddr = ipaddr
         if gpib is not None:
             self.gpib = gpib
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM,
-                socket.IPPROTO_TCP)
-            self.sock.settimeout(self._timeout)
-            self.sock.connect((self.ipaddr, 1234)) #Prologix communicates on port 1234
-        except socket.error as err:
-            logger.error("Cannot open socket to Prologix at {0}: {1}".format(self.ipaddr,
-                err.msg))
-            raise PrologixError(self.ipaddr) from err
-        self.sock.send(b"++ver\r\n")
-        whoami = self.sock.recv(128).decode()
-        if "Prologix" not in whoami:
-            logger.error("The device at {0} does not appear to be a Prologix; got {1}.".format(self.ipaddr, whoami))
-            raise PrologixError(whoami)
-        self.sock.send(b"++mode 1\r\n") #set to controller mode
-        self.sock.send(b"++auto 1\r\n") #enable read-after-write
-        self._addr()
-        self.sock.send(b"++clr\r\n")
-        idn = self.query(self.idn_string)
-        if idn is '':
+        self.connection = prologix_pool.acquire(self.ipaddr, port=self.port, timeout=self._timeout)
+        self.sock = self.connection.sock
+        with self._transaction():
+            self.sock.send(b"++clr\r\n")
+            idn = self.query(self.idn_string)
+        if idn == '':
             logger.error(("Did not receive response to GPIB command {0} " +
                 "from GPIB device {1} on Prologix at {2}.").format(self.idn_string,
                 self.gpib, self.ipaddr))
+            self.close()
             raise PrologixError(idn)
         else:
             logger.debug(("Succesfully connected to device {0} at GPIB port {1} on" +
                 " Prologix controller at {2}.").format(idn, self.gpib, self.ipaddr))
 
     def close(self):
-        """Close the connection to the Prologix."""
-        if self.sock is not None:
-            self.sock.shutdown(socket.SHUT_RDWR)
-            self.sock.close()
+        """Let go of the connection to the Prologix, closing it if no other instrument uses it."""
+        if self.connection is not None:
+            prologix_pool.release(self.connection)
+            self.connection = None
+            self.sock = None
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the shared connection, addressed to this instrument and using its timeout."""
+        with self.connection.lock:
+            previous = self.sock.gettimeout()
+            self.sock.settimeout(self._timeout)
+            try:
+                self._addr()
+                yield
+            finally:
+                self.sock.settimeout(previous)
 
     def _addr(self):
         """Set PROLOGIX to address of instrument we want to control."""
-        self.sock.send(('++addr %d\n' % self.gpib).encode())
+        self.connection.address(self.gpib)
 
     def read(self):
         """Read an ASCII value from the instrument.
@@ -115,8 +181,8 @@ class PrologixSocketResource(object):
         Returns:
             The instrument data with termination character stripped.
         """
-        self._addr()
-        ans = self.sock.recv(self.bufsize).decode()
+        with self._transaction():
+            ans = self.sock.recv(self.bufsize).decode()
         return ans.rstrip(self.read_termination)
 
     def query(self, command):
@@ -127,9 +193,9 @@ class PrologixSocketResource(object):
         Returns:
             The instrument data with termination character stripped.
         """
-        self._addr()
-        self.sock.send((command + self.write_termination).encode())
-        ans = self.sock.recv(self.bufsize).decode()
+        with self._transaction():
+            self.sock.send((command + self.write_termination).encode())
+            ans = self.sock.recv(self.bufsize).decode()
         return ans.rstrip(self.read_termination)
 
     def write(self, command):
@@ -140,8 +206,8 @@ class PrologixSocketResource(object):
         Returns:
             The number of bytes in the message.
         """
-        self._addr()
-        self.sock.send((command + self.write_termination).encode())
+        with self._transaction():
+            self.sock.send((command + self.write_termination).encode())
         return len(command)
 
     def read_raw(self, bufsize=None):
@@ -155,8 +221,8 @@ class PrologixSocketResource(object):
         """
         if bufsize is None:
             bufsize = self.bufsize
-        self._addr()
-        return self.socket.recv(bufsize)
+        with self._transaction():
+            return self.sock.recv(bufsize)
 
     def write_raw(self, command):
         """Write a string message to device as raw bytes. No termination
@@ -167,8 +233,8 @@ class PrologixSocketResource(object):
         Returns:
             The number of bytes in the message.
         """
-        self._addr()
-        self.sock.send(command)
+        with self._transaction():
+            self.sock.send(command)
         return len(command)
 
     def write_ascii_values(self, command, values, converter='f', separator=','):
@@ -203,8 +269,8 @@ class PrologixSocketResource(object):
         """
         if bufsize is None:
             bufsize = self.bufsize
-        ascii = self.query(command, bufsize=bufsize)
-        return from_ascii_block(ascii, convereter, separator, container)
+        ascii = self.query(command)
+        return from_ascii_block(ascii, converter, separator, container)
 
     def write_binary_values(self, command, values, datatype='f',
         is_big_endian=False):
@@ -239,7 +305,8 @@ class PrologixSocketResource(object):
         """
         if bufsize is None:
             bufsize = self.bufsize
-        self.write(command, bufsize=bufsize)
-        block = self.read_raw()
+        with self._transaction():
+            self.write(command)
+            block = self.read_raw(bufsize)
         return from_binary_block(block, datatype=datatype,
             is_big_endian=is_big_endian, container=container)
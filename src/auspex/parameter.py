@@ -6,19 +6,82 @@
 #
 #    http://www.apache.org/licenses/LICENSE-2.0
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from auspex.log import logger
+import auspex.config as config
+
+def same_value(a, b):
+    """Whether two parameter values are equal, including for array values."""
+    try:
+        return bool(a == b)
+    except ValueError:
+        return False
+
+def parameter_instrument(param):
+    """The instrument that `param` sets: its `instrument` attribute if given, otherwise
+    whatever its method is bound to. None if unknown."""
+    if getattr(param, 'instrument', None) is not None:
+        return param.instrument
+    return getattr(getattr(param, 'method', None), '__self__', None)
+
+_push_pool      = None
+_push_pool_size = 0
+_push_worker    = threading.local()
+
+def _push_in_order(params):
+    _push_worker.active = True
+    try:
+        for param in params:
+            param.push()
+    finally:
+        _push_worker.active = False
+
+def push_parameters(params):
+    """Push `params` in order or, with auspex.config.concurrent_pushes set, push the
+    parameters of each instrument in order on its own thread. Parameters of unknown
+    instruments are all pushed in order on the same thread."""
+    global _push_pool, _push_pool_size
+
+    flat = []
+    for param in params:
+        if isinstance(param, ParameterGroup):
+            flat.extend(param.parameters)
+        else:
+            flat.append(param)
+
+    lanes = {}
+    for param in flat:
+        lanes.setdefault(id(parameter_instrument(param)), []).append(param)
+
+    # Push from this thread if there is nothing to overlap, or if this already is a push thread
+    if not config.concurrent_pushes or len(lanes) < 2 or getattr(_push_worker, 'active', False):
+        for param in flat:
+            param.push()
+        return
+
+    if _push_pool is None or _push_pool_size != config.concurrent_pushes:
+        if _push_pool is not None:
+            _push_pool.shutdown(wait=False)
+        _push_pool      = ThreadPoolExecutor(max_workers=config.concurrent_pushes)
+        _push_pool_size = config.concurrent_pushes
+    futures = [_push_pool.submit(_push_in_order, lane) for lane in lanes.values()]
+    for future in futures:
+        future.result() # Raise any exception from the push
 
 class Parameter(object):
     """ Encapsulates the information for an experiment parameter"""
 
     def __init__(self, name=None, unit=None, default=None,
                  value_range=None, allowed_values=None,
-                 increment=None, snap=None):
+                 increment=None, snap=None, pipeline_safe=True, cache_pushes=False):
         self.name     = name
         self._value   = default
         self.unit     = unit
         self.default  = default
         self.method   = None
+        self.instrument = None # Pushes to the same instrument are never concurrent
         self.instrument_tree = None
 
         # These are primarily intended for Quince interoperation,
@@ -30,6 +93,15 @@ class Parameter(object):
             self.increment = snap
         self.snap           = snap
 
+        # Whether this can be pushed while the experiment finishes the previous sweep point,
+        # see Experiment.pipelined
+        self.pipeline_safe = pipeline_safe
+
+        # Skip pushes of the value that was last pushed, for slow instruments
+        self.cache_pushes = cache_pushes
+        self.pushed       = False
+        self.last_pushed  = None
+
         # Hooks to be called before or after updating a sweep parameter
         self.pre_push_hooks = []
         self.post_push_hooks = []
@@ -107,8 +179,15 @@ class Parameter(object):
         logger.debug("Setting method of Parameter %s to %s" % (self.name, str(method)) )
         self.method = method
 
+    def invalidate(self):
+        """Forget the last pushed value, e.g. after the instrument was reset, so that the
+        next push goes through even if caching pushes."""
+        self.pushed = False
+
     def push(self):
         if self.method is not None:
+            if self.cache_pushes and self.pushed and same_value(self.last_pushed, self._value):
+                return
             # logger.debug("Calling pre_push_hooks of Parameter %s with value %s" % (self.name, self._value) )
             for pph in self.pre_push_hooks:
                 pph()
@@ -117,6 +196,8 @@ class Parameter(object):
             # logger.debug("Calling post_push_hooks of Parameter %s with value %s" % (self.name, self._value) )
             for pph in self.post_push_hooks:
                 pph()
+            self.pushed      = True
+            self.last_pushed = self._value
 
 class FilenameParameter(Parameter):
     def __init__(self, *args, **kwargs):
@@ -135,7 +216,7 @@ class ParameterGroup(Parameter):
 
         self.parameters = params
         self._value   = [param.value for param in params]
-        self.default  = [param.defaul for param in params]
+        self.default  = [param.default for param in params]
         self.method   = [param.method for param in params]
 
         units = '('
@@ -156,13 +237,20 @@ class ParameterGroup(Parameter):
         for param, value in zip(self.parameters, values):
             param.value = value
 
+    @property
+    def pipeline_safe(self):
+        return all(param.pipeline_safe for param in self.parameters)
+
     def assign_method(self, methods):
         for param, method in zip(self.parameters,methods):
             param.assign_method(method)
 
-    def push(self):
+    def invalidate(self):
         for param in self.parameters:
-            param.push()
+            param.invalidate()
+
+    def push(self):
+        push_parameters(self.parameters)
 
 class FloatParameter(Parameter):
 
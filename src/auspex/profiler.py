@@ -0,0 +1,126 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+"""Low overhead statistical profiling of filter processes.
+
+Unlike cProfile, which instruments every Python call and badly skews the
+timing of code that makes many small calls around numpy, the
+:class:`SamplingProfiler` only records the call stack every few milliseconds.
+Time spent inside numpy is attributed to the Python line that called it.
+Samples can be written as collapsed stacks (for flamegraph.pl, speedscope and
+most other flame graph tools) or in the speedscope JSON format."""
+
+__all__ = ['SamplingProfiler']
+
+import sys
+import json
+import signal
+import threading
+from collections import Counter
+
+class SamplingProfiler(object):
+    """Periodically sample the call stack of the thread that created the profiler.
+
+    With `clock="cpu"` samples are taken by a SIGPROF interval timer, so only time the process
+    spends on the CPU is sampled. This needs to run in the main thread of a process on a platform
+    with `signal.setitimer`, otherwise, or with `clock="wall"`, a helper thread samples the stack
+    every `interval` seconds of wall time, including time spent waiting."""
+
+    def __init__(self, interval=0.005, clock="cpu"):
+        super(SamplingProfiler, self).__init__()
+        if clock not in ("cpu", "wall"):
+            raise ValueError("SamplingProfiler clock must be 'cpu' or 'wall', got {}.".format(clock))
+        self.interval   = interval
+        self.samples    = Counter() # Stacks, from the outermost frame in, to the number of times they were seen
+        self.thread_id  = threading.get_ident()
+        self.use_signal = (clock == "cpu" and hasattr(signal, "setitimer") and
+                           threading.current_thread() is threading.main_thread())
+        self.running    = False
+        self._previous_handler = None
+        self._sampler   = None
+        self._stop      = threading.Event()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.use_signal:
+            self._previous_handler = signal.signal(signal.SIGPROF, self._handle_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_thread, daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        else:
+            self._stop.set()
+            self._sampler.join()
+
+    def clear(self):
+        self.samples.clear()
+
+    def _handle_signal(self, signum, frame):
+        self._record(frame)
+
+    def _sample_thread(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+        self.samples[tuple(reversed(stack))] += 1
+
+    @staticmethod
+    def frame_name(frame):
+        name, filename, line = frame
+        return "{} ({}:{})".format(name, filename, line)
+
+    def collapsed(self):
+        """The samples as collapsed stacks, one 'outer;...;inner count' line per stack."""
+        return "".join("{} {}\n".format(";".join(self.frame_name(f) for f in stack), count)
+                       for stack, count in self.samples.most_common())
+
+    def write_collapsed(self, filename):
+        with open(filename, "w") as f:
+            f.write(self.collapsed())
+
+    def speedscope(self, name="auspex"):
+        """The samples as a speedscope (https://www.speedscope.app) sampled profile."""
+        frames, index = [], {}
+        stacks, weights = [], []
+        for stack, count in self.samples.most_common():
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            stacks.append([index[frame] for frame in stack])
+            weights.append(count*self.interval)
+        return {'$schema': "https://www.speedscope.app/file-format-schema.json",
+                'name': name,
+                'exporter': "auspex",
+                'shared': {'frames': frames},
+                'profiles': [{'type': "sampled", 'name': name, 'unit': "seconds",
+                              'startValue': 0, 'endValue': sum(weights),
+                              'samples': stacks, 'weights': weights}]}
+
+    def write_speedscope(self, filename, name="auspex"):
+        with open(filename, "w") as f:
+            json.dump(self.speedscope(name), f)
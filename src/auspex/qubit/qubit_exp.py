@@ -341,7 +341,7 @@ class QubitExperiment(Experiment):
         """
         return graph
 
-    def set_fake_data(self, digitizer_proxy, ideal_data, increment=False, random_mag=0.1):
+    def set_fake_data(self, digitizer_proxy, ideal_data, increment=False, random_mag=0.1, emulate=False, rate=None):
         """Enabled and use the fake data interface for digitizers in order that auspex can 
         be run without hardware.
 
@@ -356,6 +356,11 @@ class QubitExperiment(Experiment):
             increment (boolean)  
                 Whether or not to step through a 2D data array after to incorporate extra sweeps. The behavior is
                 defined above.
+            emulate (boolean)
+                Stream the fake data from a vectorized emulator process, which is much faster than generating
+                it record by record, with noise of amplitude `random_mag`.
+            rate (float)
+                When emulating, the number of records per second to stream at. As fast as possible if None.
 
         Examples:
             Make sure to set auspex dummy mode at import time.
@@ -374,6 +379,10 @@ class QubitExperiment(Experiment):
         auspex_instr.increment_ideal_data = increment
         auspex_instr.gen_fake_data = True
         auspex_instr.fake_data_random_mag = random_mag
+        if emulate:
+            auspex_instr.emulate(rate=rate, noise=random_mag)
+        else:
+            auspex_instr.emulate(rate=False)
 
     def clear_fake_data(self, digitizer_proxy):
         """Disable using fake data interface for a digitizer. Take note that dummy mode may
@@ -396,8 +405,7 @@ class QubitExperiment(Experiment):
         return oc
 
     def init_instruments(self):
-        for name, instr in self._instruments.items():
-            instr.configure_with_proxy(instr.proxy_obj)
+        self.for_each_instrument(lambda instr: instr.configure_with_proxy(instr.proxy_obj))
 
         self.digitizers = [v for _, v in self._instruments.items() if "Digitizer" in v.instrument_type]
         self.awgs       = [v for _, v in self._instruments.items() if "AWG" in v.instrument_type]
@@ -442,8 +450,16 @@ class QubitExperiment(Experiment):
             else:
                 getattr(instr, "set_"+prop)(value)
         param.assign_method(method)
+        param.instrument    = instr
+        param.pipeline_safe = self.pipeline_safe(instr)
         self.add_sweep(param, values) # Create the requested sweep on this parameter
 
+    def pipeline_safe(self, instr):
+        """Whether parameters of `instr` can be pushed while finish_run() stops the
+        AWGs and digitizers of the previous sweep point."""
+        instr_type = getattr(instr, "instrument_type", None) or ""
+        return not any(t in instr_type for t in ("AWG", "Digitizer"))
+
     def add_qubit_sweep(self, qubit, measure_or_control, attribute, values):
         """
         Add a *ParameterSweep* to the experiment. Users specify a qubit property that auspex
@@ -492,6 +508,8 @@ class QubitExperiment(Experiment):
             else:
                 raise ValueError("The instrument {} has no method {}".format(name, "set_"+attribute))
         # param.instr_tree = [instr.name, attribute] #TODO: extend tree to endpoint
+        param.instrument    = instr
+        param.pipeline_safe = self.pipeline_safe(instr)
         self.add_sweep(param, values) # Create the requested sweep on this parameter
 
     def add_avg_sweep(self, num_averages):
@@ -569,7 +587,13 @@ class QubitExperiment(Experiment):
         for dig in self.digitizers:
             dig.wait_for_acquisition(self.dig_run, timeout=timeout, ocs=list(self.chan_to_oc.values()), progressbars=self.progressbars)
 
-        # Bring everything to a stop
+        # Unless the sweep stops everything itself, possibly while setting up the next point
+        if not self.finish_run_deferred:
+            self.finish_run()
+
+    def finish_run(self):
+        # Bring everything to a stop. With exp.pipelined set, the next sweep point's
+        # parameters are pushed meanwhile, unless they belong to AWGs or digitizers.
         for dig in self.digitizers:
             dig.stop()
 
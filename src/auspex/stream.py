@@ -27,6 +27,7 @@ import numpy as np
 from functools import reduce
 
 from auspex.log import logger
+from auspex.parameter import push_parameters
 
 def cartesian(arrays, out=None, dtype='f'):
     """http://stackoverflow.com/questions/28684492/numpy-equivalent-of-itertools-product"""
@@ -182,6 +183,12 @@ class SweepAxis(DataAxis):
     def update(self):
         """ Update value after each run.
         """
+        if self.advance():
+            self.push()
+
+    def advance(self):
+        """ Move on to the next point without pushing it. Returns False if there is none.
+        """
         if self.step < self.num_points():
             if self.callback_func:
                 self.callback_func(self, self.experiment)
@@ -190,9 +197,10 @@ class SweepAxis(DataAxis):
                 self.metadata_value = self.metadata[self.step]
             logger.debug("Sweep Axis '{}' at step {} takes value: {}.".format(self.name,
                                                                                self.step,self.value))
-            self.push()
             self.step += 1
             self.done = False
+            return True
+        return False
 
     def check_for_refinement(self, output_connectors_dict):
         """Check to see if we need to perform any refinements. If there is a refine_func
@@ -225,15 +233,19 @@ class SweepAxis(DataAxis):
                 logger.debug("Sweep Axis '{}' complete.".format(self.name))
                 return False
 
-    def push(self):
-        """ Push parameter value(s) """
+    def stage(self):
+        """ Set the parameter value(s) without pushing them, returns the parameters """
         if self.unstructured:
             for p, v in zip(self.parameter, self.value):
                 p.value = v
-                p.push()
+            return list(self.parameter)
         else:
             self.parameter.value = self.value
-            self.parameter.push()
+            return [self.parameter]
+
+    def push(self):
+        """ Push parameter value(s) """
+        push_parameters(self.stage())
 
     def __repr__(self):
         return "<SweepAxis(name={},length={},unit={},value={},unstructured={}>".format(self.name,
@@ -482,6 +494,7 @@ class DataStream(object):
         self.unit = unit
         self.points_taken_lock = mp.Lock()
         self.points_taken = Value('i', 0) # Using shared memory since these are used in filter processes
+        self.update_interval = Value('d', 0.0) # How often the consumer can use intermediate updates, 0 if it does not say
         self.descriptor = None
         self.start_connector = None
         self.end_connector = None
@@ -647,6 +660,11 @@ class OutputConnector(object):
                 self.points_taken.value += 1
             else:
                 self.points_taken.value += len(data)
+        telemetry = getattr(self.parent, 'telemetry', None)
+        if telemetry is not None:
+            labels = {'connector': self.name}
+            telemetry.inc("stream_messages", len(self.output_streams), labels=labels)
+            telemetry.inc("stream_bytes", getattr(data, 'nbytes', 8)*len(self.output_streams), labels=labels)
         for stream in self.output_streams:
             stream.push(data)
 
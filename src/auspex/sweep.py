@@ -9,9 +9,10 @@
 import itertools
 import numpy as np
 
-from auspex.parameter import ParameterGroup, FloatParameter, IntParameter, Parameter
+from auspex.parameter import ParameterGroup, FloatParameter, IntParameter, Parameter, push_parameters
 from auspex.stream import DataStream, DataAxis, SweepAxis, DataStreamDescriptor, InputConnector, OutputConnector
 from auspex.log import logger
+import auspex.config as config
 
 class Sweeper(object):
     """ Control center of sweep axes """
@@ -42,9 +43,19 @@ class Sweeper(object):
             i=0
             while i<imax and self.axes[i].step==0:
                 i += 1
-            # Need to update parameters from outer --> inner axis
-            for j in range(i,-1,-1):
-                self.axes[j].update()
+            # Need to update parameters from outer --> inner axis. With concurrent pushes
+            # they are all pushed at once so that different instruments may be set together,
+            # unless a callback needs the outer axes to be applied before it runs.
+            changing = self.axes[i::-1]
+            if config.concurrent_pushes and not any(a.callback_func for a in changing):
+                params = []
+                for a in changing:
+                    if a.advance():
+                        params.extend(a.stage())
+                push_parameters(params)
+            else:
+                for a in changing:
+                    a.update()
 
         # At this point all of the updates should have happened
         # return the current coordinates of the sweep. Return the
@@ -82,3 +93,59 @@ class Sweeper(object):
 
     def __repr__(self):
         return "Sweeper"
+
+def raster_order(values):
+    """Coordinates of the grid spanned by `values`, a list of point lists from the outermost
+    parameter in, with each inner parameter restarting from its first point."""
+    return [tuple(c) for c in itertools.product(*values)]
+
+def serpentine_order(values):
+    """Coordinates of the grid spanned by `values` (outermost parameter first), where each inner
+    parameter runs back and forth rather than snapping back to its first point, so that only one
+    parameter changes between consecutive coordinates, and only by a single step."""
+    coords = [()]
+    for points in values:
+        points = list(points)
+        new_coords = []
+        for i, c in enumerate(coords):
+            new_coords.extend(c + (p,) for p in (points if i % 2 == 0 else points[::-1]))
+        coords = new_coords
+    return coords
+
+def sweep_path_cost(coords, move_costs):
+    """The total cost of visiting `coords` in order. `move_costs` holds one entry per coordinate:
+    either a cost per unit change of that parameter, or a function of the old and new values giving
+    the cost of the move. Unchanged parameters cost nothing."""
+    total = 0.0
+    for prev, curr in zip(coords[:-1], coords[1:]):
+        for cost, old, new in zip(move_costs, prev, curr):
+            if old == new:
+                continue
+            total += cost(old, new) if callable(cost) else cost*abs(new - old)
+    return total
+
+def plan_sweep(values, order="serpentine", move_costs=None):
+    """Order the points of a grid sweep, given as a list of point lists from the outermost parameter
+    in, returning the list of coordinate tuples to visit (in the original parameter order).
+
+    "raster" visits the grid the way nested sweeps do, "serpentine" runs inner parameters back and
+    forth, and "cost" also chooses which parameters to nest innermost by minimizing the total
+    `move_costs` (see :func:`sweep_path_cost`) of the serpentine path over all nestings."""
+    if order == "raster":
+        return raster_order(values)
+    if order == "serpentine":
+        return serpentine_order(values)
+    if order != "cost":
+        raise ValueError("Sweep order must be 'raster', 'serpentine', or 'cost', got {}.".format(order))
+    if move_costs is None or len(move_costs) != len(values):
+        raise ValueError("Cost ordered sweeps need one move cost per parameter.")
+
+    best, best_cost = None, None
+    for nesting in itertools.permutations(range(len(values))):
+        coords = serpentine_order([values[i] for i in nesting])
+        cost   = sweep_path_cost(coords, [move_costs[i] for i in nesting])
+        if best_cost is None or cost < best_cost:
+            best, best_cost = (nesting, coords), cost
+    nesting, coords = best
+    unnest = [nesting.index(i) for i in range(len(values))]
+    return [tuple(c[j] for j in unnest) for c in coords]
@@ -0,0 +1,230 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+"""Performance telemetry for the filter pipeline.
+
+Each filter process keeps a :class:`Telemetry` object with counters, gauges and
+histograms, and periodically sends a snapshot of it over a queue. The
+:class:`TelemetryCollector` in the experiment process keeps the latest snapshot
+from every source and exports them in the OpenMetrics text format, either on a
+local HTTP endpoint (scrapable by Prometheus) or to a file, or both. Set
+``auspex.config.telemetry_port`` and/or ``auspex.config.telemetry_file`` to
+enable it; it does not depend on Jupyter."""
+
+__all__ = ['Histogram', 'Telemetry', 'TelemetryCollector']
+
+import os
+import time
+import queue
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from auspex.log import logger
+
+# Upper bounds, in seconds, for latency histograms
+default_buckets = (1e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+content_type = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+class Histogram(object):
+    """Cumulative histogram of observed values with fixed bucket bounds."""
+
+    def __init__(self, buckets=default_buckets):
+        super(Histogram, self).__init__()
+        self.buckets = tuple(buckets)
+        self.counts  = [0]*(len(self.buckets) + 1) # The last bucket is +Inf
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+    def snapshot(self):
+        return {'buckets': self.buckets, 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+class Telemetry(object):
+    """Metrics for one source (a filter or the experiment itself), sent as snapshots to `queue`
+    at most every `interval` seconds. Metric names are given without the ``auspex_`` prefix and
+    any ``_total`` suffix, and each may carry a dict of extra labels."""
+
+    def __init__(self, source, queue, interval=1.0, **labels):
+        super(Telemetry, self).__init__()
+        self.source      = source
+        self.queue       = queue
+        self.interval    = interval
+        self.labels      = labels
+        self.counters    = {}
+        self.gauges      = {}
+        self.histograms  = {}
+        self.last_update = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())) if labels else ())
+
+    def inc(self, name, amount=1, labels=None):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, labels=None):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, labels=None, buckets=default_buckets):
+        key = self._key(name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        self.histograms[key].observe(value)
+
+    def snapshot(self):
+        return {'labels': self.labels,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {k: h.snapshot() for k, h in self.histograms.items()}}
+
+    def due(self):
+        return time.time() - self.last_update >= self.interval
+
+    def publish(self, force=False):
+        """Send a snapshot if `interval` has elapsed since the last one, or `force` is set."""
+        if force or self.due():
+            self.last_update = time.time()
+            try:
+                self.queue.put((self.source, self.snapshot()))
+            except Exception as e:
+                logger.debug("Could not send telemetry for %s: %s", self.source, e)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, _escape(v)) for k, v in labels) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.collector.render().encode('utf8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Telemetry endpoint: " + format, *args)
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class TelemetryCollector(object):
+    """Collects telemetry snapshots from `queue` on a background thread and exports them.
+
+    Metrics are served at ``http://host:port/metrics`` if `port` is given, and written to
+    `filename` (replaced atomically) every `interval` seconds if it is given. The latest
+    metrics are also available from :meth:`render` after the collector is stopped."""
+
+    def __init__(self, queue, port=None, filename=None, interval=1.0, host="127.0.0.1"):
+        super(TelemetryCollector, self).__init__()
+        self.queue     = queue
+        self.port      = port
+        self.filename  = filename
+        self.interval  = interval
+        self.host      = host
+        self.snapshots = {}
+        self.lock      = threading.Lock()
+        self.exit      = threading.Event()
+        self.thread    = None
+        self.server    = None
+
+    def start(self):
+        if self.port is not None:
+            self.server = _MetricsServer((self.host, self.port), _MetricsHandler)
+            self.server.collector = self
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info("Serving telemetry on http://%s:%d/metrics", self.host, self.server.server_address[1])
+        self.thread = threading.Thread(target=self.collect, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.exit.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.drain()
+        self.write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def drain(self):
+        while True:
+            try:
+                source, snapshot = self.queue.get(False)
+            except queue.Empty:
+                break
+            with self.lock:
+                self.snapshots[source] = snapshot
+
+    def collect(self):
+        last_write = time.time()
+        while not self.exit.is_set():
+            self.drain()
+            if time.time() - last_write >= self.interval:
+                self.write()
+                last_write = time.time()
+            self.exit.wait(0.05)
+
+    def write(self):
+        if self.filename:
+            tmp = self.filename + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(self.render())
+            os.replace(tmp, self.filename)
+
+    def render(self):
+        """The current metrics in the OpenMetrics text format."""
+        families = {} # name -> (type, [lines])
+        with self.lock:
+            snapshots = list(self.snapshots.values())
+
+        def family(name, kind):
+            return families.setdefault("auspex_" + name, (kind, []))[1]
+
+        for snap in snapshots:
+            def merge(labels, base=snap['labels']):
+                return tuple(sorted(dict(base, **dict(labels)).items()))
+            for (name, labels), value in snap['counters'].items():
+                family(name, "counter").append("auspex_{}_total{} {}".format(name, _format_labels(merge(labels)), _format_value(value)))
+            for (name, labels), value in snap['gauges'].items():
+                family(name, "gauge").append("auspex_{}{} {}".format(name, _format_labels(merge(labels)), _format_value(value)))
+            for (name, labels), hist in snap['histograms'].items():
+                lines, cumulative = family(name, "histogram"), 0
+                for bound, count in zip(list(hist['buckets']) + ["+Inf"], hist['counts']):
+                    cumulative += count
+                    le = (("le", bound if bound == "+Inf" else repr(float(bound))),)
+                    lines.append("auspex_{}_bucket{} {}".format(name, _format_labels(merge(labels) + le), cumulative))
+                lines.append("auspex_{}_count{} {}".format(name, _format_labels(merge(labels)), hist['count']))
+                lines.append("auspex_{}_sum{} {}".format(name, _format_labels(merge(labels)), _format_value(hist['sum'])))
+
+        out = []
+        for name in sorted(families):
+            kind, lines = families[name]
+            out.append("# TYPE {} {}".format(name, kind))
+            out.extend(lines)
+        out.append("# EOF")
+        return "\n".join(out) + "\n"
@@ -0,0 +1,45 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+import tempfile
+import os
+
+import auspex.config as config
+config.auspex_dummy_mode = True
+
+from auspex.bench import bench_integrated, bench_correlator, save_results, previous_results
+
+class BenchTestCase(unittest.TestCase):
+
+    def check_results(self, results, filters):
+        self.assertGreater(results['throughput']['records_per_second'], 0)
+        self.assertGreaterEqual(results['throughput']['drain_seconds'], 0)
+        self.assertEqual(set(results['latency_seconds']), {"p50", "p90", "p99", "max"})
+        self.assertTrue(0 < results['latency_seconds']['p50'] <= results['latency_seconds']['max'])
+        self.assertEqual(set(results['filters']), filters)
+
+    def test_integrated(self):
+        results = bench_integrated(rate=5e4, points=4, averages=16, segments=32)
+        self.check_results(results, {"avg", "buffer"})
+        # The source is held to its rate
+        self.assertLess(results['throughput']['source_records_per_second'], 5.5e4)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "bench.jsonl")
+            self.assertTrue(previous_results(results, filename) is None)
+            save_results(results, filename)
+            save_results(dict(results, parameters=dict(results['parameters'], points=5)), filename)
+            self.assertEqual(previous_results(results, filename), results)
+
+    def test_correlator(self):
+        results = bench_correlator(qubits=2, points=3, averages=8, segments=16)
+        self.check_results(results, {"corr", "buffer"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+import numpy as np
+
+from auspex.filters.buffers import RecordBuffer, RingBuffer
+
+class RecordBufferTestCase(unittest.TestCase):
+
+    def test_uneven_chunks(self):
+        buff   = RecordBuffer(7, dtype=np.float64)
+        vals   = np.arange(7*23, dtype=np.float64)
+        chunks = np.split(vals, [3, 4, 20, 21, 50, 90, 91, 140])
+        blocks = [b.copy() for c in chunks for b in buff.assemble(c)]
+        self.assertTrue(all(b.size % 7 == 0 for b in blocks))
+        self.assertTrue(np.all(np.concatenate(blocks) == vals))
+        self.assertEqual(buff.pending, 0)
+
+    def test_views(self):
+        buff   = RecordBuffer(4, dtype=np.float64)
+        data   = np.arange(10, dtype=np.float64)
+        blocks = list(buff.assemble(data))
+        self.assertEqual(len(blocks), 1)
+        self.assertTrue(np.shares_memory(blocks[0], data))
+        self.assertEqual(buff.pending, 2)
+
+        # Completing a record from the staging area reuses it unless asked to copy
+        staged = list(buff.assemble(np.arange(2, dtype=np.float64)))[0]
+        self.assertTrue(staged is buff.staging)
+        list(buff.assemble(np.arange(2, dtype=np.float64)))
+        copied = list(buff.assemble(np.arange(2, dtype=np.float64), copy=True))[0]
+        self.assertFalse(copied is buff.staging)
+
+    def test_dtype_promotion(self):
+        buff = RecordBuffer(3, dtype=np.float32)
+        list(buff.assemble(np.array([1.0, 2.0])))
+        block = list(buff.assemble(np.array([3.0+1.0j])))[0]
+        self.assertTrue(np.iscomplexobj(block))
+        self.assertTrue(np.all(block == np.array([1.0, 2.0, 3.0+1.0j])))
+
+class RingBufferTestCase(unittest.TestCase):
+
+    def test_fifo_order(self):
+        ring = RingBuffer(capacity=8, dtype=np.float64)
+        vals = np.arange(100, dtype=np.float64)
+        out  = []
+        idx  = 0
+        for n_in, n_out in [(5, 3), (6, 7), (1, 0), (20, 15), (3, 10), (65, 60)]:
+            ring.push(vals[idx:idx+n_in])
+            idx += n_in
+            out.append(ring.pop(n_out))
+        self.assertTrue(np.all(np.concatenate(out) == vals[:95]))
+        self.assertEqual(len(ring), 5)
+        self.assertRaises(ValueError, ring.pop, 6)
+
+    def test_steady_state(self):
+        ring = RingBuffer(capacity=16, dtype=np.float64)
+        out  = np.empty(10)
+        for i in range(20):
+            ring.push(np.full(10, i, dtype=np.float64))
+            data = ring.data
+            ring.pop(10, out=out)
+            self.assertTrue(np.all(out == i))
+        self.assertTrue(ring.data is data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -56,6 +56,30 @@ class CorrelatorExperiment(Experiment):
             time.sleep(0.002)
             logger.debug("Idx_1: %d, Idx_2: %d", self.idx_1, self.idx_2)
 
+class ThreeStreamExperiment(Experiment):
+
+    # DataStreams
+    chan1 = OutputConnector()
+    chan2 = OutputConnector()
+    chan3 = OutputConnector()
+
+    # Constants
+    samples = 100
+
+    # For correlator verification
+    vals = 2.0 + np.linspace(0, 10*np.pi, samples)
+
+    def init_streams(self):
+        for chan in [self.chan1, self.chan2, self.chan3]:
+            chan.add_axis(DataAxis("samples", list(range(self.samples))))
+
+    def run(self):
+        # Deliver the streams in very different chunk sizes
+        for chan, num in [(self.chan1, 7), (self.chan2, 33), (self.chan3, 2)]:
+            for idx in range(0, self.samples, num):
+                chan.push(self.vals[idx:idx+num])
+        time.sleep(0.002)
+
 class CorrelatorTestCase(unittest.TestCase):
 
     def test_correlator(self):
@@ -74,6 +98,23 @@ class CorrelatorTestCase(unittest.TestCase):
         expected_data = exp.vals*exp.vals
         self.assertAlmostEqual(np.sum(corr_data), np.sum(expected_data), places=1)
 
+    def test_correlator_three_streams(self):
+        exp   = ThreeStreamExperiment()
+        corr  = Correlator(name='corr')
+        buff  = DataBuffer()
+
+        edges = [(exp.chan1,   corr.sink),
+                 (exp.chan2,   corr.sink),
+                 (exp.chan3,   corr.sink),
+                 (corr.source, buff.sink)]
+
+        exp.set_graph(edges)
+        exp.run_sweeps()
+        time.sleep(0.1)
+        corr_data     = buff.output_data
+        expected_data = exp.vals**3
+        self.assertTrue(np.allclose(corr_data, expected_data))
+
 
 if __name__ == '__main__':
     unittest.main()
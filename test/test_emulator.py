@@ -0,0 +1,231 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+import time
+import socket
+import struct
+import threading
+import numpy as np
+from multiprocessing import Queue, Process, Event, Value
+
+import auspex.config as config
+config.auspex_dummy_mode = True
+
+from auspex.instruments import AlazarATS9870, AlazarChannel, X6, X6Channel
+from auspex.instruments.emulator import emulate_records
+from auspex.instruments.instrument import ReceiveBufferPool
+
+class OC(object):
+    def __init__(self):
+        self.queue = Queue()
+        self.points_taken = Value('i', 0)
+    def push(self, data):
+        self.queue.put(data)
+        self.points_taken.value += data.size
+
+class EmulatorTestCase(unittest.TestCase):
+
+    def test_records(self):
+        ideal = np.linspace(0, 1, 8) + 0.5j
+        data  = emulate_records("integrated", 8000, 8, ideal=ideal, noise=0.1).reshape(-1, 8)
+        self.assertEqual(data.dtype, np.complex128)
+        self.assertTrue(np.allclose(data.mean(axis=0), ideal + 0.05 + 0.05j, atol=0.01))
+
+        data = emulate_records("raw", 6, 3, length=64, ideal=[0.0, 2.0, 3.0], noise=0.0).reshape(6, 64)
+        self.assertEqual(data.dtype, np.float32)
+        self.assertAlmostEqual(np.abs(data[3]).max(), 1.0, places=2)
+        self.assertTrue(np.allclose(data[2], 3*data[0]))
+
+        data = emulate_records("demodulated", 2, 2, length=16, noise_type="gaussian", noise=0.0)
+        self.assertTrue(np.all(data.reshape(2, 16)[:, 4:12] == 1.0))
+
+        # Qubit states are mixed in the requested proportions
+        data = emulate_records("integrated", 20000, 2, state_values=[[0.0, 0.0], [1.0, 1.0]],
+                               state_probabilities=[[0.9, 0.2], [0.1, 0.8]], noise=0.0).reshape(-1, 2)
+        self.assertTrue(np.allclose(data.real.mean(axis=0), [0.1, 0.8], atol=0.02))
+        self.assertRaises(ValueError, emulate_records, "iq", 1, 1)
+
+    def test_buffer_pool(self):
+        rsock, wsock = socket.socketpair()
+        rsock.settimeout(0.2)
+        pool = ReceiveBufferPool(max_buffers=2)
+        self.assertIsNone(pool.receive(rsock, np.float32))
+
+        # Messages arriving in pieces are reassembled
+        msg = np.arange(1000, dtype=np.float32)
+        payload = struct.pack('n', msg.nbytes) + msg.tobytes()
+        def dribble():
+            for i in range(0, len(payload), 999):
+                wsock.sendall(payload[i:i+999])
+                time.sleep(0.005)
+        sender = threading.Thread(target=dribble)
+        sender.start()
+        first = pool.receive(rsock, np.float32)
+        sender.join()
+        self.assertTrue(np.all(first == msg))
+
+        # Buffers still referenced are not reused, released ones are
+        wsock.sendall(payload)
+        second = pool.receive(rsock, np.float32)
+        self.assertFalse(np.shares_memory(first, second))
+        self.assertIs(second.base, pool.buffers[1])
+        del second
+        wsock.sendall(struct.pack('n', 400) + msg[:100].tobytes())
+        third = pool.receive(rsock, np.float32)
+        self.assertIs(third.base, pool.buffers[1])
+        self.assertTrue(np.all(third == msg[:100]))
+        self.assertTrue(np.all(first == msg))
+        self.assertEqual(len(pool.buffers), 2)
+
+        wsock.close()
+        self.assertRaises(ConnectionError, pool.receive, rsock, np.float32)
+        rsock.close()
+
+    def acquire(self, dig, ch, dtype):
+        oc    = OC()
+        exit  = Event()
+        run   = Event()
+        ready = Value('i', 0)
+        proc  = Process(target=dig.receive_data, args=(ch, oc, exit, ready, run))
+        proc.start()
+        while ready.value < 1:
+            time.sleep(0.01)
+        run.set()
+        dig.wait_for_acquisition(run, timeout=5, ocs=[oc])
+        exit.set()
+        data = []
+        while oc.points_taken.value > sum(d.size for d in data):
+            data.append(oc.queue.get())
+        proc.join(3.0)
+        if proc.is_alive():
+            proc.terminate()
+        dig.disconnect()
+        data = np.concatenate(data)
+        self.assertEqual(data.dtype, dtype)
+        return data
+
+    def test_alazar(self):
+        alz = AlazarATS9870(resource_name="1")
+        ch  = AlazarChannel()
+        ch.phys_channel = 1
+        alz.add_channel(ch)
+        alz.emulate(round_robins_per_message=7)
+        alz.connect()
+        alz.record_length, alz.number_segments, alz.number_averages = 256, 10, 50
+        alz.ideal_data = np.linspace(1, 2, 10)
+
+        data = self.acquire(alz, ch, np.float32)
+        self.assertEqual(data.size, 50*10*256)
+        data = data.reshape(50, 10, 256)
+        peaks = np.abs(data.mean(axis=0) - 0.05).max(axis=1)
+        self.assertTrue(np.allclose(peaks, np.linspace(1, 2, 10), atol=0.02))
+
+    def test_wakeup(self):
+        alz = AlazarATS9870(resource_name="1")
+        ch  = AlazarChannel()
+        ch.phys_channel = 1
+        alz.add_channel(ch)
+        alz.connect()
+        alz.record_length, alz.number_segments, alz.number_averages = 128, 2, 2
+        alz.gen_fake_data = False # Wait on the receivers as with a real card
+        alz.acquire()
+
+        oc    = OC()
+        exit  = Event()
+        run   = Event()
+        ready = Value('i', 0)
+        proc  = Process(target=alz.receive_data, args=(ch, oc, exit, ready, run))
+        proc.start()
+        while ready.value < 1:
+            time.sleep(0.01)
+        run.set()
+
+        def deliver():
+            time.sleep(0.05)
+            counter = {ch: 0}
+            for _ in range(4):
+                alz.spew_fake_data(counter)
+        start  = time.time()
+        sender = threading.Thread(target=deliver)
+        sender.start()
+        alz.wait_for_acquisition(run, timeout=5, ocs=[oc])
+        elapsed = time.time() - start
+        sender.join()
+        exit.set()
+        proc.join(3.0)
+        if proc.is_alive():
+            proc.terminate()
+        alz.disconnect()
+
+        # Done as soon as the data arrives rather than at the next poll
+        self.assertGreaterEqual(oc.points_taken.value, 4*128)
+        self.assertLess(elapsed, 0.15)
+
+    def test_x6_wakeup(self):
+        x6 = X6(resource_name="0")
+        ch = X6Channel()
+        ch.stream_type = "integrated"
+        ch.dtype = np.complex128
+        x6.add_channel(ch)
+        x6.connect()
+        x6.record_length, x6.number_segments, x6.number_averages = 1024, 4, 3
+        x6.get_socket(ch)
+        x6.acquire()
+
+        oc    = OC()
+        exit  = Event()
+        run   = Event()
+        ready = Value('i', 0)
+        proc  = Process(target=x6.receive_data, args=(ch, oc, exit, ready, run))
+        proc.start()
+        while ready.value < 1:
+            time.sleep(0.01)
+        run.set()
+
+        def deliver():
+            time.sleep(0.05)
+            counter = {ch: 0}
+            for _ in range(12):
+                x6.spew_fake_data(counter)
+        start  = time.time()
+        sender = threading.Thread(target=deliver)
+        sender.start()
+        x6.wait_for_acquisition(run, timeout=5, ocs=[oc])
+        elapsed = time.time() - start
+        sender.join()
+        exit.set()
+        proc.join(3.0)
+        if proc.is_alive():
+            proc.terminate()
+
+        # Done once the expected count arrives, without asking the card
+        self.assertEqual(oc.points_taken.value, 12)
+        self.assertLess(elapsed, 0.15)
+        self.assertFalse(x6._lib.get_data_available.called)
+        x6.disconnect()
+
+    def test_x6_rate(self):
+        x6 = X6(resource_name="0")
+        ch = X6Channel()
+        ch.stream_type = "integrated"
+        ch.dtype = np.complex128
+        x6.add_channel(ch)
+        x6.emulate(rate=2e4, state_values=[0.0, 1.0], state_probabilities=[0.25, 0.75])
+        x6.connect()
+        x6.record_length, x6.number_segments, x6.number_averages = 1024, 100, 40
+        x6.get_socket(ch)
+
+        start = time.time()
+        data  = self.acquire(x6, ch, np.complex128)
+        self.assertGreater(time.time() - start, 0.15)
+        self.assertEqual(data.size, 40*100)
+        self.assertAlmostEqual(np.mean(data.real > 0.5), 0.75, delta=0.03)
+
+if __name__ == '__main__':
+    unittest.main()
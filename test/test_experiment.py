@@ -101,6 +101,22 @@ class ExperimentTestCase(unittest.TestCase):
         self.assertTrue(te._instruments['fake_instr_2'] == te.fake_instr_2) # should contain this instrument
         self.assertTrue(te._instruments['fake_instr_3'] == te.fake_instr_3) # should contain this instrument
 
+    def test_concurrent_setup(self):
+        """Check that instruments can be set up concurrently, and that errors get through"""
+        te = TestExperiment()
+        def slow(instrument):
+            time.sleep(0.1)
+        config.concurrent_instrument_setup = 3
+        try:
+            start = time.time()
+            te.for_each_instrument(slow)
+            self.assertLess(time.time() - start, 0.25)
+            def fail(instrument):
+                raise ValueError(instrument.name)
+            self.assertRaises(ValueError, te.for_each_instrument, fail)
+        finally:
+            config.concurrent_instrument_setup = 0
+
     def test_create_graph(self):
         exp         = TestExperiment()
         printer_one = Print(name="One")
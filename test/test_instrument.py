@@ -11,13 +11,74 @@ import unittest
 import auspex.config as config
 config.auspex_dummy_mode = True
 
-from auspex.instruments.instrument import SCPIInstrument, StringCommand, FloatCommand, IntCommand
+import time
+import socket
+import asyncio
+import threading
+from auspex.instruments.interface import Interface
+from auspex.instruments.prologix import PrologixSocketResource, prologix_pool
+from auspex.instruments.instrument import SCPIInstrument, StringCommand, FloatCommand, IntCommand, RampCommand
 
 class TestInstrument(SCPIInstrument):
 	frequency     = FloatCommand(get_string="frequency?", set_string="frequency {:g}", value_range=(0.1, 10))
 	serial_number = IntCommand(get_string="serial?")
 	mode          = StringCommand(name="enumerated mode", scpi_string=":mode", allowed_values=["A", "B", "C"])
 
+class CachedInstrument(SCPIInstrument):
+	frequency = FloatCommand(scpi_string=":freq", cacheable=True)
+	power     = FloatCommand(scpi_string=":pow", cacheable=True, cache_ttl=0.05)
+	field     = RampCommand(scpi_string=":field", increment=1.0, cacheable=True)
+	status    = StringCommand(get_string=":stat?")
+
+class RecordingInterface(object):
+	"""Remembers what was written and queried."""
+	def __init__(self):
+		self.messages = []
+		self.write_count = 0
+	def write(self, value):
+		self.messages.append(value)
+		self.write_count += 1
+	def query(self, value):
+		self.messages.append(value)
+		return "1"
+	def close(self):
+		pass
+
+class FakePrologix(threading.Thread):
+	"""Answers queries with the GPIB address they were sent to, like a Prologix with instruments behind it."""
+	def __init__(self):
+		super(FakePrologix, self).__init__(daemon=True)
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.bind(("127.0.0.1", 0))
+		self.server.listen(4)
+		self.port = self.server.getsockname()[1]
+		self.connections = 0
+		self.lines = []
+	def run(self):
+		while True:
+			try:
+				conn, _ = self.server.accept()
+			except OSError:
+				return
+			self.connections += 1
+			addr, pending = None, b""
+			while True:
+				chunk = conn.recv(1024)
+				if not chunk:
+					break
+				pending += chunk
+				while b"\n" in pending:
+					line, pending = pending.split(b"\n", 1)
+					line = line.decode().strip()
+					self.lines.append(line)
+					if line == "++ver":
+						conn.sendall(b"Prologix GPIB-ETHERNET Controller version 01.06.06.00\r\n")
+					elif line.startswith("++addr"):
+						addr = int(line.split()[1])
+					elif line.endswith("?"):
+						conn.sendall("instrument {}\r\n".format(addr).encode())
+			conn.close()
+
 class InstrumentTestCase(unittest.TestCase):
 	"""
 	Tests instrument commands
@@ -60,5 +121,133 @@ class InstrumentTestCase(unittest.TestCase):
 		with self.assertRaises(TypeError):
 			self.instrument.nonexistent_property = 16
 
+	def test_batch(self):
+		"""Check that batched commands are joined into few messages, in order."""
+		self.instrument = TestInstrument("DUMMY::RESOURCE")
+		self.instrument.connect()
+		self.instrument.interface = RecordingInterface()
+		with self.instrument.batch(opc=True):
+			self.instrument.frequency = 1
+			self.instrument.mode = "B"
+			self.assertEqual(self.instrument.interface.messages, [])
+			with self.instrument.batch():
+				self.instrument.frequency = 2
+		self.assertEqual(self.instrument.interface.messages, [":frequency 1;:mode B;:frequency 2", "*OPC?"])
+
+		# Queries see what was set before them, long batches are split
+		self.instrument.interface = RecordingInterface()
+		with self.instrument.batch(max_length=30):
+			self.instrument.frequency = 3
+			self.assertEqual(self.instrument.serial_number, 1)
+			for v in [4, 5, 6]:
+				self.instrument.frequency = v
+		self.assertEqual(self.instrument.interface.messages,
+						 [":frequency 3", "serial?", ":frequency 4;:frequency 5", ":frequency 6"])
+
+		# Errors don't lose what was already set
+		self.instrument.interface = RecordingInterface()
+		with self.assertRaises(ValueError):
+			with self.instrument.batch():
+				self.instrument.frequency = 7
+				self.instrument.mode = "D"
+		self.assertEqual(self.instrument.interface.messages, [":frequency 7"])
+		self.instrument.frequency = 8
+		self.assertEqual(self.instrument.interface.messages, [":frequency 7", "frequency 8"])
+
+	def test_query_cache(self):
+		"""Check that cacheable commands are only read when needed."""
+		self.instrument = CachedInstrument("DUMMY::RESOURCE")
+		self.instrument.connect()
+		self.instrument.interface = messages = RecordingInterface()
+		self.assertEqual(self.instrument.frequency, 1.0)
+		self.assertEqual(self.instrument.frequency, 1.0)
+		self.instrument.status
+		self.instrument.status
+		self.assertEqual(messages.messages, [":freq?;", ":stat?", ":stat?"])
+
+		# Sets are remembered, but forget everything else
+		self.instrument.power
+		self.instrument.frequency = 5
+		self.assertEqual(self.instrument.frequency, 5.0)
+		self.instrument.power
+		self.assertEqual(messages.messages[3:], [":pow?;", ":freq 5.000000E+00", ":pow?;"])
+
+		# Writes, e.g. resets, and time invalidate values
+		del messages.messages[:]
+		self.instrument.interface.write("*RST")
+		self.instrument.frequency
+		self.instrument.power
+		time.sleep(0.06)
+		self.instrument.power
+		self.instrument.invalidate_cache()
+		self.instrument.frequency
+		self.assertEqual(messages.messages, ["*RST", ":freq?;", ":pow?;", ":pow?;", ":freq?;"])
+
+		# Ramps start from the cached value
+		self.instrument.field = 3.0
+		del messages.messages[:]
+		self.instrument.field = 5.0
+		self.assertFalse(any("?" in m for m in messages.messages))
+		self.assertEqual(messages.messages[0], ":field 3.000000E+00")
+
+	def test_async_io(self):
+		"""Check that the asynchronous I/O methods reach the interface."""
+		interface = Interface()
+		async def talk():
+			await asyncio.gather(interface.awrite("a"), interface.awrite("b"))
+			return await interface.aquery(":output?;")
+		self.assertEqual(asyncio.new_event_loop().run_until_complete(talk()), "on")
+		self.assertEqual(interface.write_count, 2)
+
+		# Synchronous calls wait for transactions in progress
+		def transaction():
+			with interface.io_lock:
+				time.sleep(0.1)
+		other = threading.Thread(target=transaction)
+		other.start()
+		time.sleep(0.02)
+		start = time.time()
+		interface.write("c")
+		self.assertGreater(time.time() - start, 0.05)
+		other.join()
+
+	def test_prologix_pool(self):
+		"""Check that instruments behind one Prologix share its connection."""
+		fake = FakePrologix()
+		fake.start()
+		resources = [PrologixSocketResource("127.0.0.1", gpib) for gpib in (1, 2)]
+		for resource in resources:
+			resource.port = fake.port
+			resource.connect()
+		self.assertIs(resources[0].connection, resources[1].connection)
+		self.assertEqual(fake.connections, 1)
+		self.assertEqual(resources[0].query("freq?"), "instrument 1")
+		self.assertEqual(resources[0].query("freq?"), "instrument 1")
+		self.assertEqual(resources[1].query("freq?"), "instrument 2")
+		self.assertEqual([l for l in fake.lines if l.startswith("++addr")], ["++addr 1", "++addr 2", "++addr 1", "++addr 2"])
+
+		# Timeouts only apply to the instrument's own transactions
+		resources[0].timeout = 0.5
+		self.assertEqual(resources[0].query("freq?"), "instrument 1")
+		self.assertEqual(resources[1].sock.gettimeout(), 5)
+
+		# Controllers on other ports get their own connection
+		other = FakePrologix()
+		other.start()
+		third = PrologixSocketResource("127.0.0.1", 1)
+		third.port = other.port
+		third.connect()
+		self.assertIsNot(third.connection, resources[0].connection)
+		self.assertEqual(other.connections, 1)
+		third.close()
+		other.server.close()
+
+		# The connection lasts until the last instrument lets go
+		resources[0].close()
+		self.assertIn(("127.0.0.1", fake.port), prologix_pool.connections)
+		resources[1].close()
+		self.assertNotIn(("127.0.0.1", fake.port), prologix_pool.connections)
+		fake.server.close()
+
 if __name__ == '__main__':
 	unittest.main()
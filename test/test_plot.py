@@ -0,0 +1,196 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+import time
+import numpy as np
+
+from auspex.stream import DataAxis, DataStreamDescriptor
+from auspex.filters.plot import Plotter, _decimate_1d, _decimate_2d, _in_range, _encode, _decode
+
+try:
+    import lz4
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class DecimationTestCase(unittest.TestCase):
+
+    def test_minmax_keeps_peaks(self):
+        x = np.linspace(0, 1, 10001)
+        y = np.sin(40*x)
+        y[1234] = 10.0
+        y[8765] = -10.0
+        xd, yd = _decimate_1d(x, y, 200)
+        self.assertLessEqual(yd.size, 200)
+        self.assertEqual(yd.max(), 10.0)
+        self.assertEqual(yd.min(), -10.0)
+        self.assertTrue(np.all(np.diff(xd) >= 0))
+        self.assertTrue(np.all(np.interp(xd, x, y) == yd))
+
+    def test_complex_and_nan(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.exp(1j*x/50.0)*(1 + x/1000.0)
+        y[500:] = np.nan
+        xd, yd = _decimate_1d(x, y, 100)
+        self.assertTrue(np.iscomplexobj(yd))
+        self.assertAlmostEqual(np.nanmax(np.abs(yd)), np.abs(y[499]))
+        self.assertTrue(np.all(np.isnan(yd[xd >= 500])))
+
+        xd, yd = _decimate_1d(x, y, 100, mode="mean")
+        self.assertEqual(yd.size, 100)
+        self.assertTrue(np.all(np.isfinite(yd[:50])) and np.all(np.isnan(yd[50:])))
+
+    def test_decimate_2d(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.arange(300, dtype=np.float64)
+        z = (y[:,None] + 0*x[None,:]).ravel()
+        z[:3000] = np.nan
+        xd, yd, zd = _decimate_2d(x, y, z, 128, 128)
+        self.assertLessEqual(xd.size, 128)
+        self.assertLessEqual(yd.size, 128)
+        self.assertEqual(zd.size, xd.size*yd.size)
+        zd = zd.reshape(yd.size, xd.size)
+        self.assertTrue(np.all(np.isnan(zd[0])))
+        self.assertTrue(np.allclose(zd[1:,0], yd[1:]))
+
+        # Small images are passed through untouched
+        small = z[:100]
+        self.assertTrue(_decimate_2d(x[:10], y[:10], small, 128, 128)[2] is small)
+
+    def test_in_range(self):
+        x = np.linspace(0, 10, 101)
+        self.assertEqual(x[_in_range(x, None)].size, 101)
+        sel = x[_in_range(x, [2.5, 2.0])]
+        self.assertAlmostEqual(sel[0], 1.9)
+        self.assertAlmostEqual(sel[-1], 2.6)
+
+class EncodingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.full(20000, np.nan + 1.0j*np.nan)
+        self.data[:1500] = np.exp(1j*np.arange(1500)/10.0)
+        self.data[3000:3100] = 1.0
+        self.data[3050] = np.nan + 2.0j # Only partly unfilled, so kept
+
+    def test_sparse(self):
+        md, payload = _encode(self.data)
+        self.assertEqual(md['runs'], [[0, 1500], [3000, 3100]])
+        self.assertEqual(payload.nbytes, 1600*16)
+        decoded = _decode(md, payload.tobytes())
+        self.assertTrue(np.array_equal(decoded, self.data, equal_nan=True))
+
+        # Dense data is sent as is
+        md, payload = _encode(self.data[:1500])
+        self.assertFalse('runs' in md)
+        self.assertTrue(np.array_equal(_decode(md, payload.tobytes()), self.data[:1500]))
+
+    def test_downcast(self):
+        md, payload = _encode(self.data, downcast=True)
+        decoded = _decode(md, payload.tobytes())
+        self.assertEqual(decoded.dtype, np.complex64)
+        self.assertTrue(np.allclose(decoded, self.data, equal_nan=True))
+
+        # Integers, like patch offsets, are left alone
+        md, payload = _encode(np.array([12]), downcast=True)
+        self.assertEqual(_decode(md, payload.tobytes())[0], 12)
+
+    @unittest.skipIf(lz4 is None, "lz4 is not installed")
+    def test_lz4(self):
+        md, payload = _encode(self.data, compression="lz4")
+        self.assertEqual(md['compression'], "lz4")
+        self.assertTrue(np.array_equal(_decode(md, payload), self.data, equal_nan=True))
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        md, payload = _encode(self.data, compression="zstd", downcast=True)
+        self.assertEqual(md['compression'], "zstd")
+        self.assertTrue(np.allclose(_decode(md, payload), self.data, equal_nan=True))
+
+class PlotterPatchTestCase(unittest.TestCase):
+
+    def make_plotter(self, axes, **kwargs):
+        plotter = Plotter(name="plot", **kwargs)
+        plotter.descriptor = DataStreamDescriptor(dtype=np.complex128)
+        for name, points in axes:
+            plotter.descriptor.add_axis(DataAxis(name, points))
+        plotter.final_init()
+        plotter.lod.update(x_pixels=100, y_pixels=50)
+        plotter.keyframe_lod  = dict(plotter.lod)
+        plotter.last_keyframe = time.time()
+        return plotter
+
+    def check_patches(self, plotter, apply_patch):
+        frame = plotter.decimated(plotter.plot_buffer.copy())
+        vals  = np.exp(1j*np.arange(plotter.points_before_clear)/300.0)
+        sent  = 0
+        for start in range(0, plotter.points_before_clear, 937):
+            stop = min(start + 937, plotter.points_before_clear)
+            plotter.plot_buffer[start:stop] = vals[start:stop]
+            patch = plotter.patch(plotter.plot_buffer, [start, stop])
+            self.assertTrue(patch is not None)
+            sent += sum(p.size for p in patch)
+            apply_patch(frame, patch)
+            for a, b in zip(frame, plotter.decimated(plotter.plot_buffer)):
+                self.assertTrue(np.allclose(a, b, equal_nan=True))
+        self.assertLess(sent, 3*sum(f.size for f in frame))
+
+        # A changed level of detail forces a keyframe
+        plotter.lod['x_pixels'] = 200
+        self.assertTrue(plotter.patch(plotter.plot_buffer, [0, 1]) is None)
+
+    def test_patch_1d(self):
+        for decimation in ["minmax", "mean", None]:
+            plotter = self.make_plotter([("x", np.linspace(0, 1, 20000))], decimation=decimation)
+            def apply_patch(frame, patch):
+                offset, x, y = patch
+                frame[0][offset[0]:offset[0]+x.size] = x
+                frame[1][offset[0]:offset[0]+y.size] = y
+            self.check_patches(plotter, apply_patch)
+
+    def test_patch_2d(self):
+        plotter = self.make_plotter([("y", np.arange(300.0)), ("x", np.arange(120.0))])
+        def apply_patch(frame, patch):
+            offset, rows = patch
+            image = frame[2].reshape(-1, frame[0].size)
+            rows  = rows.reshape(-1, frame[0].size)
+            image[offset[0]:offset[0]+rows.shape[0]] = rows
+        self.check_patches(plotter, apply_patch)
+
+    def test_plot_thread_drops_stale_snapshots(self):
+        plotter = self.make_plotter([("x", np.linspace(0, 1, 5000))])
+        plotter.update_interval = 0.0
+        shipped = []
+        def slow_ship(buffer, dirty):
+            time.sleep(0.05)
+            shipped.append((buffer, list(dirty)))
+        plotter.ship = slow_ship
+        plotter.execute_on_run()
+        plotter.dirty = [plotter.points_before_clear, 0]
+        try:
+            start = time.time()
+            for i in range(50):
+                plotter.process_data(np.full(100, i, dtype=np.complex128))
+            self.assertLess(time.time() - start, 0.5)
+        finally:
+            plotter.stop_plotting()
+            plotter.socket.close()
+            plotter.context.term()
+
+        self.assertLess(len(shipped), 50)
+        buffer, dirty = shipped[-1]
+        self.assertTrue(np.all(buffer == plotter.plot_buffer))
+        # The merged dirty ranges cover everything written after the first shipped snapshot
+        covered = sum(d[1] - d[0] for b, d in shipped)
+        self.assertEqual(covered, 5000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+import tempfile
+import json
+import time
+import os
+import glob
+import numpy as np
+
+import auspex.config as config
+config.auspex_dummy_mode = True
+
+from auspex.experiment import Experiment
+from auspex.parameter import FloatParameter
+from auspex.stream import DataAxis, OutputConnector
+from auspex.filters.average import Averager
+from auspex.filters.io import DataBuffer
+from auspex.profiler import SamplingProfiler
+
+def busy_loop(seconds):
+    start = time.process_time()
+    total = 0
+    while time.process_time() - start < seconds:
+        total += sum(range(100))
+    return total
+
+class SweptTestExperiment(Experiment):
+    """Here the run loop merely spews data until it fills up the stream. """
+
+    # Parameters
+    field = FloatParameter(unit="Oe")
+
+    # DataStreams
+    voltage = OutputConnector()
+
+    def init_instruments(self):
+        self.field.assign_method(lambda x: None)
+
+    def init_streams(self):
+        self.voltage.add_axis(DataAxis("samples", list(range(1000))))
+
+    def __repr__(self):
+        return "<SweptTestExperiment>"
+
+    def run(self):
+        time.sleep(0.002)
+        self.voltage.push(np.random.random(1000))
+
+class SamplingProfilerTestCase(unittest.TestCase):
+
+    def check_samples(self, profiler):
+        self.assertGreater(sum(profiler.samples.values()), 10)
+        busy = sum(c for s, c in profiler.samples.items() if any(f[0] == "busy_loop" for f in s))
+        self.assertGreater(busy, 0.8*sum(profiler.samples.values()))
+
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(all(int(l.rsplit(" ", 1)[1]) > 0 for l in lines))
+        self.assertTrue(any("busy_loop (" in l for l in lines))
+
+        profile = profiler.speedscope("test")
+        frames  = profile['shared']['frames']
+        sampled = profile['profiles'][0]
+        self.assertEqual(len(sampled['samples']), len(sampled['weights']))
+        self.assertTrue(all(0 <= i < len(frames) for s in sampled['samples'] for i in s))
+        self.assertAlmostEqual(sampled['endValue'], sum(profiler.samples.values())*profiler.interval)
+
+    def test_cpu(self):
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        busy_loop(0.2)
+        profiler.stop()
+        self.check_samples(profiler)
+
+        # Nothing is sampled once stopped
+        count = sum(profiler.samples.values())
+        busy_loop(0.05)
+        self.assertEqual(sum(profiler.samples.values()), count)
+
+    def test_wall(self):
+        profiler = SamplingProfiler(interval=0.002, clock="wall")
+        self.assertFalse(profiler.use_signal)
+        profiler.start()
+        busy_loop(0.2)
+        profiler.stop()
+        self.check_samples(profiler)
+        self.assertRaises(ValueError, SamplingProfiler, clock="gpu")
+
+    def test_filters(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            config.profile = "sampling"
+            config.profile_filters = ["avg"]
+            try:
+                exp = SweptTestExperiment()
+                avg = Averager("samples", name="avg")
+                db  = DataBuffer(name="db")
+                exp.set_graph([(exp.voltage, avg.sink), (avg.source, db.sink)])
+                exp.add_sweep(exp.field, np.linspace(0, 100.0, 50))
+                exp.run_sweeps()
+                files = sorted(glob.glob("prof-*"))
+                with open("prof-Averager-avg.speedscope.json") as f:
+                    profile = json.load(f)
+            finally:
+                config.profile = False
+                config.profile_filters = None
+                os.chdir(cwd)
+        self.assertEqual(files, ["prof-Averager-avg.collapsed", "prof-Averager-avg.speedscope.json"])
+        self.assertEqual(profile['profiles'][0]['type'], "sampled")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+
+from auspex.filters.rate import AdaptiveInterval
+
+class AdaptiveIntervalTestCase(unittest.TestCase):
+
+    def test_budget(self):
+        rate = AdaptiveInterval(interval=0.5, budget=0.1, smoothing=1.0)
+        self.assertEqual(rate.interval, 0.5)
+        self.assertAlmostEqual(rate.record("send", 0.002), 0.05)
+        # Costs of the different parts of an update add up
+        self.assertAlmostEqual(rate.record("render", 0.05), 0.52)
+        self.assertAlmostEqual(rate.record("render", 0.0), 0.05)
+        # ...and the interval is clipped
+        self.assertEqual(rate.record("render", 10.0), 10.0)
+        self.assertRaises(ValueError, AdaptiveInterval, budget=0.0)
+
+    def test_bandwidth(self):
+        rate = AdaptiveInterval(budget=None, bandwidth=1e6, smoothing=1.0)
+        self.assertAlmostEqual(rate.record("send", 1.0, 2e6), 2.0)
+        rate = AdaptiveInterval(budget=0.5, bandwidth=1e6, smoothing=1.0)
+        self.assertAlmostEqual(rate.record("send", 2.0, 1e6), 4.0)
+
+    def test_smoothing(self):
+        rate = AdaptiveInterval(budget=1.0, smoothing=0.5)
+        rate.record("send", 1.0)
+        for i in range(20):
+            interval = rate.record("send", 3.0)
+        self.assertAlmostEqual(interval, 3.0, places=4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
+import unittest
 import numpy as np
 import matplotlib.pyplot as plt
 import auspex.config as config
 config.auspex_dummy_mode = True
 from auspex.filters import SingleShotMeasurement as SSM
+from auspex.filters.singleshot import _histogram_fidelities, _binned_kde, _RunningMoments
+from scipy.stats import gaussian_kde
 
 def generate_fake_data(alpha, phi, sigma, N = 5000, plot=False):
 
@@ -39,6 +42,137 @@ def generate_fake_data(alpha, phi, sigma, N = 5000, plot=False):
     return gnd, ex
 
 
+class SingleShotFilterTestCase(unittest.TestCase):
+
+    def test_histogram_fidelities(self):
+        ground  = np.cumsum(np.random.normal(0.0, 1.0, (40, 500)), axis=0)
+        excited = np.cumsum(np.random.normal(0.1, 1.0, (40, 500)), axis=0)
+        ground[0, :] = excited[0, :] = 0.0 # Degenerate range
+        expected = np.zeros(40)
+        for pt in range(40):
+            bins = np.linspace(min(ground[pt].min(), excited[pt].min()), max(ground[pt].max(), excited[pt].max()), 100)
+            g_PDF = np.histogram(ground[pt], bins)[0]
+            e_PDF = np.histogram(excited[pt], bins)[0]
+            expected[pt] = np.sum(np.abs(g_PDF - e_PDF)) / np.sum(g_PDF + e_PDF)
+        self.assertTrue(np.allclose(_histogram_fidelities(ground, excited), expected, atol=1e-2))
+
+    def test_optimal_integration_time(self):
+        np.random.seed(12345)
+        gnd, ex = generate_fake_data(3, np.pi/5, 1.6, N=1000)
+        results = []
+        for workers in [1, 4]:
+            ss = SSM(time_chunk_size=16, integration_time_workers=workers)
+            ss.optimal_integration_time.value = True
+            ss.ground_data = gnd
+            ss.excited_data = ex
+            ss.compute_filter()
+            results.append((ss.best_integration_time, ss.fidelity_result))
+        self.assertEqual(results[0], results[1])
+
+        # Same choice as binning every integration time with np.histogram
+        int_ground  = np.cumsum(np.real(gnd*ss.kernel[:, np.newaxis]), axis=0)
+        int_excited = np.cumsum(np.real(ex*ss.kernel[:, np.newaxis]), axis=0)
+        expected = np.zeros(int_ground.shape[0])
+        for pt in range(int_ground.shape[0]):
+            bins = np.linspace(min(int_ground[pt].min(), int_excited[pt].min()), max(int_ground[pt].max(), int_excited[pt].max()), 100)
+            g_PDF = np.histogram(int_ground[pt], bins)[0]
+            e_PDF = np.histogram(int_excited[pt], bins)[0]
+            expected[pt] = np.sum(np.abs(g_PDF - e_PDF)) / np.sum(g_PDF + e_PDF)
+        self.assertLessEqual(abs(results[0][0] - expected.argmax()), 2)
+        self.assertAlmostEqual(expected[results[0][0]], expected.max(), delta=1e-2)
+
+    def test_binned_kde(self):
+        samples = np.concatenate([np.random.normal(0, 1, 4000), np.random.normal(3, 0.5, 1000)])
+        bins    = np.linspace(samples.min(), samples.max(), 100)
+        exact   = gaussian_kde(samples)(bins)
+        self.assertTrue(np.allclose(_binned_kde(samples, bins), exact, atol=1e-3*exact.max()))
+
+    def test_threshold_reuses_pdfs(self):
+        gnd, ex = generate_fake_data(3, np.pi/5, 1.6, N=1000)
+        ss = SSM(density_estimator="binned")
+        ss.ground_data = gnd
+        ss.excited_data = ex
+        ss.compute_filter()
+        self.assertFalse("I Threshold" in ss.pdf_data)
+        threshold = ss.compute_threshold()
+        self.assertEqual(ss.pdf_data["I Threshold"], threshold)
+        self.assertTrue(ss.pdf_data["I Bins"][0] < threshold < ss.pdf_data["I Bins"][-1])
+        self.assertRaises(ValueError, SSM, density_estimator="histogram")
+
+    def test_running_moments(self):
+        shots   = np.random.normal(0, 1, (300, 16)) + 1j*np.random.normal(1, 2, (300, 16))
+        shots  += 0.5*np.real(shots)*1j # Correlate the quadratures
+        weights = np.random.normal(0, 1, 32)
+        weighted = np.real(shots)*weights[:16] + np.imag(shots)*weights[16:]
+        for covariance in [False, True]:
+            moments = _RunningMoments(16, covariance=covariance)
+            for batch in np.array_split(shots, [1, 50, 51, 200]):
+                moments.update(batch)
+            self.assertEqual(moments.count, 300)
+            self.assertTrue(np.allclose(moments.mean, np.mean(shots, axis=0)))
+            self.assertTrue(np.allclose(moments.var(), np.var(shots, axis=0, ddof=1)))
+            if covariance:
+                expected = np.var(np.cumsum(weighted, axis=1), axis=0, ddof=1)
+            else:
+                # Time points are treated as independent, and no (2T)x(2T) matrix is kept
+                expected = np.cumsum(np.var(weighted, axis=0, ddof=1))
+                self.assertIsNone(moments.m2)
+            self.assertTrue(np.allclose(moments.integrated_var(weights), expected))
+
+    def test_incremental(self):
+        gnd, ex = generate_fake_data(3, np.pi/5, 1.6, N=2000)
+        records = np.empty((gnd.shape[0], 2*gnd.shape[1]), dtype=np.complex128)
+        records[:, ::2]  = gnd
+        records[:, 1::2] = ex
+        results = []
+        for incremental in [False, True]:
+            ss = SSM(incremental=incremental)
+            ss.optimal_integration_time.value = True # Keeps the correlations between time points
+            ss.record_length, ss.num_averages, ss.num_segments = gnd.shape[0], gnd.shape[1], 2
+            ss.final_init()
+            for chunk in np.array_split(records.flatten(order='F'), 37):
+                ss.process_data(chunk)
+            results.append(ss)
+        self.assertTrue(np.allclose(results[0].kernel, results[1].kernel))
+        self.assertAlmostEqual(results[0].pdf_data["Max I Fidelity"], results[1].pdf_data["Max I Fidelity"], delta=0.02)
+        self.assertEqual(results[1].ground_moments.count, 0)
+        self.assertIsNotNone(results[1].ground_moments.m2)
+
+    def test_fast_logistic(self):
+        gnd, ex = generate_fake_data(3, np.pi/5, 1.6, N=1000)
+        ss = SSM(logistic_mode="fast", logistic_components=2, logistic_max_cv_shots=500)
+        ss.ground_data = gnd
+        ss.excited_data = ex
+        ss.compute_filter()
+        features, state = ss.reduced_features()
+        self.assertEqual(features.shape, (2000, 4))
+        self.assertEqual(len(ss._stratified_subsample(state)), 500)
+
+        # The basis and regularization are kept from the first point on
+        reduction = ss._reduction
+        for _ in range(2):
+            ss.compute_filter()
+            ss.logistic_fidelity()
+            ss.publish_results()
+            ss.on_done()
+            self.assertIs(ss._reduction, reduction)
+            if ss._logistic_points == 1:
+                model = ss._logistic_model
+        self.assertIs(ss._logistic_model, model)
+        self.assertTrue(np.allclose(ss.reduced_features()[0], features))
+
+        # Results go out with the PDF data
+        results = [ss.pdf_data_queue.get(timeout=10) for _ in range(2)]
+        for res in results:
+            self.assertTrue(0.9 < res["Logistic Fidelity"] <= 1.0)
+
+        # Refit every point when asked to
+        ss.logistic_cv_interval = 1
+        ss.logistic_fidelity()
+        ss.on_done()
+        self.assertIsNot(ss._reduction, reduction)
+        self.assertIsNot(ss._logistic_model, model)
+
 if __name__ == "__main__":
     gnd, ex = generate_fake_data(3, np.pi/5, 1.6, plot=True)
     ss = SSM(save_kernel=False, optimal_integration_time=False, zero_mean=False,
@@ -18,7 +18,9 @@ from auspex.experiment import Experiment
 from auspex.parameter import FloatParameter
 from auspex.stream import DataStream, DataAxis, DataStreamDescriptor, OutputConnector
 from auspex.filters.debug import Print
-from auspex.filters.io import WriteToFile
+from auspex.filters.io import WriteToFile, DataBuffer
+from auspex.sweep import plan_sweep, sweep_path_cost
+from auspex.parameter import ParameterGroup, push_parameters
 from auspex.log import logger
 
 class SweptTestExperiment(Experiment):
@@ -58,6 +60,37 @@ class SweptTestExperiment(Experiment):
         logger.debug("Stream pushed points {}.".format(data_row))
         logger.debug("Stream has filled {} of {} points".format(self.voltage.points_taken, self.voltage.num_points() ))
 
+class PipelinedTestExperiment(Experiment):
+    """Slow to set up and slow to finish each point, records the field in the data."""
+
+    field = FloatParameter(unit="Oe")
+    freq  = FloatParameter(unit="Hz")
+    voltage = OutputConnector()
+
+    def init_instruments(self):
+        def set_field(x):
+            time.sleep(0.02)
+            self.field_set = x
+        self.field.assign_method(set_field)
+        self.freq.assign_method(lambda x: None)
+
+    def init_streams(self):
+        self.voltage.add_axis(DataAxis("trials", list(range(2))))
+
+    def run(self):
+        self.voltage.push(np.array([self.field_set, self.freq.value]))
+
+    def finish_run(self):
+        time.sleep(0.02)
+
+class SlowSource(object):
+    """Takes a while to settle and remembers what it was set to, and when."""
+    def __init__(self, log):
+        self.log = log
+    def set_frequency(self, value):
+        time.sleep(0.05)
+        self.log.append((self, value, time.time()))
+
 class SweepTestCase(unittest.TestCase):
 
     def test_add_sweep(self):
@@ -135,5 +168,125 @@ class SweepTestCase(unittest.TestCase):
         exp.run_sweeps()
         self.assertTrue(pri.sink.input_streams[0].points_taken.value == exp.voltage.num_points())
 
+    def test_pipelined_sweep(self):
+        durations = {}
+        for pipelined in [False, True]:
+            exp = PipelinedTestExperiment()
+            exp.pipelined = pipelined
+            buf = DataBuffer()
+            exp.set_graph([(exp.voltage, buf.sink)])
+            exp.add_sweep(exp.field, np.linspace(0, 10.0, 11))
+            exp.add_sweep(exp.freq, [1.0, 2.0])
+            start = time.time()
+            exp.run_sweeps()
+            durations[pipelined] = time.time() - start
+
+            data, desc = buf.get_data()
+            self.assertTrue(np.allclose(data[:, :, 0], np.linspace(0, 10.0, 11)[None, :]))
+            self.assertTrue(np.allclose(data[:, :, 1], np.array([1.0, 2.0])[:, None]))
+        self.assertLess(durations[True], durations[False] - 0.2)
+
+        # Parameters that can't be pushed during finish_run keep the sweep serial
+        exp = PipelinedTestExperiment()
+        exp.pipelined = True
+        exp.freq.pipeline_safe = False
+        exp.add_sweep(exp.freq, [1.0, 2.0])
+        self.assertFalse(exp.can_pipeline())
+
+    def test_plan_sweep(self):
+        values = [[0, 1, 2], [10, 20]]
+        self.assertEqual(plan_sweep(values, order="raster"),
+                         [(0, 10), (0, 20), (1, 10), (1, 20), (2, 10), (2, 20)])
+        self.assertEqual(plan_sweep(values),
+                         [(0, 10), (0, 20), (1, 20), (1, 10), (2, 10), (2, 20)])
+
+        # A slow outer parameter ends up innermost when it is cheap to move
+        coords = plan_sweep(values, order="cost", move_costs=[1.0, lambda a, b: 100.0])
+        self.assertEqual(sorted(coords), sorted(plan_sweep(values)))
+        self.assertEqual(coords[:3], [(0, 10), (1, 10), (2, 10)])
+        self.assertEqual(sweep_path_cost(coords, [1.0, lambda a, b: 100.0]), 104.0)
+        self.assertRaises(ValueError, plan_sweep, values, order="cost")
+        self.assertRaises(ValueError, plan_sweep, values, order="spiral")
+
+    def test_planned_sweep(self):
+        exp = SweptTestExperiment()
+        buf = DataBuffer()
+        exp.set_graph([(exp.voltage, buf.sink)])
+        pushed = []
+        exp.init_instruments = lambda: (exp.field.assign_method(lambda x: pushed.append(("field", x))),
+                                        exp.freq.assign_method(lambda x: pushed.append(("freq", x))))
+        exp.add_planned_sweep([exp.field, exp.freq], [np.linspace(0, 2, 3), [1.0, 2.0, 3.0]])
+        exp.run_sweeps()
+
+        # Only changed values are pushed, each point once
+        self.assertEqual(len([p for p in pushed if p[0] == "field"]), 3)
+        self.assertEqual(len([p for p in pushed if p[0] == "freq"]), 7)
+        self.assertEqual([p[1] for p in pushed if p[0] == "freq"], [1.0, 2.0, 3.0, 2.0, 1.0, 2.0, 3.0])
+
+        data, desc = buf.get_data()
+        self.assertEqual(data.shape, (9, 5))
+        self.assertTrue(np.allclose(np.array(desc.axes[0].points[:4], dtype=float), [(0, 1), (0, 2), (0, 3), (1, 3)]))
+
+    def test_concurrent_push(self):
+        log = []
+        src1, src2 = SlowSource(log), SlowSource(log)
+        params = [FloatParameter(name=n) for n in ("a", "b", "c")]
+        params[0].assign_method(src1.set_frequency)
+        params[1].assign_method(src2.set_frequency)
+        params[2].assign_method(src1.set_frequency)
+        for p, v in zip(params, [1.0, 2.0, 3.0]):
+            p.value = v
+
+        durations = {}
+        for threads in [0, 4]:
+            config.concurrent_pushes = threads
+            try:
+                del log[:]
+                start = time.time()
+                push_parameters([params[0], ParameterGroup(params[1:])])
+                durations[threads] = time.time() - start
+            finally:
+                config.concurrent_pushes = 0
+            # Pushes to the same instrument stay in order
+            self.assertEqual([v for s, v, t in log if s is src1], [1.0, 3.0])
+            self.assertEqual([v for s, v, t in log if s is src2], [2.0])
+        self.assertGreater(durations[0], 0.15)
+        self.assertLess(durations[4], 0.14)
+
+        # Sweep steps push all changed axes together
+        exp = SweptTestExperiment()
+        exp.set_graph([(exp.voltage, Print().sink)])
+        exp.init_instruments = lambda: None
+        exp.field.assign_method(src1.set_frequency)
+        exp.freq.assign_method(src2.set_frequency)
+        exp.add_sweep(exp.field, [1.0, 2.0])
+        exp.add_sweep(exp.freq, [10.0, 20.0])
+        config.concurrent_pushes = 2
+        try:
+            del log[:]
+            exp.run_sweeps()
+        finally:
+            config.concurrent_pushes = 0
+        self.assertEqual([v for s, v, t in log if s is src1], [1.0, 2.0, 1.0, 2.0])
+        self.assertEqual([v for s, v, t in log if s is src2], [10.0, 20.0])
+        self.assertLess(abs(log[0][2] - log[1][2]), 0.03)
+
+        # Callbacks still see the outer axes applied
+        seen = []
+        exp = SweptTestExperiment()
+        exp.set_graph([(exp.voltage, Print().sink)])
+        exp.init_instruments = lambda: None
+        exp.field.assign_method(src1.set_frequency)
+        exp.freq.assign_method(src2.set_frequency)
+        exp.add_sweep(exp.field, [1.0, 2.0], callback_func=lambda ax, e: seen.append([v for s, v, t in log if s is src2][-1]))
+        exp.add_sweep(exp.freq, [10.0, 20.0])
+        config.concurrent_pushes = 2
+        try:
+            del log[:]
+            exp.run_sweeps()
+        finally:
+            config.concurrent_pushes = 0
+        self.assertEqual(seen, [10.0, 10.0, 20.0, 20.0])
+
 if __name__ == '__main__':
     unittest.main()
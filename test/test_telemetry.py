@@ -0,0 +1,129 @@
+# Copyright 2019 Raytheon BBN Technologies
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+
+import unittest
+import tempfile
+import queue
+import time
+import os
+import urllib.request
+import numpy as np
+
+import auspex.config as config
+config.auspex_dummy_mode = True
+
+from auspex.experiment import Experiment
+from auspex.parameter import FloatParameter
+from auspex.stream import DataAxis, OutputConnector
+from auspex.filters.average import Averager
+from auspex.filters.io import DataBuffer
+from auspex.telemetry import Telemetry, TelemetryCollector
+
+class SweptTestExperiment(Experiment):
+    """Here the run loop merely spews data until it fills up the stream. """
+
+    # Parameters
+    field = FloatParameter(unit="Oe")
+
+    # DataStreams
+    voltage = OutputConnector()
+
+    # Constants
+    samples = 5
+
+    def init_instruments(self):
+        self.field.assign_method(lambda x: None)
+
+    def init_streams(self):
+        self.voltage.add_axis(DataAxis("samples", list(range(self.samples))))
+
+    def __repr__(self):
+        return "<SweptTestExperiment>"
+
+    def run(self):
+        time.sleep(0.002)
+        self.voltage.push(np.random.random(self.samples))
+
+class TelemetryTestCase(unittest.TestCase):
+
+    def test_render(self):
+        q = queue.Queue()
+        tel = Telemetry("a", q, node='avg "1"', type="Averager")
+        tel.inc("filter_messages_in", 3)
+        tel.inc("stream_bytes", 80, labels={'connector': 'source'})
+        tel.set("filter_queue_depth", 2)
+        for v in [2e-4, 2e-3, 20.0]:
+            tel.observe("filter_process_data_seconds", v)
+        tel.publish(force=True)
+
+        collector = TelemetryCollector(q)
+        collector.drain()
+        text = collector.render()
+        self.assertTrue('auspex_filter_messages_in_total{node="avg \\"1\\"",type="Averager"} 3' in text)
+        self.assertTrue('auspex_stream_bytes_total{connector="source",node="avg \\"1\\"",type="Averager"} 80' in text)
+        self.assertTrue('# TYPE auspex_filter_queue_depth gauge' in text)
+        self.assertTrue('auspex_filter_process_data_seconds_bucket{node="avg \\"1\\"",type="Averager",le="0.001"} 1' in text)
+        self.assertTrue('auspex_filter_process_data_seconds_bucket{node="avg \\"1\\"",type="Averager",le="+Inf"} 3' in text)
+        self.assertTrue('auspex_filter_process_data_seconds_count{node="avg \\"1\\"",type="Averager"} 3' in text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+        # Later snapshots from the same source replace earlier ones
+        tel.inc("filter_messages_in", 1)
+        tel.publish(force=True)
+        collector.drain()
+        self.assertTrue('auspex_filter_messages_in_total{node="avg \\"1\\"",type="Averager"} 4' in collector.render())
+
+    def test_http(self):
+        q = queue.Queue()
+        Telemetry("a", q, node="exp").publish(force=True)
+        collector = TelemetryCollector(q, port=0)
+        collector.start()
+        try:
+            time.sleep(0.2)
+            url = "http://127.0.0.1:{}/metrics".format(collector.server.server_address[1])
+            with urllib.request.urlopen(url) as response:
+                self.assertTrue(response.headers['Content-Type'].startswith("application/openmetrics-text"))
+                self.assertEqual(response.read().decode(), "# EOF\n")
+        finally:
+            collector.stop()
+
+    def run_experiment(self, pipelined=False):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "metrics.txt")
+            config.telemetry_file = filename
+            try:
+                exp = SweptTestExperiment()
+                exp.pipelined = pipelined
+                avg = Averager("samples", name="avg")
+                db  = DataBuffer(name="db")
+                exp.set_graph([(exp.voltage, avg.sink), (avg.source, db.sink)])
+                exp.add_sweep(exp.field, np.linspace(0, 100.0, 20))
+                exp.run_sweeps()
+            finally:
+                config.telemetry_file = None
+
+            with open(filename) as f:
+                return f.read()
+
+    def test_experiment(self):
+        text = self.run_experiment()
+        self.assertTrue('auspex_sweep_points_total{node="experiment",type="SweptTestExperiment"} 20' in text)
+        self.assertTrue('auspex_sweep_point_seconds_count{node="experiment",phase="run",type="SweptTestExperiment"} 20' in text)
+        self.assertTrue('auspex_sweep_point_seconds_count{node="experiment",phase="finish",type="SweptTestExperiment"} 20' in text)
+        self.assertTrue('auspex_stream_messages_total{connector="voltage",node="experiment",type="SweptTestExperiment"} 20' in text)
+        self.assertTrue('auspex_filter_process_data_seconds_count{node="avg",type="Averager"}' in text)
+        self.assertTrue('auspex_filter_bytes_in_total{node="db",type="DataBuffer"} 160' in text)
+        self.assertTrue('auspex_filter_memory_rss_bytes{node="avg",type="Averager"}' in text)
+
+        # Pipelined sweeps time the same phases
+        text = self.run_experiment(pipelined=True)
+        for phase in ["update", "run", "finish"]:
+            self.assertTrue('auspex_sweep_point_seconds_count{{node="experiment",phase="{}",type="SweptTestExperiment"}} 20'.format(phase) in text)
+
+if __name__ == '__main__':
+    unittest.main()
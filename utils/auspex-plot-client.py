@@ -16,9 +16,13 @@ import time
 import random
 import json
 import ctypes
+import argparse
+import platform
 
 single_window = False
 plot_windows  = []
+max_frame_rate = 20 # Plots are rendered at most this many times per second
+server_host   = "localhost" # Where the auspex-plot-server runs, set with --host
 
 import logging
 logger = logging.getLogger('auspex_plot_client')
@@ -43,19 +47,57 @@ progversion = "0.5"
 
 import zmq
 
+# Optional decompression of plot payloads
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def decode(md, data):
+    """Rebuild an array sent by a plotter: decompress it, then put back any unfilled (NaN) regions."""
+    compression = md.get('compression')
+    if compression == "lz4":
+        if lz4 is None:
+            raise RuntimeError("Plot data is lz4 compressed but the lz4 package is not installed.")
+        data = lz4.frame.decompress(data)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Plot data is zstd compressed but the zstandard package is not installed.")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    A = np.frombuffer(data, dtype=md['dtype'])
+    if 'runs' in md:
+        full = np.full(int(np.prod(md['shape'])), np.nan, dtype=A.dtype)
+        idx  = 0
+        for start, stop in md['runs']:
+            full[start:stop] = A[idx:idx+stop-start]
+            idx += stop - start
+        A = full
+    return A
+
 class DataListener(QtCore.QObject):
 
     message  = QtCore.pyqtSignal(tuple)
+    patch    = QtCore.pyqtSignal(tuple)
     finished = QtCore.pyqtSignal()
 
-    def __init__(self, host, uuid, port=7772):
+    def __init__(self, host, uuid, plot_names, port=7772):
         QtCore.QObject.__init__(self)
 
         self.uuid = uuid
         self.context = zmq.Context()
         self.socket = self.context.socket(zmq.SUB)
         self.socket.connect("tcp://{}:{}".format(host, port))
-        self.socket.setsockopt_string(zmq.SUBSCRIBE, uuid)
+        # The server publishes each plot under its own uuid/name/ topic. Its latest
+        # frames are replayed to us alone under a replay/token/ topic of our own.
+        token = os.urandom(8).hex()
+        for name in plot_names:
+            self.socket.setsockopt_string(zmq.SUBSCRIBE, f"replay/{token}/{uuid}/{name}/")
+            self.socket.setsockopt_string(zmq.SUBSCRIBE, f"{uuid}/{name}/")
+        self.plots_running = set(plot_names)
         self.poller = zmq.Poller()
         self.poller.register(self.socket, zmq.POLLIN)
         self.running = True
@@ -64,23 +106,31 @@ class DataListener(QtCore.QObject):
         while self.running:
             socks = dict(self.poller.poll(1000))
             if socks.get(self.socket) == zmq.POLLIN:
-                msg = self.socket.recv_multipart()
+                msg = self.socket.recv_multipart()[1:] # Drop the topic
                 msg_type = msg[1].decode()
                 uuid     = msg[0].decode()
                 name     = msg[2].decode()
                 if msg_type == "done":
-                    self.finished.emit()
-                    logger.debug(f"Data listener thread for {self.uuid} got done message.")
-                elif msg_type == "data":
+                    logger.debug(f"Data listener thread for {self.uuid} got done message for {name}.")
+                    self.plots_running.discard(name)
+                    if not self.plots_running:
+                        self.finished.emit()
+                elif msg_type in ("data", "patch"):
                     result = [name, uuid]
                     # How many pairs of metadata and data are there?
                     num_arrays = int((len(msg) - 3)/2)
-                    for i in range(num_arrays):
-                        md, data = msg[3+2*i:5+2*i]
-                        md = json.loads(md.decode())
-                        A = np.frombuffer(data, dtype=md['dtype'])
-                        result.append(A)
-                    self.message.emit(tuple(result))
+                    try:
+                        for i in range(num_arrays):
+                            md, data = msg[3+2*i:5+2*i]
+                            md = json.loads(md.decode())
+                            result.append(decode(md, data))
+                    except Exception as e:
+                        logger.error(f"Could not decode plot data for {name}: {e}")
+                        continue
+                    if msg_type == "patch":
+                        self.patch.emit(tuple(result))
+                    else:
+                        self.message.emit(tuple(result))
         self.socket.close()
         self.context.term()
         logger.debug(f"Data listener thread for {self.uuid} exiting.")
@@ -96,7 +146,7 @@ class DescListener(QtCore.QObject):
 
         self.context = zmq.Context()
         self.socket = self.context.socket(zmq.DEALER)
-        self.socket.identity = "Matplotlib_Qt_Client".encode()
+        self.socket.identity = f"Matplotlib_Qt_Client_{platform.node()}_{os.getpid()}".encode()
         self.socket.connect("tcp://{}:{}".format(host, port))
         self.socket.send_multipart([b"new_client"])
         self.socket.setsockopt(zmq.LINGER, 0)
@@ -120,11 +170,16 @@ class DescListener(QtCore.QObject):
                         self.first_plot.emit()
                     self.new_plot.emit(tuple([uuid, desc]))
         logger.debug("Desc listener at end")
+        self.socket.send_multipart([b"bye"])
         self.socket.close()
         self.context.term()
 
 class MplCanvas(FigureCanvas):
-    """Ultimately, this is a QWidget (as well as a FigureCanvasAgg, etc.)."""
+    """Ultimately, this is a QWidget (as well as a FigureCanvasAgg, etc.).
+
+    Incoming data only updates the canvas state and marks it stale. The window calls `render_frame`
+    at a capped frame rate, which redraws the figure when the axes change and otherwise just
+    blits the animated artists over a cached background."""
 
     def __init__(self, parent=None, width=5, height=4, dpi=100, plot_mode="quad"):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -173,27 +228,152 @@ class MplCanvas(FigureCanvas):
                                    QtWidgets.QSizePolicy.Expanding,
                                    QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
+        self.init_rendering()
 
     def compute_initial_figure(self):
         pass
 
+    def init_rendering(self):
+        self.stale_frame  = False
+        self.full_redraw  = True
+        self.backgrounds  = None
+        self.mpl_connect('draw_event', self.on_draw)
+
+    def mark_stale(self, full_redraw=False):
+        """Note that there is new data to render, and whether the axes themselves have to be redrawn."""
+        self.stale_frame = True
+        self.full_redraw = self.full_redraw or full_redraw
+
+    def draw_frame(self):
+        """Move the latest data into the artists. Returns True if the axes need a full redraw."""
+        return True
+
+    def render_frame(self):
+        """Render any new data, returning whether there was some."""
+        if not self.stale_frame:
+            return False
+        self.stale_frame = False
+        full_redraw = self.draw_frame() or self.full_redraw
+        animated = [p for p in self.plots if p.get_animated()]
+        if full_redraw or self.backgrounds is None or not animated:
+            self.full_redraw = False
+            self.draw()
+        else:
+            for ax, background in zip(self.axes, self.backgrounds):
+                self.restore_region(background)
+                for p in animated:
+                    if p.axes is ax:
+                        ax.draw_artist(p)
+                self.blit(ax.bbox)
+        self.flush_events()
+        return True
+
+    def print_figure(self, *args, **kwargs):
+        # Saving the figure is a normal draw, which would leave out the animated artists
+        animated = [p for p in self.plots if p.get_animated()]
+        for p in animated:
+            p.set_animated(False)
+        try:
+            super(MplCanvas, self).print_figure(*args, **kwargs)
+        finally:
+            for p in animated:
+                p.set_animated(True)
+
+    def on_draw(self, event):
+        # Animated artists are left out of a normal draw, so cache what is behind them and draw them on top
+        self.backgrounds = [self.copy_from_bbox(ax.bbox) for ax in self.axes]
+        for p in self.plots:
+            if p.get_animated():
+                p.axes.draw_artist(p)
+
+    def report_lod(self, callback, x_extent=None, y_extent=None):
+        """Call `callback` with the pixel budget and zoomed view whenever the plot is resized or zoomed,
+        so that the plotter can decimate what it sends. Ranges covering the full extent are reported as None."""
+        self.lod_callback = callback
+        self.lod_extents  = (x_extent, y_extent)
+        self.last_lod     = None
+        for ax in self.axes:
+            ax.callbacks.connect('xlim_changed', self.view_changed)
+            ax.callbacks.connect('ylim_changed', self.view_changed)
+        self.mpl_connect('resize_event', lambda evt: self.view_changed(self.axes[0]))
+        self.view_changed(self.axes[0])
+
+    def view_changed(self, ax):
+        def zoomed(limits, extent):
+            if extent is None:
+                return None
+            lo, hi = min(limits), max(limits)
+            tol = 1e-9*abs(extent[1] - extent[0])
+            if lo <= extent[0] + tol and hi >= extent[1] - tol:
+                return None
+            return [float(lo), float(hi)]
+
+        lod = {'x_pixels': max(int(ax.bbox.width), 1),
+               'y_pixels': max(int(ax.bbox.height), 1),
+               'x_range':  zoomed(ax.get_xlim(), self.lod_extents[0]),
+               'y_range':  zoomed(ax.get_ylim(), self.lod_extents[1])}
+        if lod != self.last_lod:
+            self.last_lod = lod
+            self.lod_callback(lod)
+
 class Canvas1D(MplCanvas):
     def compute_initial_figure(self):
         for ax in self.axes:
-            plt, = ax.plot([0,0,0])
+            plt, = ax.plot([0,0,0], animated=True)
             ax.ticklabel_format(style='sci', axis='x', scilimits=(-3,3))
             ax.ticklabel_format(style='sci', axis='y', scilimits=(-3,3))
             self.plots.append(plt)
 
     def update_figure(self, data):
         x_data, y_data = data
+        # Keep a writable copy of the keyframe for subsequent patches
+        self.frame = [np.array(x_data), np.array(y_data)]
+        # Fit the view tightly to complete frames. Partial ones only grow it, so that it does not
+        # shrink and regrow as each new frame fills in.
+        self.refit = not np.any(np.isnan(self.frame[1]))
+        self.mark_stale()
+
+    def patch_figure(self, data):
+        offset, x_data, y_data = data
+        offset = int(offset[0])
+        if self.frame is None or offset + len(y_data) > len(self.frame[1]):
+            return # Wait for the next keyframe
+        self.frame[0][offset:offset+len(x_data)] = x_data
+        self.frame[1][offset:offset+len(y_data)] = y_data
+        self.mark_stale()
+
+    def fit_view(self, ax, x_data, y_data):
+        """Grow the view limits to contain the data, with headroom on y so that a slowly growing trace
+        does not force a full redraw on every frame. For complete frames the limits may also shrink.
+        Axes the user zoomed or panned are left alone. Returns True if the limits changed."""
+        if not ax.get_autoscale_on():
+            return False
+        finite = np.isfinite(y_data)
+        if not np.any(finite):
+            return False
+        # The x values of the whole frame are known up front, even where there is no data yet
+        x_lo, x_hi = np.nanmin(x_data), np.nanmax(x_data)
+        y_lo, y_hi = np.min(y_data[finite]), np.max(y_data[finite])
+        (xl, xh), (yl, yh) = ax.get_xlim(), ax.get_ylim()
+        if not (self.refit or x_lo < xl or x_hi > xh or y_lo < yl or y_hi > yh):
+            return False
+        pad = 0.1*(y_hi - y_lo) if y_hi > y_lo else 0.1*abs(y_hi) + 1e-12
+        if x_hi > x_lo:
+            ax.set_xlim(x_lo, x_hi, auto=None)
+        ax.set_ylim(y_lo - pad, y_hi + pad, auto=None)
+        return True
+
+    def draw_frame(self):
+        if self.frame is None:
+            return True
+        x_data, y_data = self.frame
+        full_redraw = False
         for plt, ax, f in zip(self.plots, self.axes, self.plot_funcs):
-            plt.set_xdata(x_data)
-            plt.set_ydata(f(y_data))
-            ax.relim()
-            ax.autoscale_view()
-            self.draw()
-            self.flush_events()
+            values = f(y_data)
+            plt.set_data(x_data, values)
+            full_redraw = self.fit_view(ax, x_data, values) or full_redraw
+        self.refit = False
+        return full_redraw
 
     def set_desc(self, desc):
         for ax, name in zip(self.axes, self.func_names):
@@ -201,15 +381,19 @@ class Canvas1D(MplCanvas):
                 ax.set_xlabel(desc['x_label'])
             if 'y_label' in desc.keys():
                 ax.set_ylabel(name + " " + desc['y_label'])
+            ax.set_xlim(desc['x_min'], desc['x_max'], auto=None)
         for plt in self.plots:
             plt.set_xdata(np.linspace(desc['x_min'], desc['x_max'], desc['x_len']))
             plt.set_ydata(np.nan*np.linspace(desc['x_min'], desc['x_max'], desc['x_len']))
+        self.frame = None
+        self.refit = True
         self.fig.tight_layout()
 
 class CanvasManual(MplCanvas):
     def __init__(self, parent=None, width=5, height=4, dpi=100, numplots=1):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
         self.axes = []
+        self.plots = []
         for n in range(numplots):
             self.axes += [self.fig.add_subplot(100+10*(numplots)+n+1)]
             self.axes[n].ticklabel_format(style='sci', axis='x', scilimits=(-3,3))
@@ -223,6 +407,7 @@ class CanvasManual(MplCanvas):
                                    QtWidgets.QSizePolicy.Expanding,
                                    QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
+        self.init_rendering()
 
     def compute_initial_figure(self):
         pass
@@ -235,8 +420,7 @@ class CanvasManual(MplCanvas):
         curr_axis.autoscale_view()
         if len(self.traces)>1:
             curr_axis.legend()
-        self.draw()
-        self.flush_events()
+        self.mark_stale(full_redraw=True)
 
     def set_desc(self, desc):
         for k, ax in enumerate(self.axes):
@@ -261,17 +445,44 @@ class Canvas2D(MplCanvas):
     def update_figure(self, data):
         x_data, y_data, im_data = data
         im_data = im_data.reshape((len(y_data), len(x_data)), order='c')
+        # Keep a writable copy of the keyframe for subsequent patches
+        self.frame = [x_data, y_data, np.array(im_data)]
+        self.mark_stale()
+
+    def patch_figure(self, data):
+        offset, im_data = data
+        offset = int(offset[0])
+        if self.frame is None or im_data.size % self.frame[2].shape[1] != 0:
+            return # Wait for the next keyframe
+        rows = im_data.reshape((-1, self.frame[2].shape[1]), order='c')
+        if offset + rows.shape[0] > self.frame[2].shape[0]:
+            return
+        self.frame[2][offset:offset+rows.shape[0]] = rows
+        self.mark_stale()
+
+    def draw_frame(self):
+        if self.frame is None:
+            return True
+        x_data, y_data, im_data = self.frame
+        full_redraw = False
+        # Decimated or zoomed updates only cover part of the full extent
+        if len(x_data) > 1 and len(y_data) > 1:
+            extent = (x_data[0], x_data[-1], y_data[0], y_data[-1])
+            full_redraw = not np.allclose(extent, self.plots[0].get_extent())
         for plt, f in zip(self.plots, self.plot_funcs):
+            # Update the image artists in place; only the color scale follows the data
             plt.set_data(f(im_data))
+            if full_redraw:
+                plt.set_extent(extent)
             plt.autoscale()
-        self.draw()
-        self.flush_events()
+        return full_redraw
 
     def set_desc(self, desc):
         self.aspect = (desc['x_max']-desc['x_min'])/(desc['y_max']-desc['y_min'])
         self.extent = (desc['x_min'], desc['x_max'], desc['y_min'], desc['y_max'])
         self.xlen = desc['x_len']
         self.ylen = desc['y_len']
+        self.frame = None
         self.plots = []
         for ax in self.axes:
             ax.clear()
@@ -286,27 +497,40 @@ class Canvas2D(MplCanvas):
             if 'y_label' in desc.keys():
                 ax.set_ylabel(name + " " + desc['y_label'])
         self.fig.tight_layout()
+        self.mark_stale(full_redraw=True)
 
 class CanvasMesh(MplCanvas):
     def compute_initial_figure(self):
         # data = np.array([[0,0,0],[0,1,0],[1,1,0],[1,0,0]])
         # self.update_figure(np.array(data))
-        pass
+        self.mesh  = None
+        self.frame = None
 
     def update_figure(self, data):
         # Expected xs, ys, zs coming in as
         # data = np.array([xs, ys, zs]).transpose()
-        data = data.reshape((-1, 3), order='c')
-        points = data[:,0:2]
-        mesh = self.scaled_Delaunay(points)
-        xs   = mesh.points[:,0]
-        ys   = mesh.points[:,1]
+        # Only the latest set of points matters, intermediate ones are never triangulated.
+        self.frame = data.reshape((-1, 3), order='c')
+        self.mark_stale(full_redraw=True)
+
+    def draw_frame(self):
+        if self.frame is None:
+            return True
+        data   = self.frame
+        points = np.real(data[:,0:2])
+        try:
+            mesh = self.scaled_Delaunay(points)
+        except Exception as e:
+            logger.debug(f"Could not triangulate {len(points)} points: {e}")
+            self.mesh = None
+            return True
+        for plt in self.plots:
+            plt.remove()
+        self.plots = []
         for ax, f in zip(self.axes, self.plot_funcs):
-            ax.clear()
-            ax.tripcolor(xs, ys, mesh.simplices, f(data[:,2]), cmap="RdGy", shading="flat")
+            self.plots.append(ax.tripcolor(points[:,0], points[:,1], mesh.simplices, f(data[:,2]), cmap="RdGy", shading="flat"))
             ax.autoscale()
-        self.draw()
-        self.flush_events()
+        return True
 
     def set_desc(self, desc):
 
@@ -321,21 +545,26 @@ class CanvasMesh(MplCanvas):
         self.fig.tight_layout()
 
     def scaled_Delaunay(self, points):
-        """ Return a scaled Delaunay mesh and scale factors """
-        scale_factors = []
-        points = np.array(points)
-        for i in range(points.shape[1]):
-            scale_factors.append(1.0/np.mean(points[:,i]))
-            points[:,i] = points[:,i]*scale_factors[-1]
-        mesh = Delaunay(points)
-        for i in range(points.shape[1]):
-            mesh.points[:,i] = mesh.points[:,i]/scale_factors[i]
-        return mesh
+        """ Return a Delaunay mesh of the points, triangulated with each axis scaled to unit range.
+        Refined meshes only ever add points, so when the previous points are a prefix of the new ones
+        the new points are inserted into the existing mesh instead of retriangulating everything. """
+        num_old = 0 if self.mesh is None else len(self.mesh_points)
+        if self.mesh is not None and len(points) >= num_old and np.array_equal(points[:num_old], self.mesh_points):
+            if len(points) > num_old:
+                self.mesh.add_points(points[num_old:]*self.scale_factors)
+        else:
+            span = np.ptp(points, axis=0)
+            span[span == 0] = 1.0
+            self.scale_factors = 1.0/span
+            self.mesh = Delaunay(points*self.scale_factors, incremental=True)
+        self.mesh_points = points.copy()
+        return self.mesh
 
 class MatplotClientWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, host=None):
         global single_window
         QtWidgets.QMainWindow.__init__(self)
+        self.host = host if host is not None else server_host
         self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
         self.setWindowTitle("Auspex Plotting")
 
@@ -366,23 +595,55 @@ class MatplotClientWindow(QtWidgets.QMainWindow):
         self.uuid = None
         self.data_listener_thread = None
 
+        # Level of detail requests go back to the plotters through the server's descriptor port
+        self.lod_socket = self.context.socket(zmq.DEALER)
+        self.lod_socket.setsockopt(zmq.LINGER, 0)
+        self.lod_socket.connect("tcp://{}:7771".format(self.host))
+
+        # Messages only update the canvases, which are rendered at a capped frame rate
+        self.canvas_by_name = {}
+        self.render_timer = QtCore.QTimer(self)
+        self.render_timer.timeout.connect(self.render_plots)
+        self.render_timer.start(int(1000/max_frame_rate))
+
+    def render_plots(self):
+        """Render the visible canvas if it has new data. Hidden tabs catch up when they are shown."""
+        if self.canvas_by_name:
+            canvas = self.tabs.currentWidget()
+            start  = time.perf_counter()
+            if canvas.render_frame() and canvas in self.acked_canvases:
+                # Let the plotter know what rendering costs so it can pace its updates
+                name = self.tabs.tabText(self.tabs.currentIndex())
+                self.send_to_plotter(b"ack", name, {'render_time': time.perf_counter() - start})
+
+    def send_to_plotter(self, msg, name, contents):
+        if self.uuid is not None:
+            self.lod_socket.send_multipart([msg, self.uuid.encode(), name.encode(), json.dumps(contents).encode('utf8')])
+
+    def send_lod(self, name, lod):
+        self.send_to_plotter(b"lod", name, lod)
+
     def toggleAutoClose(self, state):
         global single_window
         single_window = state
 
-    def listen_for_data(self, uuid, address="localhost", data_port=7772):
+    def listen_for_data(self, uuid, address=None, data_port=7772):
+        if address is None:
+            address = self.host
         self.uuid = uuid
         self.data_listener_thread = QtCore.QThread()
-        self.Datalistener = DataListener(address, uuid, data_port)
+        self.Datalistener = DataListener(address, uuid, list(self.canvas_by_name.keys()), data_port)
         self.Datalistener.moveToThread(self.data_listener_thread)
         self.data_listener_thread.started.connect(self.Datalistener.loop)
         self.Datalistener.message.connect(self.data_signal_received)
+        self.Datalistener.patch.connect(self.patch_signal_received)
         self.Datalistener.finished.connect(self.stop_listening)
         QtCore.QTimer.singleShot(0, self.data_listener_thread.start)
 
     def construct_plots(self, plot_desc):
         self.toolbars = []
         self.canvas_by_name = {}
+        self.acked_canvases = []
 
         # Purge everything in the layout
         for i in reversed(range(self.layout.count())):
@@ -405,6 +666,10 @@ class MatplotClientWindow(QtWidgets.QMainWindow):
             nav    = NavigationToolbar(canvas, self)
 
             canvas.set_desc(desc)
+            if desc['plot_type'] == "standard":
+                y_extent = (desc['y_min'], desc['y_max']) if desc['plot_dims'] == 2 else None
+                canvas.report_lod(lambda lod, name=name: self.send_lod(name, lod), (desc['x_min'], desc['x_max']), y_extent)
+                self.acked_canvases.append(canvas)
             self.toolbars.append(nav)
             self.tabs.addTab(canvas, name)
             self.layout.addWidget(nav)
@@ -433,7 +698,19 @@ class MatplotClientWindow(QtWidgets.QMainWindow):
             except Exception as e:
                 self.statusBar().showMessage("Exception while plotting {}. Length of data: {}".format(e, len(data)), 1000)
 
+    def patch_signal_received(self, message):
+        plot_name = message[0]
+        uuid      = message[1]
+        data      = message[2:]
+        if uuid == self.uuid and plot_name in self.canvas_by_name:
+            try:
+                self.canvas_by_name[plot_name].patch_figure(data)
+            except Exception as e:
+                self.statusBar().showMessage("Exception while patching {}. Length of data: {}".format(e, len(data)), 1000)
+
     def switch_toolbar(self):
+        if self.canvas_by_name:
+            self.tabs.currentWidget().mark_stale(full_redraw=True)
         if len(self.toolbars) > 0:
             for toolbar in self.toolbars:
                 toolbar.setVisible(False)
@@ -448,6 +725,10 @@ class MatplotClientWindow(QtWidgets.QMainWindow):
         self.close()
 
     def stop_listening(self):
+        self.render_timer.stop()
+        self.render_plots()
+        if not self.lod_socket.closed:
+            self.lod_socket.close()
         if self.data_listener_thread and self.Datalistener.running:
             self.statusBar().showMessage("Disconnecting from server.", 10000)
             self.Datalistener.running = False
@@ -466,6 +747,7 @@ def new_plotter_window(message):
     pw.show()
     pw.setWindowState(pw.windowState() & ~QtCore.Qt.WindowMinimized | QtCore.Qt.WindowActive)
     pw.activateWindow()
+    pw.uuid = uuid
     pw.construct_plots(desc)
     pw.listen_for_data(uuid)
 
@@ -506,7 +788,7 @@ class WaitAndListenWidget(QtWidgets.QWidget):
 
         # Start listener thread
         self.desc_listener_thread = QtCore.QThread()
-        self.Desclistener = DescListener("localhost", 7771  )
+        self.Desclistener = DescListener(server_host, 7771)
         self.Desclistener.moveToThread(self.desc_listener_thread)
         self.desc_listener_thread.started.connect(self.Desclistener.loop)
         self.Desclistener.new_plot.connect(new_plotter_window)
@@ -527,7 +809,12 @@ class WaitAndListenWidget(QtWidgets.QWidget):
         self.hide()
 
 if __name__ == '__main__':
-    qApp = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Show the plots of auspex experiments.")
+    parser.add_argument("--host", default="localhost", help="host running the auspex-plot-server")
+    args, qt_args = parser.parse_known_args()
+    server_host = args.host
+
+    qApp = QtWidgets.QApplication([sys.argv[0]] + qt_args)
 
     # Setup icon
     png_path = os.path.join(os.path.dirname(__file__), "../src/auspex/assets/plotter_icon.png")
@@ -5,6 +5,7 @@ import zmq
 import os, os.path
 import sys
 import subprocess
+from collections import OrderedDict
 
 
 client_desc_port = 7771
@@ -14,12 +15,74 @@ auspex_data_port = 7762
 
 launch_client = False
 
+# Bounds on the replay cache
+max_cached_runs    = 8   # Most recent auspex runs whose plots are kept
+max_cached_patches = 256 # Patches kept on top of the latest keyframe of each plot
+
+# Clients subscribe to replay/<token>/<plot topic> to get the cached frames of a plot
+# under that topic, which is private to them, rather than on the plot's shared topic.
+replay_prefix = b"replay/"
+
+def topic(uid, name):
+    """Data is published under uid/plot/ so that clients can subscribe to individual plots.
+    Traces of manual plots (named plot:trace) share their plot's topic."""
+    return uid + b"/" + name.split(b":")[0] + b"/"
+
+class PlotCache(object):
+    """Latest state of every plot in the most recent runs, replayed to clients when they subscribe."""
+
+    def __init__(self):
+        self.runs = OrderedDict() # uid -> {'desc': descriptor, 'frames': {name: [messages]}, 'done': set()}
+
+    def add_run(self, uid, plot_desc):
+        self.runs[uid] = {'desc': plot_desc, 'frames': {}, 'done': set()}
+        while len(self.runs) > max_cached_runs:
+            self.runs.popitem(last=False)
+
+    def add_message(self, msg):
+        # msg is [uid, msg type, plot name, metadata, data, ...]
+        uid, msg_type, name = msg[:3]
+        if uid not in self.runs:
+            return
+        run    = self.runs[uid]
+        frames = run['frames'].setdefault(name, [])
+        if msg_type == b"data":
+            frames[:] = [msg]
+        elif msg_type == b"patch":
+            # Patches are only meaningful on top of the keyframe they follow
+            if frames and len(frames) > max_cached_patches:
+                # Without all of its patches the keyframe is out of date, so replay nothing until the next one
+                print(f"Dropping cached frames of plot {name.decode('utf8', 'replace')} after {max_cached_patches} patches, "
+                      "it will not be replayed until its next keyframe")
+                frames.clear()
+            elif frames:
+                frames.append(msg)
+        elif msg_type == b"done":
+            frames.append(msg)
+            run['done'].add(name)
+
+    def active(self):
+        """Runs with plots that have not finished, and always the most recent run."""
+        uids = [uid for uid, run in self.runs.items() if len(run['done']) < len(run['desc'])]
+        if self.runs and next(reversed(self.runs)) not in uids:
+            uids.append(next(reversed(self.runs)))
+        return uids
+
+    def replay(self, sub_topic):
+        """Cached messages for the plots matching a subscription."""
+        for uid, run in self.runs.items():
+            for name, frames in run['frames'].items():
+                if topic(uid, name).startswith(sub_topic):
+                    yield from frames
+
 if __name__ == '__main__':
     context = zmq.Context()
     client_desc_sock = context.socket(zmq.ROUTER)
     auspex_desc_sock = context.socket(zmq.ROUTER)
-    client_data_sock = context.socket(zmq.PUB)
+    client_data_sock = context.socket(zmq.XPUB)
     auspex_data_sock = context.socket(zmq.ROUTER)
+    # Report every subscription, even to topics that already have subscribers, so each new client gets a replay
+    client_data_sock.setsockopt(zmq.XPUB_VERBOSE, 1)
     client_desc_sock.bind("tcp://*:%s" % client_desc_port)
     auspex_desc_sock.bind("tcp://*:%s" % auspex_desc_port)
     client_data_sock.bind("tcp://*:%s" % client_data_port)
@@ -31,55 +94,89 @@ if __name__ == '__main__':
     poller.register(auspex_data_sock, zmq.POLLIN)
 
     # Should be empty by default
-    plot_descriptors = {}
-    uids             = []
-    client_ident     = None
-    
+    cache            = PlotCache()
+    client_idents    = set()
+    plotter_idents   = {} # (uid, plot name) -> identity of the plotter's data socket
+    lod_requests     = {} # (uid, plot name) -> latest level of detail requested by a client
+
     print("Welcome to the Auspex plot server!")
     print("Waiting for auspex to connect on ports 7761/7762")
-    print("Waiting for plot client to connect on ports 7771/7772")
+    print("Waiting for plot clients to connect on ports 7771/7772")
 
     if '--no-launch' in sys.argv[1:]:
         launch_client = False
 
     # Loop and accept messages
     try:
-        while True: 
+        while True:
             try:
                 socks = dict(poller.poll(50))
 
-                # A new client has connected. Send the most recent information:
+                # A new client has connected. Send the descriptors of current runs:
                 if socks.get(client_desc_sock) == zmq.POLLIN:
-                    ident, msg = client_desc_sock.recv_multipart()
-                    if msg == b"new_client":
-                        print(f"Sending plot descriptor for session to client {ident}")
-                        if len(uids) > 0:
-                            client_desc_sock.send_multipart([ident, b"new", uids[-1], json.dumps(plot_descriptors[uids[-1]]).encode('utf8')])
-                        else:
+                    ident, msg, *args = client_desc_sock.recv_multipart()
+                    if msg in (b"lod", b"ack"):
+                        # The client's pixel budget or zoomed view changed, or it reports how long it took
+                        # to render the plot. Pass it along to the plotter.
+                        uid, name, payload = args
+                        if msg == b"lod":
+                            lod_requests[(uid, name)] = payload
+                        if (uid, name) in plotter_idents:
+                            auspex_data_sock.send_multipart([plotter_idents[(uid, name)], msg, payload])
+                    elif msg == b"new_client":
+                        uids = cache.active()
+                        print(f"Sending {len(uids)} plot descriptor(s) to client {ident}")
+                        for uid in uids:
+                            client_desc_sock.send_multipart([ident, b"new", uid, json.dumps(cache.runs[uid]['desc']).encode('utf8')])
+                        if not uids:
                             print("No current plots availiable. Waiting for auspex.")
-                        client_ident = ident
+                        client_idents.add(ident)
+                    elif msg == b"bye":
+                        client_idents.discard(ident)
+
                 # A new auspex data run has started!
                 if socks.get(auspex_desc_sock) == zmq.POLLIN:
                     msg = auspex_desc_sock.recv_multipart()
                     ident, uid, plot_desc = msg
-                    uids.append(uid)
-                    plot_descriptors[uid] = json.loads(plot_desc)
+                    cache.add_run(uid, json.loads(plot_desc))
+                    for key in [k for k in plotter_idents if k[0] not in cache.runs]:
+                        plotter_idents.pop(key)
+                    for key in [k for k in lod_requests if k[0] not in cache.runs]:
+                        lod_requests.pop(key)
                     print(f"Received auspex plot descriptor for new plotter {uid} from {ident}")
                     auspex_desc_sock.send_multipart([ident, b"ACK"])
-                    
+
                     # Contact any connected clients and tell them to make a new plotter
-                    client_desc_sock.send_multipart([client_ident, b"new", uid, json.dumps(plot_descriptors[uid]).encode('utf8')])
+                    for client_ident in client_idents:
+                        client_desc_sock.send_multipart([client_ident, b"new", uid, plot_desc])
 
                     if launch_client:
                         client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),"auspex-plot-client.py")
                         preexec_fn  = os.setsid if hasattr(os, 'setsid') else None
-                        subprocess.Popen(['python', client_path, 'localhost'], env=os.environ.copy(), preexec_fn=preexec_fn)
+                        subprocess.Popen(['python', client_path, '--host', 'localhost'], env=os.environ.copy(), preexec_fn=preexec_fn)
+
+                # A client subscribed to a plot, bring it (and only it) up to date with the cached frames
+                if socks.get(client_data_sock) == zmq.POLLIN:
+                    sub = client_data_sock.recv()
+                    if sub[:1] == b"\x01" and sub[1:].startswith(replay_prefix):
+                        private_topic = sub[1:]
+                        token, _, sub_topic = private_topic[len(replay_prefix):].partition(b"/")
+                        for msg in cache.replay(sub_topic):
+                            client_data_sock.send_multipart([private_topic] + msg)
 
                 if socks.get(auspex_data_sock) == zmq.POLLIN:
                     # The expected data order is [uid, msg, plot name, json.dumps(metadata), np.ascontiguousarray(dat)]
-                    # We assume that this is true and merely pass along the message
+                    # We assume that this is true and merely pass along the message under the plot's topic
                     msg = auspex_data_sock.recv_multipart()
-                    client_data_sock.send_multipart(msg[1:])
+                    client_data_sock.send_multipart([topic(msg[1], msg[3])] + msg[1:])
+                    cache.add_message(msg[1:])
+
+                    # Remember who sent this so the client's level of detail requests can be routed back
+                    key = (msg[1], msg[3])
+                    if key not in plotter_idents:
+                        plotter_idents[key] = msg[0]
+                        if key in lod_requests:
+                            auspex_data_sock.send_multipart([msg[0], b"lod", lod_requests[key]])
             except Exception as e:
                 print("Plot server generated exception", e)
 
@@ -91,4 +188,4 @@ if __name__ == '__main__':
         auspex_desc_sock.close()
         client_data_sock.close()
         auspex_data_sock.close()
-        context.term()
\ No newline at end of file
+        context.term()
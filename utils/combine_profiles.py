@@ -1,10 +1,26 @@
 import pstats
 import glob
+from collections import Counter
 
-s = pstats.Stats()
+# cProfile output
+if glob.glob('*.prof'):
+	s = pstats.Stats()
 
-for fname in glob.glob('*.prof'):
-	s.add(fname)
-	# print(fname)
+	for fname in glob.glob('*.prof'):
+		s.add(fname)
+		# print(fname)
 
-s.dump_stats("combined.prof")
\ No newline at end of file
+	s.dump_stats("combined.prof")
+
+# Sampling profiler output, as collapsed stacks
+stacks = Counter()
+for fname in glob.glob('prof-*.collapsed'):
+	with open(fname) as f:
+		for line in f:
+			stack, count = line.rstrip("\n").rsplit(" ", 1)
+			stacks[stack] += int(count)
+
+if stacks:
+	with open("combined.collapsed", "w") as f:
+		for stack, count in stacks.most_common():
+			f.write("{} {}\n".format(stack, count))